@@ -11,6 +11,11 @@ This module defines the non autogenerated classes used as input/output for
 plugin operations. These are used instead of protobuf generated classes to
 hide the implemenatation details for protobufs and also to provide the
 correct types.
+
+The protobuf form of these objects is built on the first call to to_proto()
+and cached, since the library wrappers convert the same connection on every
+call. The returned protobuf messages are shared and must not be modified;
+copy them with CopyFrom instead.
 """
 
 __all__ = [
@@ -51,6 +56,9 @@ class RemoteConnection(object):
                 type(user),
                 RemoteUser)
 
+        self.__proto = None
+        self.__proto_parts = None
+
     @property
     def environment(self):
         return self.__environment
@@ -60,16 +68,28 @@ class RemoteConnection(object):
         return self.__user
 
     def to_proto(self):
-        """Converts plugin class RemoteConnection to protobuf class common_pb2.RemoteConnection
+        """Converts plugin class RemoteConnection to
+        protobuf class common_pb2.RemoteConnection
         """
-        remote_connection = common_pb2.RemoteConnection()
-        remote_connection.environment.CopyFrom(self.environment.to_proto())
-        remote_connection.user.CopyFrom(self.user.to_proto())
-        return remote_connection
+        environment = self.environment.to_proto()
+        user = self.user.to_proto()
+        #
+        # The environment's host can be replaced, in which case the
+        # environment builds a new message and this one has to be rebuilt.
+        #
+        if (self.__proto is None or self.__proto_parts[0] is not environment
+                or self.__proto_parts[1] is not user):
+            remote_connection = common_pb2.RemoteConnection()
+            remote_connection.environment.CopyFrom(environment)
+            remote_connection.user.CopyFrom(user)
+            self.__proto = remote_connection
+            self.__proto_parts = (environment, user)
+        return self.__proto
 
     @staticmethod
     def from_proto(connection):
-        """Converts protobuf class common_pb2.RemoteConnection to plugin class RemoteConnection
+        """Converts protobuf class common_pb2.RemoteConnection to
+        plugin class RemoteConnection
         """
         if not isinstance(connection, common_pb2.RemoteConnection):
             raise IncorrectTypeError(
@@ -110,15 +130,8 @@ class RemoteEnvironment(object):
                 type(reference),
                 basestring)
         self.__reference = reference
-
-        if isinstance(host, RemoteHost):
-            self.host = host
-        else:
-            raise IncorrectTypeError(
-                RemoteEnvironment,
-                'host',
-                type(host),
-                RemoteHost)
+        self.__proto = None
+        self.host = host
 
     @property
     def name(self):
@@ -128,18 +141,37 @@ class RemoteEnvironment(object):
     def reference(self):
         return self.__reference
 
+    @property
+    def host(self):
+        return self.__host
+
+    @host.setter
+    def host(self, host):
+        if not isinstance(host, RemoteHost):
+            raise IncorrectTypeError(
+                RemoteEnvironment,
+                'host',
+                type(host),
+                RemoteHost)
+        self.__host = host
+        self.__proto = None
+
     def to_proto(self):
-        """Converts plugin class RemoteEnvironment to protobuf class common_pb2.RemoteEnvironment
+        """Converts plugin class RemoteEnvironment to
+        protobuf class common_pb2.RemoteEnvironment
         """
-        remote_environment = common_pb2.RemoteEnvironment()
-        remote_environment.name = self.name
-        remote_environment.reference = self.reference
-        remote_environment.host.CopyFrom(self.host.to_proto())
-        return remote_environment
+        if self.__proto is None:
+            remote_environment = common_pb2.RemoteEnvironment()
+            remote_environment.name = self.name
+            remote_environment.reference = self.reference
+            remote_environment.host.CopyFrom(self.host.to_proto())
+            self.__proto = remote_environment
+        return self.__proto
 
     @staticmethod
     def from_proto(environment):
-        """Converts protobuf class common_pb2.RemoteEnvironment to plugin class RemoteEnvironment
+        """Converts protobuf class common_pb2.RemoteEnvironment to
+        plugin class RemoteEnvironment
         """
         if not isinstance(environment, common_pb2.RemoteEnvironment):
             raise IncorrectTypeError(
@@ -195,6 +227,7 @@ class RemoteHost(object):
                 type(scratch_path),
                 basestring)
         self.__scratch_path = scratch_path
+        self.__proto = None
 
     @property
     def name(self):
@@ -215,12 +248,14 @@ class RemoteHost(object):
     def to_proto(self):
         """Converts plugin class RemoteHost to protobuf class common_pb2.RemoteHost
         """
-        remote_host = common_pb2.RemoteHost()
-        remote_host.name = self.name
-        remote_host.reference = self.reference
-        remote_host.binary_path = self.binary_path
-        remote_host.scratch_path = self.scratch_path
-        return remote_host
+        if self.__proto is None:
+            remote_host = common_pb2.RemoteHost()
+            remote_host.name = self.name
+            remote_host.reference = self.reference
+            remote_host.binary_path = self.binary_path
+            remote_host.scratch_path = self.scratch_path
+            self.__proto = remote_host
+        return self.__proto
 
     @staticmethod
     def from_proto(host):
@@ -264,6 +299,7 @@ class RemoteUser(object):
                 type(reference),
                 basestring)
         self.__reference = reference
+        self.__proto = None
 
     @property
     def name(self):
@@ -276,10 +312,12 @@ class RemoteUser(object):
     def to_proto(self):
         """Converts plugin class RemoteUser to protobuf class common_pb2.RemoteUser
         """
-        remote_user = common_pb2.RemoteUser()
-        remote_user.name = self.name
-        remote_user.reference = self.reference
-        return remote_user
+        if self.__proto is None:
+            remote_user = common_pb2.RemoteUser()
+            remote_user.name = self.name
+            remote_user.reference = self.reference
+            self.__proto = remote_user
+        return self.__proto
 
     @staticmethod
     def from_proto(user):
@@ -0,0 +1,106 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Plugin operation scope shared by the platform and libs wrappers.
+
+The platform wrappers (the _internal_* methods that the Delphix Engine calls)
+run every plugin operation inside operation_wrapper. The libs wrappers use
+this module to learn which operation is running on the current thread and to
+register hooks that must run when an operation ends, for example to flush
+buffered log records. dvp-platform does not depend on dvp-libs, so the two
+meet here.
+"""
+
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+
+_local = threading.local()
+_end_hooks = []
+_end_hooks_lock = threading.Lock()
+
+
+def add_operation_end_hook(hook, first=False):
+    """Registers hook to be called with no arguments whenever a plugin
+    operation ends, after the plugin's implementation returned or raised and
+    before the response is handed back to the Delphix Engine. The operation
+    is still the current operation while the hooks run.
+
+    Hooks run in the order they were added, except for those added with
+    first=True, which run before all others. Hooks that log should run
+    first, so that hooks which flush buffered log records send their records.
+    """
+    with _end_hooks_lock:
+        if first:
+            _end_hooks.insert(0, hook)
+        else:
+            _end_hooks.append(hook)
+
+
+def remove_operation_end_hook(hook):
+    """Unregisters a hook added with add_operation_end_hook."""
+    with _end_hooks_lock:
+        if hook in _end_hooks:
+            _end_hooks.remove(hook)
+
+
+def current_operation():
+    """Returns the operation running on this thread, or None outside of a
+    plugin operation."""
+    operations = getattr(_local, 'operations', None)
+    return operations[-1] if operations else None
+
+
+def current_operation_start():
+    """Returns when the outermost operation running on this thread started,
+    in seconds since the epoch, or None outside of a plugin operation."""
+    if not getattr(_local, 'operations', None):
+        return None
+    return _local.start
+
+
+def operation_wrapper(operation):
+    """Decorator for the platform wrappers that marks the decorated method as
+    running the given plugin operation.
+
+    Operations may be nested, e.g. when a wrapper calls another wrapper. The
+    end hooks only run when the outermost operation ends. A hook that raises
+    does not change the outcome of the operation: the remaining hooks still
+    run and the error is printed to stderr, the way logging.Handler does.
+    """
+    def decorator(wrapper):
+        @functools.wraps(wrapper)
+        def run_operation(*args, **kwargs):
+            operations = getattr(_local, 'operations', None)
+            if operations is None:
+                operations = _local.operations = []
+            if not operations:
+                _local.start = time.time()
+            operations.append(operation)
+            try:
+                return wrapper(*args, **kwargs)
+            finally:
+                try:
+                    if len(operations) == 1:
+                        _run_end_hooks()
+                finally:
+                    operations.pop()
+
+        return run_operation
+
+    return decorator
+
+
+def _run_end_hooks():
+    with _end_hooks_lock:
+        hooks = list(_end_hooks)
+    for hook in hooks:
+        try:
+            hook()
+        except Exception:
+            if logging.raiseExceptions:
+                traceback.print_exc(file=sys.stderr)
@@ -4,9 +4,12 @@
 
 import pytest
 from dlpx.virtualization.api import common_pb2
-from dlpx.virtualization.common._common_classes import (RemoteConnection, RemoteEnvironment, RemoteHost, RemoteUser)
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteEnvironment,
+                                                        RemoteHost, RemoteUser)
 from dlpx.virtualization.common.exceptions import IncorrectTypeError
 
+
 @pytest.fixture
 def remote_user():
     return RemoteUser("user", "user-reference")
@@ -51,6 +54,29 @@ class TestRemoteConnection:
         remote_connection_proto = remote_connection.to_proto()
         assert isinstance(remote_connection_proto, common_pb2.RemoteConnection)
 
+    @staticmethod
+    def test_remote_connection_to_proto_cached(remote_user,
+                                               remote_environment):
+        remote_connection = RemoteConnection(remote_environment, remote_user)
+        remote_connection_proto = remote_connection.to_proto()
+        assert remote_connection.to_proto() is remote_connection_proto
+        assert (remote_connection_proto.environment.reference ==
+                'environment-reference')
+        assert remote_connection_proto.user.reference == 'user-reference'
+
+    @staticmethod
+    def test_remote_connection_to_proto_host_replaced(remote_user,
+                                                      remote_environment):
+        remote_connection = RemoteConnection(remote_environment, remote_user)
+        remote_connection.to_proto()
+
+        remote_environment.host = RemoteHost('other', 'other-reference',
+                                             'binary_path', 'scratch_path')
+
+        remote_connection_proto = remote_connection.to_proto()
+        assert (remote_connection_proto.environment.host.reference ==
+                'other-reference')
+
     @staticmethod
     def test_remote_connection_from_proto_success():
         remote_conn_proto_buf = common_pb2.RemoteConnection()
@@ -102,6 +128,18 @@ class TestRemoteEnvironment:
         remote_env = RemoteEnvironment('name', 'reference', remote_host)
         remote_env_proto = remote_env.to_proto()
         assert isinstance(remote_env_proto, common_pb2.RemoteEnvironment)
+        assert remote_env.to_proto() is remote_env_proto
+
+    @staticmethod
+    def test_remote_environment_set_incorrect_host(remote_host):
+        remote_env = RemoteEnvironment('name', 'reference', remote_host)
+        with pytest.raises(IncorrectTypeError) as err_info:
+            remote_env.host = ''
+        assert err_info.value.message == (
+            "RemoteEnvironment's parameter 'host' was"
+            " type 'str' but should be of class 'dlpx.virtualization"
+            ".common._common_classes.RemoteHost'.")
+        assert remote_env.host is remote_host
 
     @staticmethod
     def test_remote_environment_from_proto_success():
@@ -0,0 +1,125 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import time
+
+import pytest
+from dlpx.virtualization.common import _operation_context
+from dlpx.virtualization.common._operation_context import operation_wrapper
+
+
+@pytest.fixture
+def end_hook():
+    calls = []
+
+    def hook():
+        calls.append(_operation_context.current_operation())
+
+    _operation_context.add_operation_end_hook(hook)
+    yield calls
+    _operation_context.remove_operation_end_hook(hook)
+
+
+class TestOperationWrapper:
+    @staticmethod
+    def test_current_operation(end_hook):
+        @operation_wrapper('operation')
+        def operation(value):
+            return _operation_context.current_operation(), value
+
+        assert _operation_context.current_operation() is None
+        assert operation('value') == ('operation', 'value')
+        assert _operation_context.current_operation() is None
+        assert end_hook == ['operation']
+
+    @staticmethod
+    def test_current_operation_start():
+        @operation_wrapper('inner')
+        def inner():
+            return _operation_context.current_operation_start()
+
+        @operation_wrapper('outer')
+        def outer():
+            start = _operation_context.current_operation_start()
+            time.sleep(0.01)
+            assert inner() == start
+            return start
+
+        before = time.time()
+        assert before <= outer() <= time.time()
+        assert _operation_context.current_operation_start() is None
+
+    @staticmethod
+    def test_nested_operations_run_hooks_once(end_hook):
+        @operation_wrapper('inner')
+        def inner():
+            return _operation_context.current_operation()
+
+        @operation_wrapper('outer')
+        def outer():
+            assert inner() == 'inner'
+            assert end_hook == []
+            return _operation_context.current_operation()
+
+        assert outer() == 'outer'
+        assert end_hook == ['outer']
+
+    @staticmethod
+    def test_hooks_run_when_operation_raises(end_hook):
+        @operation_wrapper('operation')
+        def operation():
+            raise RuntimeError('operation failed')
+
+        with pytest.raises(RuntimeError) as err_info:
+            operation()
+
+        assert str(err_info.value) == 'operation failed'
+        assert end_hook == ['operation']
+
+    @staticmethod
+    def test_hook_error_not_raised(end_hook, capsys):
+        def failing_hook():
+            raise RuntimeError('hook failed')
+
+        _operation_context.add_operation_end_hook(failing_hook, first=True)
+        try:
+            result = operation_wrapper('operation')(lambda: 'result')()
+        finally:
+            _operation_context.remove_operation_end_hook(failing_hook)
+
+        assert result == 'result'
+        assert 'RuntimeError: hook failed' in capsys.readouterr().err
+        assert end_hook == ['operation']
+
+    @staticmethod
+    def test_first_hook(end_hook):
+        calls = []
+
+        def hook():
+            calls.append(len(end_hook))
+
+        _operation_context.add_operation_end_hook(hook, first=True)
+        try:
+            operation_wrapper('operation')(lambda: None)()
+        finally:
+            _operation_context.remove_operation_end_hook(hook)
+
+        assert calls == [0]
+        assert end_hook == ['operation']
+
+    @staticmethod
+    def test_remove_hook(end_hook):
+        calls = []
+
+        def hook():
+            calls.append(True)
+
+        _operation_context.add_operation_end_hook(hook)
+        _operation_context.remove_operation_end_hook(hook)
+        _operation_context.remove_operation_end_hook(hook)
+
+        operation_wrapper('operation')(lambda: None)()
+
+        assert calls == []
+        assert end_hook == ['operation']
@@ -6,3 +6,17 @@ __path__ = __import__('pkgutil').extend_path(__path__, __name__)
 
 from dlpx.virtualization.libs.libs import *
 from dlpx.virtualization.libs._logging import *
+from dlpx.virtualization.libs._futures import *
+from dlpx.virtualization.libs._stream import *
+from dlpx.virtualization.libs._cache import *
+from dlpx.virtualization.libs._sync import *
+from dlpx.virtualization.libs._sync_progress import *
+from dlpx.virtualization.libs._files import *
+from dlpx.virtualization.libs._session import *
+from dlpx.virtualization.libs._metrics import *
+from dlpx.virtualization.libs._output import *
+from dlpx.virtualization.libs._compression import *
+from dlpx.virtualization.libs._deadline import *
+from dlpx.virtualization.libs._admission import *
+from dlpx.virtualization.libs._resilience import *
+from dlpx.virtualization.libs._scripts import *
@@ -0,0 +1,266 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Admission control for the calls that run on remote environments.
+
+When a plugin fans out remote work, for example with run_bash_async, a
+small host can be overwhelmed by many simultaneous commands while other
+hosts stay idle. With concurrency limits set (see set_concurrency_limits),
+run_bash, run_bash_batch, run_sync, run_powershell and run_expect wait
+until their environment, identified by RemoteEnvironment.reference, has
+fewer calls running than its limit, and until fewer calls than the total
+limit run on all environments together.
+
+Waiting calls are admitted in the order they arrived, skipping those whose
+environment is at its limit, so a busy environment does not hold up calls
+to idle ones and calls to the same environment are never overtaken. The
+time spent waiting counts towards the timeout and the deadlines of a call
+(see set_operation_timeout). admission_stats reports how long calls waited
+per environment.
+
+Calls that wait for admission still occupy a thread, so set_max_async_workers
+should allow more asynchronous calls than the total limit.
+"""
+
+import collections
+import threading
+import time
+
+from dlpx.virtualization.libs.exceptions import (DeadlineExceededError,
+                                                 IncorrectArgumentTypeError)
+
+__all__ = [
+    "AdmissionStats",
+    "set_concurrency_limits",
+    "admission_stats",
+    "reset_admission_stats"
+]
+
+
+class AdmissionStats(object):
+    """How the calls to one environment were admitted.
+
+    Attributes:
+        admitted (int): Number of calls admitted.
+        expired (int): Number of calls whose timeout or deadline passed
+        while they waited.
+        wait_seconds (float): Total time calls waited for admission.
+        max_wait_seconds (float): Longest time a call waited for admission.
+        running (int): Number of calls running now.
+        waiting (int): Number of calls waiting now.
+    """
+    def __init__(self):
+        self.admitted = 0
+        self.expired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.running = 0
+        self.waiting = 0
+
+    def copy(self):
+        stats = AdmissionStats()
+        vars(stats).update(vars(self))
+        return stats
+
+
+class _Slot(object):
+    """A call that was admitted to an environment. Releasing it more than
+    once has no effect."""
+    def __init__(self, limiter, environment):
+        self._limiter = limiter
+        self._environment = environment
+        self._released = False
+
+    def release(self):
+        with self._limiter._condition:
+            if self._released:
+                return
+            self._released = True
+            self._limiter._release(self._environment)
+
+
+class _Limiter(object):
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._total = None
+        self._per_environment = None
+        self._environments = {}
+        self._running = collections.Counter()
+        self._running_total = 0
+        self._waiting = collections.deque()
+        self._stats = {}
+
+    def set_limits(self, total, per_environment, environments):
+        with self._condition:
+            self._total = total
+            self._per_environment = per_environment
+            self._environments = dict(environments)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {environment: stats.copy()
+                    for environment, stats in self._stats.items()}
+
+    def reset_stats(self):
+        """Zeroes the cumulative counters and forgets the environments that
+        have no calls running or waiting. The statistics of the others are
+        reset in place, since their waiting calls update them once
+        admitted."""
+        with self._condition:
+            for environment, stats in self._stats.items():
+                if not stats.running and not stats.waiting:
+                    del self._stats[environment]
+                    continue
+                stats.admitted = 0
+                stats.expired = 0
+                stats.wait_seconds = 0.0
+                stats.max_wait_seconds = 0.0
+
+    def _enabled(self):
+        return (self._total is not None or
+                self._per_environment is not None or
+                bool(self._environments))
+
+    def _has_room(self, environment):
+        limit = self._environments.get(environment, self._per_environment)
+        return limit is None or self._running[environment] < limit
+
+    def _admissible(self, waiter):
+        """Whether waiter is the first waiting call whose environment has
+        room, and there is room for one more call in total."""
+        if self._total is not None and self._running_total >= self._total:
+            return False
+        for other in self._waiting:
+            if self._has_room(other[0]):
+                return other is waiter
+        return False
+
+    def _environment_stats(self, environment):
+        if environment not in self._stats:
+            self._stats[environment] = AdmissionStats()
+        return self._stats[environment]
+
+    def acquire(self, call, environment, limit):
+        """Waits until a call to environment can run and returns a _Slot to
+        release once it finished, or None if there are no limits. Raises
+        DeadlineExceededError if limit, the (expiry time, description) of
+        the deadline of the call, passes first."""
+        with self._condition:
+            if not self._enabled():
+                return None
+            stats = self._environment_stats(environment)
+            #
+            # A list, so that every waiter is a distinct object even for
+            # the same environment.
+            #
+            waiter = [environment]
+            self._waiting.append(waiter)
+            stats.waiting += 1
+            start = time.time()
+            try:
+                while self._enabled() and not self._admissible(waiter):
+                    remaining = None
+                    if limit is not None:
+                        remaining = limit[0] - time.time()
+                        if remaining <= 0:
+                            stats.expired += 1
+                            raise DeadlineExceededError(
+                                call, time.time() - start, limit[1])
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting.remove(waiter)
+                stats.waiting -= 1
+                self._condition.notify_all()
+
+            waited = time.time() - start
+            stats.admitted += 1
+            stats.wait_seconds += waited
+            stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+            stats.running += 1
+            self._running[environment] += 1
+            self._running_total += 1
+            return _Slot(self, environment)
+
+    def _release(self, environment):
+        self._running[environment] -= 1
+        self._running_total -= 1
+        self._environment_stats(environment).running -= 1
+        self._condition.notify_all()
+
+
+_limiter = _Limiter()
+
+
+def _is_limit(limit):
+    return isinstance(limit, (int, long)) and not isinstance(limit, bool)
+
+
+def set_concurrency_limits(total=None, per_environment=None,
+                           environments=None):
+    """Sets how many calls may run on remote environments at the same time.
+    Calls beyond the limits wait for running calls to finish.
+
+    Args:
+        total (int): Maximum number of calls running on all environments
+        together. If None, there is no total limit.
+        per_environment (int): Maximum number of calls running on any one
+        environment. If None, there is no limit per environment.
+        environments (dict of str:int): Limits for specific environments,
+        by environment reference, that replace per_environment.
+    """
+    if environments is None:
+        environments = {}
+
+    if total is not None and not _is_limit(total):
+        raise IncorrectArgumentTypeError('total', type(total), int, False)
+    if per_environment is not None and not _is_limit(per_environment):
+        raise IncorrectArgumentTypeError(
+            'per_environment', type(per_environment), int, False)
+    if not isinstance(environments, dict):
+        raise IncorrectArgumentTypeError(
+            'environments', type(environments), {basestring: int}, False)
+    if (not all(isinstance(environment, basestring)
+                for environment in environments.keys()) or
+            not all(_is_limit(limit) for limit in environments.values())):
+        raise IncorrectArgumentTypeError(
+            'environments',
+            {(type(environment), type(limit))
+             for environment, limit in environments.items()},
+            {basestring: int},
+            False)
+    limits = [total, per_environment] + list(environments.values())
+    if any(limit is not None and limit < 1 for limit in limits):
+        raise ValueError('Concurrency limits must be at least 1.')
+
+    _limiter.set_limits(total, per_environment, environments)
+
+
+def admission_stats():
+    """Returns how calls were admitted since the plugin's Python runtime
+    started or reset_admission_stats was called, while limits were set.
+
+    Returns:
+        dict of str:AdmissionStats: The statistics per environment
+        reference.
+    """
+    return _limiter.stats()
+
+
+def reset_admission_stats():
+    """Discards the statistics returned by admission_stats, except for the
+    number of calls that are running or waiting."""
+    _limiter.reset_stats()
+
+
+def _environment(request):
+    if not request.DESCRIPTOR.fields_by_name.get('remote_connection'):
+        return None
+    return request.remote_connection.environment.reference or None
+
+
+def _acquire(call, request, limit):
+    """Waits until request can run on its environment. See
+    _Limiter.acquire."""
+    return _limiter.acquire(call, _environment(request), limit)
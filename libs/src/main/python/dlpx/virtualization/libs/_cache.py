@@ -0,0 +1,299 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Opt-in cache for the results of read-only remote commands.
+
+Plugins often run the same read-only probes, like `cat /etc/os-release` or a
+version query, on the same environment several times per operation and again
+in every later operation. run_bash_cached and run_powershell_cached return
+the result of an earlier identical call while it is still fresh instead of
+making another call to the Delphix Engine.
+
+Results are cached per environment, environment user, command and
+variables. Only results with exit code 0 are cached, so a failed probe is
+retried on the next call. Each entry expires ttl seconds after it was
+cached, and the least recently used entry is evicted once the cache holds
+more than its maximum number of entries. The cache lives as long as the
+plugin's Python runtime, so it is shared by all operations that run in it.
+
+Only use the cached wrappers for commands whose output does not depend on
+state that the plugin changes, or call invalidate_cached_results after the
+change.
+"""
+
+import collections
+import threading
+import time
+
+from dlpx.virtualization.common._common_classes import RemoteConnection
+from dlpx.virtualization.libs import libs
+from dlpx.virtualization.libs.exceptions import IncorrectArgumentTypeError
+
+__all__ = [
+    "run_bash_cached",
+    "run_powershell_cached",
+    "invalidate_cached_results",
+    "set_result_cache_size",
+    "result_cache_stats"
+]
+
+_DEFAULT_MAX_SIZE = 256
+_DEFAULT_TTL = 60
+
+_CacheKey = collections.namedtuple('_CacheKey', [
+    'function', 'environment', 'user', 'command', 'variables', 'options'])
+
+
+class _ResultCache(object):
+    """A thread safe LRU cache of library call results with a TTL per
+    entry."""
+    def __init__(self, max_size):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._max_size = max_size
+        self._stats = collections.Counter()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[1] <= time.time():
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries[key] = entry
+            self._stats['hits'] += 1
+            return entry[0]
+
+    def put(self, key, result, ttl):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (result, time.time() + ttl)
+            self._evict()
+
+    def invalidate(self, matches):
+        with self._lock:
+            keys = [key for key in self._entries if matches(key)]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(keys)
+            return len(keys)
+
+    def set_max_size(self, max_size):
+        with self._lock:
+            self._max_size = max_size
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            stats = {name: self._stats[name] for name in (
+                'hits', 'misses', 'expirations', 'evictions',
+                'invalidations')}
+            stats['size'] = len(self._entries)
+            return stats
+
+    def _evict(self):
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+
+_cache = _ResultCache(_DEFAULT_MAX_SIZE)
+
+
+def _cache_key(function, remote_connection, command, variables, options):
+    return _CacheKey(function.__name__,
+                     remote_connection.environment.reference,
+                     remote_connection.user.reference,
+                     command,
+                     frozenset(variables.items()) if variables else None,
+                     options)
+
+
+def _run_cached(key, ttl, function, *args):
+    result = _cache.get(key)
+    if result is None:
+        result = function(*args)
+        if result.exit_code != 0:
+            return result
+        _cache.put(key, result, ttl)
+
+    #
+    # The results are protobuf messages, which can be modified. Hand out
+    # copies so that a caller cannot change what later callers get.
+    #
+    copy = result.__class__()
+    copy.CopyFrom(result)
+    return copy
+
+
+def run_bash_cached(remote_connection, command, variables=None,
+                    use_login_shell=False, check=False, ttl=_DEFAULT_TTL):
+    """Cached run_bash operation wrapper.
+
+    Returns the result of an earlier run_bash call with the same environment,
+    environment user, command, variables and use_login_shell if it finished
+    with exit code 0 less than ttl seconds ago. Otherwise it calls run_bash
+    and caches its result if the exit code is 0.
+
+    Args:
+        See run_bash.
+        ttl (float): Seconds the result of this call may be returned from the
+        cache.
+
+    Returns:
+        RunBashResult: The return value of run_bash operation.
+    """
+    if variables is None:
+        variables = {}
+
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(command, basestring):
+        raise IncorrectArgumentTypeError('command', type(command), basestring)
+    if variables and not isinstance(variables, dict):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            type(variables),
+            {basestring: basestring},
+            False)
+    if (variables and (not all(isinstance(variable, basestring)
+                               for variable in variables.keys()) or
+                       not all(isinstance(value, basestring)
+                               for value in variables.values()))):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            {(type(variable), type(value))
+             for variable, value in variables.items()},
+            {basestring: basestring},
+            False)
+    if not isinstance(ttl, (int, float)) or isinstance(ttl, bool):
+        raise IncorrectArgumentTypeError('ttl', type(ttl), float, False)
+
+    key = _cache_key(libs.run_bash, remote_connection, command, variables,
+                     bool(use_login_shell))
+    return _run_cached(key, ttl, libs.run_bash, remote_connection, command,
+                       variables, use_login_shell, check)
+
+
+def run_powershell_cached(remote_connection, command, variables=None,
+                          check=False, ttl=_DEFAULT_TTL):
+    """Cached run_powershell operation wrapper.
+
+    Returns the result of an earlier run_powershell call with the same
+    environment, environment user, command and variables if it finished with
+    exit code 0 less than ttl seconds ago. Otherwise it calls run_powershell
+    and caches its result if the exit code is 0.
+
+    Args:
+        See run_powershell.
+        ttl (float): Seconds the result of this call may be returned from the
+        cache.
+
+    Returns:
+        RunPowerShellResult: The return value of run_powershell operation.
+    """
+    if variables is None:
+        variables = {}
+
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(command, basestring):
+        raise IncorrectArgumentTypeError('command', type(command), basestring)
+    if variables and not isinstance(variables, dict):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            type(variables),
+            {basestring: basestring},
+            False)
+    if (variables and (not all(isinstance(variable, basestring)
+                               for variable in variables.keys()) or
+                       not all(isinstance(value, basestring)
+                               for value in variables.values()))):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            {(type(variable), type(value))
+             for variable, value in variables.items()},
+            {basestring: basestring},
+            False)
+    if not isinstance(ttl, (int, float)) or isinstance(ttl, bool):
+        raise IncorrectArgumentTypeError('ttl', type(ttl), float, False)
+
+    key = _cache_key(libs.run_powershell, remote_connection, command,
+                     variables, None)
+    return _run_cached(key, ttl, libs.run_powershell, remote_connection,
+                       command, variables, check)
+
+
+def invalidate_cached_results(remote_connection=None, command=None):
+    """Removes results from the cache of run_bash_cached and
+    run_powershell_cached.
+
+    Without arguments, the whole cache is cleared.
+
+    Args:
+        remote_connection (RemoteConnection): If set, only remove the results
+        of commands run with the same environment and environment user.
+        command (str): If set, only remove the results of this command.
+
+    Returns:
+        int: The number of results removed.
+    """
+    if (remote_connection is not None and
+            not isinstance(remote_connection, RemoteConnection)):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection,
+            False)
+    if command is not None and not isinstance(command, basestring):
+        raise IncorrectArgumentTypeError(
+            'command', type(command), basestring, False)
+
+    def matches(key):
+        if remote_connection is not None and (
+                key.environment != remote_connection.environment.reference or
+                key.user != remote_connection.user.reference):
+            return False
+        return command is None or key.command == command
+
+    return _cache.invalidate(matches)
+
+
+def set_result_cache_size(max_size):
+    """Sets how many results the cache of run_bash_cached and
+    run_powershell_cached holds. The least recently used results are removed
+    beyond that.
+
+    Args:
+        max_size (int): The maximum number of cached results.
+    """
+    if not isinstance(max_size, int) or isinstance(max_size, bool):
+        raise IncorrectArgumentTypeError('max_size', type(max_size), int)
+    if max_size < 0:
+        raise ValueError('max_size must not be negative.')
+    _cache.set_max_size(max_size)
+
+
+def result_cache_stats():
+    """Returns statistics of the cache of run_bash_cached and
+    run_powershell_cached since the plugin's Python runtime started.
+
+    Returns:
+        dict of str:int: 'hits' and 'misses' count the cached calls that
+        were and were not answered from the cache, 'expirations' the misses
+        caused by an entry older than its ttl, 'evictions' the results removed
+        to stay within the cache size, 'invalidations' the results removed by
+        invalidate_cached_results and 'size' the current number of results.
+    """
+    return _cache.stats()
@@ -0,0 +1,246 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Compression of large commands and variables sent to the environment.
+
+The Delphix Engine sends the command and the variables of a run_bash or
+run_powershell request to the environment as they are. With a compression
+threshold set (see set_compression), the libs wrappers gzip the command and
+every variable value that is larger than the threshold, encode them with
+base64 and embed them in a short prelude that decompresses them on the
+environment before the command runs. Compressed variables are moved into
+the command, so that large values also no longer count towards the
+environment size limits of the host.
+
+A request is only sent compressed if that makes it smaller. The prelude for
+Bash needs the base64 and gzip commands on the host; the one for PowerShell
+only needs the .NET Framework.
+
+compression_stats returns how much the compression saved and how long it
+took, to decide whether it pays off for a plugin.
+"""
+
+import base64
+import re
+import threading
+import time
+import zlib
+
+from dlpx.virtualization.libs.exceptions import IncorrectArgumentTypeError
+
+__all__ = [
+    "CompressionStats",
+    "set_compression",
+    "compression_stats",
+    "reset_compression_stats"
+]
+
+_DEFAULT_LEVEL = 6
+
+#
+# Ends the here-documents that hold the compressed data. It cannot appear in
+# base64 encoded data.
+#
+_DELIMITER = 'DLPX_COMPRESSED'
+
+#
+# Only variables with names that Bash can assign are compressed for Bash.
+#
+_BASH_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_BASH_VARIABLE = '''\
+{name}=$(base64 -d << '{delimiter}' | gzip -dc && printf x
+{data}{delimiter}
+) || {{ echo 'Failed to decompress the variable {name}.' >&2; exit 1; }}
+{name}=${{{name}%x}}
+export {name}
+'''
+
+_BASH_COMMAND = '''\
+_dlpx_command=$(base64 -d << '{delimiter}' | gzip -dc
+{data}{delimiter}
+) || {{ echo 'Failed to decompress the command.' >&2; exit 1; }}
+eval "$_dlpx_command"
+'''
+
+_POWERSHELL_EXPAND = '''\
+function Expand-DlpxCompressed([string]$data) {
+  $stream = New-Object IO.Compression.GZipStream(
+      (New-Object IO.MemoryStream(, [Convert]::FromBase64String($data))),
+      [IO.Compression.CompressionMode]::Decompress)
+  $reader = New-Object IO.StreamReader($stream, [Text.Encoding]::UTF8)
+  try { $reader.ReadToEnd() } finally { $reader.Close() }
+}
+'''
+
+_POWERSHELL_VARIABLE = '''\
+[Environment]::SetEnvironmentVariable(
+    '{quoted_name}', (Expand-DlpxCompressed @'
+{data}'@))
+'''
+
+_POWERSHELL_COMMAND = '''\
+. ([ScriptBlock]::Create((Expand-DlpxCompressed @'
+{data}'@)))
+'''
+
+
+class CompressionStats(object):
+    """How much compressing requests saved.
+
+    Attributes:
+        requests (int): Number of requests sent compressed.
+        skipped (int): Number of requests with data above the threshold that
+        were sent uncompressed, because compressing did not make them
+        smaller.
+        original_bytes (int): Size of the commands and variables of the
+        compressed requests before compression.
+        compressed_bytes (int): Size of the commands and variables of the
+        compressed requests as sent, including the preludes.
+        seconds (float): Time spent compressing, including skipped requests.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.skipped = 0
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def ratio(self):
+        """The size of the compressed requests as sent relative to their
+        original size, or None if no request was compressed."""
+        if not self.original_bytes:
+            return None
+        return float(self.compressed_bytes) / self.original_bytes
+
+    def copy(self):
+        stats = CompressionStats()
+        vars(stats).update(vars(self))
+        return stats
+
+
+_lock = threading.Lock()
+_threshold = None
+_level = _DEFAULT_LEVEL
+_stats = CompressionStats()
+
+
+def set_compression(threshold=None, level=_DEFAULT_LEVEL):
+    """Sets when the libs wrappers compress the command and the variables of
+    run_bash, run_bash_batch and run_powershell requests.
+
+    Args:
+        threshold (int): Commands and variable values larger than this many
+        bytes (encoded as UTF-8) are compressed. If None, nothing is
+        compressed.
+        level (int): The zlib compression level, from 1 (fastest) to 9
+        (smallest).
+    """
+    global _threshold, _level
+
+    if threshold is not None and (not isinstance(threshold, int) or
+                                  isinstance(threshold, bool)):
+        raise IncorrectArgumentTypeError(
+            'threshold', type(threshold), int, False)
+    if not isinstance(level, int) or isinstance(level, bool):
+        raise IncorrectArgumentTypeError('level', type(level), int, False)
+    if (threshold is not None and threshold < 0) or not 1 <= level <= 9:
+        raise ValueError('threshold must not be negative and level must be'
+                         ' between 1 and 9.')
+
+    with _lock:
+        _threshold = threshold
+        _level = level
+
+
+def compression_stats():
+    """Returns how much compressing requests saved since the plugin's Python
+    runtime started or reset_compression_stats was called.
+
+    Returns:
+        CompressionStats: The statistics.
+    """
+    with _lock:
+        return _stats.copy()
+
+
+def reset_compression_stats():
+    """Discards the statistics returned by compression_stats."""
+    global _stats
+    with _lock:
+        _stats = CompressionStats()
+
+
+def _encode(text):
+    return text.encode('utf-8') if isinstance(text, unicode) else text
+
+
+def _compress(data, level):
+    """Returns data gzipped and encoded with base64, in lines that end with
+    a newline."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return base64.encodestring(compressor.compress(data) + compressor.flush())
+
+
+def _compress_request(command, variables, variable_template,
+                      command_template, prelude, name_pattern=None):
+    with _lock:
+        threshold, level = _threshold, _level
+    if threshold is None:
+        return command, variables
+
+    encoded_command = _encode(command)
+    encoded_variables = {name: _encode(value)
+                         for name, value in variables.items()}
+    large = sorted(name for name, value in encoded_variables.items()
+                   if len(value) > threshold and
+                   (name_pattern is None or name_pattern.match(name)))
+    if len(encoded_command) <= threshold and not large:
+        return command, variables
+
+    start = time.time()
+    parts = [prelude]
+    for name in large:
+        parts.append(variable_template.format(
+            name=name, quoted_name=name.replace("'", "''"),
+            data=_compress(encoded_variables[name], level),
+            delimiter=_DELIMITER))
+    if len(encoded_command) > threshold:
+        parts.append(command_template.format(
+            data=_compress(encoded_command, level), delimiter=_DELIMITER))
+    else:
+        parts.append(encoded_command)
+    compressed_command = ''.join(parts)
+    compressed_variables = {name: value for name, value in variables.items()
+                            if name not in large}
+    elapsed = time.time() - start
+
+    original_bytes = len(encoded_command) + sum(
+        len(value) for value in encoded_variables.values())
+    compressed_bytes = len(compressed_command) + sum(
+        len(encoded_variables[name]) for name in compressed_variables)
+    with _lock:
+        _stats.seconds += elapsed
+        if compressed_bytes >= original_bytes:
+            _stats.skipped += 1
+            return command, variables
+        _stats.requests += 1
+        _stats.original_bytes += original_bytes
+        _stats.compressed_bytes += compressed_bytes
+    return compressed_command, compressed_variables
+
+
+def _compress_bash(command, variables):
+    """Returns the command and variables of a run_bash request, compressed
+    according to the compression threshold."""
+    return _compress_request(command, variables, _BASH_VARIABLE,
+                             _BASH_COMMAND, '', _BASH_NAME)
+
+
+def _compress_powershell(command, variables):
+    """Returns the command and variables of a run_powershell request,
+    compressed according to the compression threshold."""
+    return _compress_request(command, variables, _POWERSHELL_VARIABLE,
+                             _POWERSHELL_COMMAND, _POWERSHELL_EXPAND)
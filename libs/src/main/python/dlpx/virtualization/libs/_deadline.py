@@ -0,0 +1,248 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Timeouts and deadlines of the calls to the Virtualization Library.
+
+A library call can be limited in three ways:
+- run_bash, run_powershell and run_expect (and their asynchronous variants)
+  take a timeout for the single call.
+- set_operation_timeout gives every plugin operation, or one kind of
+  operation, a deadline. All library calls made while the operation runs
+  must finish before it.
+- deadline is a context manager that sets a deadline for the library calls
+  made inside it.
+
+Each call gets the time left until the earliest of these. If it does not
+finish in time, or if the time is already up when it is made, the call
+raises DeadlineExceededError. The Delphix Engine cannot abort a call it
+already started, so the call is left running on a separate thread and the
+command may keep running on the environment until it ends.
+
+Asynchronous calls run under the deadlines of the thread that made them.
+Those that have not started running when the earliest deadline passes are
+cancelled, and their futures raise FutureCancelledError.
+"""
+
+import contextlib
+import functools
+import heapq
+import itertools
+import threading
+import time
+import weakref
+
+from dlpx.virtualization.common import _operation_context
+from dlpx.virtualization.libs import _futures
+from dlpx.virtualization.libs.exceptions import (DeadlineExceededError,
+                                                 IncorrectArgumentTypeError)
+
+__all__ = [
+    "set_operation_timeout",
+    "deadline",
+    "remaining_time"
+]
+
+_lock = threading.Lock()
+_operation_timeouts = {}
+_local = threading.local()
+
+
+def _is_seconds(seconds):
+    return (isinstance(seconds, (int, long, float)) and
+            not isinstance(seconds, bool))
+
+
+def set_operation_timeout(seconds, operation=None):
+    """Sets how long the library calls of a plugin operation may take in
+    total, counted from the start of the operation.
+
+    Args:
+        seconds (float): The timeout, or None to remove it.
+        operation (Operation): The operation the timeout applies to, e.g.
+        Operation.VIRTUAL_STATUS. If None, the timeout applies to all
+        operations that have no timeout of their own.
+    """
+    if seconds is not None and not _is_seconds(seconds):
+        raise IncorrectArgumentTypeError(
+            'seconds', type(seconds), float, False)
+    if seconds is not None and seconds <= 0:
+        raise ValueError('seconds must be positive.')
+
+    key = getattr(operation, 'value', operation)
+    with _lock:
+        if seconds is None:
+            _operation_timeouts.pop(key, None)
+        else:
+            _operation_timeouts[key] = seconds
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Context manager that limits the library calls made inside it, on the
+    current thread and by the asynchronous calls it makes, to the given
+    number of seconds from now. Deadlines can be nested; the earliest one
+    applies.
+
+        with libs.deadline(30):
+            for host in hosts:
+                libs.run_bash(host, 'check_health')
+
+    Args:
+        seconds (float): Seconds until the deadline.
+    """
+    if not _is_seconds(seconds):
+        raise IncorrectArgumentTypeError('seconds', type(seconds), float)
+
+    if not hasattr(_local, 'deadlines'):
+        _local.deadlines = []
+    _local.deadlines.append(
+        (time.time() + seconds, 'a deadline({}) block'.format(seconds)))
+    try:
+        yield
+    finally:
+        _local.deadlines.pop()
+
+
+def remaining_time():
+    """Returns the seconds left until the earliest deadline of the current
+    thread, which may be negative, or None if there is no deadline.
+
+    Returns:
+        float: The remaining time.
+    """
+    found = _deadlines()
+    if not found:
+        return None
+    return min(found)[0] - time.time()
+
+
+def _operation_deadline():
+    start = _operation_context.current_operation_start()
+    if start is None:
+        return None
+    operation = _operation_context.current_operation()
+    key = getattr(operation, 'value', operation)
+    with _lock:
+        timeout = _operation_timeouts.get(key, _operation_timeouts.get(None))
+    if timeout is None:
+        return None
+    return start + timeout, 'the {} operation'.format(key)
+
+
+def _deadlines():
+    """Returns the (expiry time, description) of every deadline that
+    applies to library calls on the current thread."""
+    found = list(getattr(_local, 'deadlines', ()))
+    found.extend(getattr(_local, 'inherited', ()))
+    operation_deadline = _operation_deadline()
+    if operation_deadline is not None:
+        found.append(operation_deadline)
+    return found
+
+
+def _earliest(timeout=None):
+    """Returns the (expiry time, description) of the earliest deadline of a
+    call made now with the given timeout, or None if it has no deadline."""
+    limits = _deadlines()
+    if timeout is not None:
+        limits.append((time.time() + timeout, None))
+    return min(limits) if limits else None
+
+
+def _limit(call, function, limit):
+    """Returns a function that calls function with a request and raises
+    DeadlineExceededError if it does not return before limit, the deadline
+    returned by _earliest."""
+    def limited(request):
+        if limit is None:
+            return function(request)
+        expiry, description = limit
+        remaining = expiry - time.time()
+        if remaining <= 0:
+            raise DeadlineExceededError(call, 0, description)
+
+        outcome = []
+        finished = threading.Event()
+
+        def run():
+            try:
+                outcome.append((True, function(request)))
+            except BaseException as e:
+                outcome.append((False, e))
+            finally:
+                finished.set()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        if not finished.wait(remaining):
+            raise DeadlineExceededError(call, remaining, description)
+        succeeded, value = outcome[0]
+        if not succeeded:
+            raise value
+        return value
+
+    return limited
+
+
+class _Canceller(object):
+    """Cancels futures at given times, from a single daemon thread that is
+    started when the first future is scheduled."""
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._scheduled = []
+        self._counter = itertools.count()
+        self._thread = None
+
+    def schedule(self, when, future):
+        with self._condition:
+            heapq.heappush(self._scheduled,
+                           (when, next(self._counter), weakref.ref(future)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while (not self._scheduled or
+                       self._scheduled[0][0] > time.time()):
+                    self._condition.wait(
+                        self._scheduled[0][0] - time.time()
+                        if self._scheduled else None)
+                future = heapq.heappop(self._scheduled)[2]()
+            if future is not None:
+                future.cancel()
+
+
+_canceller = _Canceller()
+
+
+def _submit(fn, *args):
+    """Runs fn(*args) on the shared worker pool under the deadlines of the
+    current thread and returns a Future for its result. The future is
+    cancelled if it has not started running when the earliest deadline
+    passes."""
+    return _submit_to(_futures._executor, fn, *args)
+
+
+def _submit_to(executor, fn, *args):
+    """Like _submit, but runs fn(*args) on the given _futures._Executor."""
+    found = _deadlines()
+    if not found:
+        return executor.submit(fn, *args)
+
+    @functools.wraps(fn)
+    def run_with_deadlines(*args):
+        _local.inherited = found
+        try:
+            return fn(*args)
+        finally:
+            _local.inherited = ()
+
+    future = executor.submit(run_with_deadlines, *args)
+    _canceller.schedule(min(found)[0], future)
+    return future
@@ -0,0 +1,348 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Reading and writing files on remote Unix environments.
+
+The Virtualization Libs API has no file transfer operation, so plugins used
+to embed file content in run_bash commands or parse it out of stdout. The
+functions in this module transfer files in chunks of a bounded size on top of
+run_bash instead:
+- every chunk is read or written at its offset with dd, so chunks are
+  independent of each other and up to max_in_flight of them are transferred
+  at the same time on the pool of the asynchronous library wrappers,
+- the content is base64 encoded, since the requests and responses of the
+  Virtualization Libs API only carry text,
+- the MD5 checksum of every chunk is computed on the environment and checked
+  on the plugin side. A chunk with a wrong checksum is transferred again
+  once before PluginScriptError is raised.
+
+The plugin holds at most max_in_flight chunks in memory, however large the
+file is. Writes are not atomic: a failed write leaves a partially written
+file behind.
+"""
+
+import base64
+import collections
+import hashlib
+import re
+
+from dlpx.virtualization.common._common_classes import RemoteConnection
+from dlpx.virtualization.libs import _deadline, libs
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+__all__ = [
+    "read_file",
+    "read_file_chunks",
+    "write_file",
+    "write_file_chunks"
+]
+
+_READ_CHUNK_SIZE = 1024 * 1024
+
+#
+# The encoded chunk is passed in an environment variable. Keep it well below
+# the 128KiB that Linux allows for a single variable.
+#
+_WRITE_CHUNK_SIZE = 64 * 1024
+
+_MAX_IN_FLIGHT = 4
+
+#
+# Defines md5_digest and the base64_encode and base64_decode filters with
+# whichever tools the environment has.
+#
+_TOOLS = '''\
+set -o pipefail
+if command -v md5sum >/dev/null 2>&1; then md5_digest() { md5sum; }
+elif command -v openssl >/dev/null 2>&1; then md5_digest() { openssl md5; }
+elif command -v digest >/dev/null 2>&1; then md5_digest() { digest -a md5; }
+elif command -v md5 >/dev/null 2>&1; then md5_digest() { md5; }
+else echo "No MD5 tool found." >&2; exit 1; fi
+if command -v base64 >/dev/null 2>&1; then
+  base64_encode() { base64; }
+  base64_decode() { base64 -d; }
+elif command -v openssl >/dev/null 2>&1; then
+  base64_encode() { openssl base64; }
+  base64_decode() { openssl base64 -d -A; }
+else echo "No base64 tool found." >&2; exit 1; fi
+'''
+
+_SIZE_SCRIPT = '''\
+if [ ! -f "$DLPX_FILE_PATH" ]; then
+  echo "$DLPX_FILE_PATH is not a regular file." >&2
+  exit 1
+fi
+wc -c < "$DLPX_FILE_PATH"
+'''
+
+#
+# Prints the checksum of the chunk on the first line, followed by its
+# encoded content.
+#
+_READ_SCRIPT = _TOOLS + '''\
+read_chunk() {
+  dd if="$DLPX_FILE_PATH" bs="$DLPX_FILE_CHUNK_SIZE" \\
+      skip="$DLPX_FILE_CHUNK" count=1 2>/dev/null
+}
+read_chunk | md5_digest || exit 1
+read_chunk | base64_encode
+'''
+
+_TRUNCATE_SCRIPT = ': > "$DLPX_FILE_PATH"\n'
+
+#
+# Writes the chunk and prints the checksum of what was written.
+#
+_WRITE_SCRIPT = _TOOLS + '''\
+printf '%s' "$DLPX_FILE_DATA" | base64_decode | \\
+    dd of="$DLPX_FILE_PATH" bs="$DLPX_FILE_CHUNK_SIZE" \\
+        seek="$DLPX_FILE_CHUNK" conv=notrunc 2>/dev/null || exit 1
+dd if="$DLPX_FILE_PATH" bs="$DLPX_FILE_CHUNK_SIZE" skip="$DLPX_FILE_CHUNK" \\
+    count=1 2>/dev/null | md5_digest
+'''
+
+_MD5 = re.compile(r'\b([0-9a-fA-F]{32})\b')
+
+
+def _run_script(remote_connection, script, variables, action):
+    result = libs._run_bash_full_output(remote_connection, script,
+                                        variables)
+    if result.exit_code != 0:
+        raise PluginScriptError('Failed to {} with exit code {}.'
+                                ' stdout : {} and '
+                                ' stderr : {}'.format(action,
+                                                      result.exit_code,
+                                                      result.stdout,
+                                                      result.stderr))
+    return result.stdout
+
+
+def _parse_checksum(output, action):
+    match = _MD5.search(output)
+    if match is None:
+        raise PluginScriptError('Failed to {}: no checksum in the output {}'
+                                .format(action, output))
+    return match.group(1).lower()
+
+
+def _file_size(remote_connection, path):
+    output = _run_script(remote_connection, _SIZE_SCRIPT,
+                         {'DLPX_FILE_PATH': path},
+                         'get the size of {}'.format(path))
+    return int(output.strip())
+
+
+def _read_chunk(remote_connection, path, chunk_size, chunk):
+    action = 'read chunk {} of {}'.format(chunk, path)
+    variables = {'DLPX_FILE_PATH': path,
+                 'DLPX_FILE_CHUNK_SIZE': str(chunk_size),
+                 'DLPX_FILE_CHUNK': str(chunk)}
+    for attempt in range(2):
+        output = _run_script(remote_connection, _READ_SCRIPT, variables,
+                             action)
+        checksum_line, _, encoded = output.partition('\n')
+        checksum = _parse_checksum(checksum_line, action)
+        data = base64.b64decode(encoded)
+        if hashlib.md5(data).hexdigest() == checksum:
+            return data
+    raise PluginScriptError('Failed to {}: the checksum of the received'
+                            ' data does not match.'.format(action))
+
+
+def _write_chunk(remote_connection, path, chunk_size, chunk, data):
+    action = 'write chunk {} of {}'.format(chunk, path)
+    variables = {'DLPX_FILE_PATH': path,
+                 'DLPX_FILE_CHUNK_SIZE': str(chunk_size),
+                 'DLPX_FILE_CHUNK': str(chunk),
+                 'DLPX_FILE_DATA': base64.b64encode(data)}
+    expected = hashlib.md5(data).hexdigest()
+    for attempt in range(2):
+        output = _run_script(remote_connection, _WRITE_SCRIPT, variables,
+                             action)
+        if _parse_checksum(output, action) == expected:
+            return
+    raise PluginScriptError('Failed to {}: the checksum of the written data'
+                            ' does not match.'.format(action))
+
+
+def _pipelined(calls, max_in_flight):
+    """Runs (function, args) calls on the worker pool, under the deadlines of
+    the caller, with at most max_in_flight running at a time, and yields
+    their results in order. Calls that have not started yet are cancelled
+    when the generator is closed."""
+    in_flight = collections.deque()
+    try:
+        for function, args in calls:
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+            in_flight.append(_deadline._submit(function, *args))
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def _rechunk(chunks, chunk_size):
+    """Yields the data of chunks in pieces of exactly chunk_size bytes,
+    except for the last one."""
+    pending = []
+    pending_size = 0
+    for data in chunks:
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if not isinstance(data, str):
+            raise TypeError('The chunks to write must be strings, not'
+                            ' {}.'.format(type(data).__name__))
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= chunk_size:
+            buffered = ''.join(pending)
+            offset = 0
+            while len(buffered) - offset >= chunk_size:
+                yield buffered[offset:offset + chunk_size]
+                offset += chunk_size
+            pending = [buffered[offset:]]
+            pending_size = len(pending[0])
+    if pending_size:
+        yield ''.join(pending)
+
+
+def read_file_chunks(remote_connection, path, chunk_size=_READ_CHUNK_SIZE,
+                     max_in_flight=_MAX_IN_FLIGHT):
+    """Reads a file on a remote Unix environment chunk by chunk.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        path (str): Path of the file to read.
+        chunk_size (int): Number of bytes read per run_bash call.
+        max_in_flight (int): Number of chunks read at the same time.
+
+    Returns:
+        generator of str: The content of the file, in chunks of chunk_size
+        bytes (the last chunk may be shorter).
+    """
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(path, basestring):
+        raise IncorrectArgumentTypeError('path', type(path), basestring)
+    if not isinstance(chunk_size, int) or isinstance(chunk_size, bool):
+        raise IncorrectArgumentTypeError(
+            'chunk_size', type(chunk_size), int, False)
+    if not isinstance(max_in_flight, int) or isinstance(max_in_flight, bool):
+        raise IncorrectArgumentTypeError(
+            'max_in_flight', type(max_in_flight), int, False)
+    if chunk_size < 1 or max_in_flight < 1:
+        raise ValueError('chunk_size and max_in_flight must be at least 1.')
+
+    size = _file_size(remote_connection, path)
+    return _pipelined(
+        ((_read_chunk, (remote_connection, path, chunk_size, chunk))
+         for chunk in range((size + chunk_size - 1) // chunk_size)),
+        max_in_flight)
+
+
+def read_file(remote_connection, path, chunk_size=_READ_CHUNK_SIZE,
+              max_in_flight=_MAX_IN_FLIGHT):
+    """Reads a file on a remote Unix environment.
+
+    Args:
+        See read_file_chunks.
+
+    Returns:
+        str: The content of the file.
+    """
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(path, basestring):
+        raise IncorrectArgumentTypeError('path', type(path), basestring)
+
+    return ''.join(read_file_chunks(remote_connection, path, chunk_size,
+                                    max_in_flight))
+
+
+def write_file_chunks(remote_connection, path, chunks,
+                      chunk_size=_WRITE_CHUNK_SIZE,
+                      max_in_flight=_MAX_IN_FLIGHT):
+    """Writes a file on a remote Unix environment from an iterable of
+    chunks, e.g. a generator that reads a local file.
+
+    The file is created if it does not exist and truncated if it does. Its
+    permissions and owner are not changed.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        path (str): Path of the file to write.
+        chunks (iterable of str): The content to write. The pieces can have
+        any size; unicode pieces are encoded as UTF-8.
+        chunk_size (int): Number of bytes written per run_bash call.
+        max_in_flight (int): Number of chunks written at the same time.
+    """
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(path, basestring):
+        raise IncorrectArgumentTypeError('path', type(path), basestring)
+    if not isinstance(chunk_size, int) or isinstance(chunk_size, bool):
+        raise IncorrectArgumentTypeError(
+            'chunk_size', type(chunk_size), int, False)
+    if not isinstance(max_in_flight, int) or isinstance(max_in_flight, bool):
+        raise IncorrectArgumentTypeError(
+            'max_in_flight', type(max_in_flight), int, False)
+    if chunk_size < 1 or max_in_flight < 1:
+        raise ValueError('chunk_size and max_in_flight must be at least 1.')
+
+    _run_script(remote_connection, _TRUNCATE_SCRIPT, {'DLPX_FILE_PATH': path},
+                'truncate {}'.format(path))
+    for _ in _pipelined(
+            ((_write_chunk, (remote_connection, path, chunk_size, chunk,
+                             data))
+             for chunk, data in enumerate(_rechunk(chunks, chunk_size))),
+            max_in_flight):
+        pass
+
+
+def write_file(remote_connection, path, content,
+               chunk_size=_WRITE_CHUNK_SIZE, max_in_flight=_MAX_IN_FLIGHT):
+    """Writes a file on a remote Unix environment.
+
+    The file is created if it does not exist and truncated if it does. Its
+    permissions and owner are not changed.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        path (str): Path of the file to write.
+        content (str): The content to write. unicode content is encoded as
+        UTF-8.
+        chunk_size (int): Number of bytes written per run_bash call.
+        max_in_flight (int): Number of chunks written at the same time.
+    """
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(path, basestring):
+        raise IncorrectArgumentTypeError('path', type(path), basestring)
+    if not isinstance(content, basestring):
+        raise IncorrectArgumentTypeError('content', type(content), basestring)
+
+    write_file_chunks(remote_connection, path, [content], chunk_size,
+                      max_in_flight)
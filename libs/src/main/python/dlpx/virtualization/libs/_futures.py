@@ -0,0 +1,272 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Futures for asynchronous library calls.
+
+The Python 2.7 runtime that plugins run in does not ship concurrent.futures,
+so this module provides the small subset the asynchronous libs wrappers
+(run_bash_async, run_powershell_async and run_expect_async) need: a Future,
+a bounded pool of worker threads that runs the library calls, and
+as_completed to consume futures in the order they finish.
+
+Exceptions raised by a library call, such as LibraryError or
+PluginScriptError, are stored on its Future and raised again by result().
+"""
+
+import Queue
+import threading
+import time
+
+from dlpx.virtualization.libs.exceptions import (FutureCancelledError,
+                                                 FutureTimeoutError,
+                                                 IncorrectArgumentTypeError)
+
+__all__ = [
+    "Future",
+    "as_completed",
+    "set_max_async_workers"
+]
+
+_DEFAULT_MAX_WORKERS = 8
+
+_PENDING = 'PENDING'
+_RUNNING = 'RUNNING'
+_CANCELLED = 'CANCELLED'
+_FINISHED = 'FINISHED'
+
+
+class Future(object):
+    """The result of a library call that runs on a worker thread.
+
+    Futures are created by the asynchronous library wrappers and should not
+    be created by plugin code directly.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = _PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def cancel(self):
+        """Cancels the call if it has not started running yet.
+
+        Returns:
+            bool: True if the call was cancelled, False if it is already
+            running or finished.
+        """
+        with self._condition:
+            if self._state in (_RUNNING, _FINISHED):
+                return False
+            if self._state == _PENDING:
+                self._state = _CANCELLED
+                self._condition.notify_all()
+        self._invoke_callbacks()
+        return True
+
+    def cancelled(self):
+        """bool: Whether the call was cancelled."""
+        return self._state == _CANCELLED
+
+    def running(self):
+        """bool: Whether the call is currently running."""
+        return self._state == _RUNNING
+
+    def done(self):
+        """bool: Whether the call finished or was cancelled."""
+        return self._state in (_CANCELLED, _FINISHED)
+
+    def result(self, timeout=None):
+        """Waits for the call to finish and returns its return value.
+
+        If the call raised an exception, the same exception is raised here.
+
+        Args:
+            timeout (float): Seconds to wait for. Waits forever if None.
+
+        Raises:
+            FutureTimeoutError: The call did not finish within timeout.
+            FutureCancelledError: The call was cancelled.
+        """
+        self._wait(timeout)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Waits for the call to finish and returns the exception it raised,
+        or None if it succeeded.
+
+        Args:
+            timeout (float): Seconds to wait for. Waits forever if None.
+
+        Raises:
+            FutureTimeoutError: The call did not finish within timeout.
+            FutureCancelledError: The call was cancelled.
+        """
+        self._wait(timeout)
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """Calls callback with this future once it is done. If the future is
+        already done, callback is called immediately.
+        """
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _wait(self, timeout):
+        end_time = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while not self.done():
+                remaining = None if end_time is None else end_time - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if self._state == _CANCELLED:
+                raise FutureCancelledError()
+            if self._state != _FINISHED:
+                raise FutureTimeoutError(timeout)
+
+    def _set_running(self):
+        """Marks the future as running unless it was cancelled.
+
+        Returns:
+            bool: False if the future was cancelled and must not be run.
+        """
+        with self._condition:
+            if self._state == _CANCELLED:
+                return False
+            self._state = _RUNNING
+            return True
+
+    def _set_result(self, result):
+        with self._condition:
+            self._result = result
+            self._state = _FINISHED
+            self._condition.notify_all()
+        self._invoke_callbacks()
+
+    def _set_exception(self, exception):
+        with self._condition:
+            self._exception = exception
+            self._state = _FINISHED
+            self._condition.notify_all()
+        self._invoke_callbacks()
+
+    def _invoke_callbacks(self):
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class _Executor(object):
+    """A pool of at most max_workers daemon threads that run submitted calls
+    in the order they were submitted. Threads are only started when there is
+    work for them.
+    """
+    def __init__(self, max_workers):
+        self._max_workers = max_workers
+        self._work_queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = 0
+        #
+        # Number of workers waiting for work that no submitted call has been
+        # handed to yet. submit takes one of them for its call, so that the
+        # calls of a burst do not all queue behind the same idle worker.
+        #
+        self._idle = 0
+
+    def set_max_workers(self, max_workers):
+        with self._lock:
+            self._max_workers = max_workers
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._work_queue.put((future, fn, args, kwargs))
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+            elif self._workers < self._max_workers:
+                self._workers += 1
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+        return future
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if self._workers > self._max_workers:
+                    self._workers -= 1
+                    return
+                self._idle += 1
+            future, fn, args, kwargs = self._work_queue.get()
+            if not future._set_running():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                #
+                # This includes SystemExit raised for non-actionable library
+                # errors, which has to reach the thread waiting on the result.
+                #
+                future._set_exception(e)
+            else:
+                future._set_result(result)
+
+
+_executor = _Executor(_DEFAULT_MAX_WORKERS)
+
+
+def _submit(fn, *args, **kwargs):
+    """Runs fn(*args, **kwargs) on the shared worker pool and returns a
+    Future for its result."""
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def set_max_async_workers(max_workers):
+    """Sets how many asynchronous library calls may run at the same time.
+    Calls submitted beyond that wait for a worker to become free.
+
+    Args:
+        max_workers (int): The maximum number of worker threads.
+    """
+    if not isinstance(max_workers, int) or isinstance(max_workers, bool):
+        raise IncorrectArgumentTypeError(
+            'max_workers', type(max_workers), int)
+    if max_workers < 1:
+        raise ValueError('max_workers must be at least 1.')
+    _executor.set_max_workers(max_workers)
+
+
+def as_completed(futures, timeout=None):
+    """Yields futures as they finish (or are cancelled), regardless of the
+    order they were created in.
+
+    Args:
+        futures (list of Future): The futures to wait for.
+        timeout (float): Seconds to wait for all of them to finish. Waits
+        forever if None.
+
+    Raises:
+        FutureTimeoutError: Not all futures finished within timeout.
+    """
+    pending = set(futures)
+    finished = Queue.Queue()
+    for future in pending:
+        future.add_done_callback(finished.put)
+
+    end_time = None if timeout is None else time.time() + timeout
+    for _ in range(len(pending)):
+        remaining = None if end_time is None else end_time - time.time()
+        if remaining is not None and remaining <= 0:
+            raise FutureTimeoutError(timeout)
+        try:
+            yield finished.get(timeout=remaining)
+        except Queue.Empty:
+            raise FutureTimeoutError(timeout)
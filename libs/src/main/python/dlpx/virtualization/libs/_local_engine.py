@@ -0,0 +1,359 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""A stand-in for the Delphix Engine that runs library calls locally.
+
+On the Delphix Engine, the libs wrappers hand their requests to the
+dlpx.virtualization._engine.libs module that the engine provides. To run,
+profile or load test plugin operations without an engine, as the SDK's own
+tests do, install a LocalEngine in its place:
+
+    from dlpx.virtualization.libs import _local_engine
+
+    engine = _local_engine.install_local_engine(
+        _local_engine.LocalEngine(latency=0.2, failure_rate=0.01))
+    try:
+        plugin.virtual.status(...)
+    finally:
+        _local_engine.uninstall_local_engine()
+
+It is not part of the public libs API.
+
+A LocalEngine runs run_bash commands with the local Bash, run_expect
+commands with expect and run_powershell commands with PowerShell Core, as
+the current user and in its home directory, whatever the remote connection
+says. run_sync copies the source directory into a directory per environment
+under sync_directory like rsync without --delete: files already there are
+overwritten or kept, never removed. Log requests are kept in LocalEngine.logs.
+
+Every call except log can be delayed by a fixed and a random latency, and
+can fail at random with an actionable library error, which the wrappers
+raise as a LibraryError.
+"""
+
+import errno
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+from dlpx.virtualization.api import libs_pb2
+
+_PARENT = 'dlpx.virtualization'
+_PACKAGE = 'dlpx.virtualization._engine'
+_MODULE = 'dlpx.virtualization._engine.libs'
+
+_INJECTED_FAILURE_ID = 1
+_FAILURE_ID = 2
+
+_LOG_LEVELS = {value.number: value.name for value in
+               libs_pb2.LogRequest.DESCRIPTOR.enum_types_by_name[
+                   'LogLevel'].values}
+
+
+def _translate(pattern):
+    """Returns the regular expression for an rsync wildcard pattern."""
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == '\\' and index + 1 < len(pattern):
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        elif pattern.startswith('**', index):
+            index += 1
+            parts.append('.*')
+        elif char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[' and ']' in pattern[index + 2:]:
+            end = pattern.index(']', index + 2)
+            members = pattern[index + 1:end]
+            if members.startswith('!'):
+                members = '^' + members[1:]
+            parts.append('[{}]'.format(members.replace('\\', '\\\\')))
+            index = end
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return ''.join(parts)
+
+
+def _exclude_matcher(pattern):
+    """Returns a function that tells whether an rsync exclude pattern
+    matches a path, relative to the source directory, that is a directory
+    or not."""
+    directory_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    if pattern.startswith('/'):
+        regex = re.compile('^' + _translate(pattern[1:]) + '$')
+    else:
+        regex = re.compile('^(?:.*/)?' + _translate(pattern) + '$')
+
+    def matches(path, is_directory):
+        return (is_directory or not directory_only) and bool(regex.match(path))
+
+    return matches
+
+
+def _make_directory(path):
+    #
+    # Partitions of a sync run concurrently into the same destination and may
+    # create its directories at the same time.
+    #
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+def _copy_tree(source, destination, relative, excludes, follow):
+    """Copies source into destination, which may exist, skipping the
+    excluded paths. Entries of destination are only replaced by the entries
+    of source of the same name."""
+    _make_directory(destination)
+    for name in sorted(os.listdir(source)):
+        path = os.path.join(source, name)
+        path_relative = relative + name
+        link = os.path.islink(path) and path not in follow
+        is_directory = not link and os.path.isdir(path)
+        if any(matches(path_relative, is_directory) for matches in excludes):
+            continue
+        target = os.path.join(destination, name)
+        if os.path.lexists(target) and (
+                link or os.path.islink(target) or
+                os.path.isdir(target) != is_directory):
+            _remove(target)
+        if link:
+            os.symlink(os.readlink(path), target)
+        elif is_directory:
+            _copy_tree(path, target, path_relative + '/', excludes, follow)
+        else:
+            shutil.copy2(path, target)
+
+
+class LocalEngine(object):
+    """Runs the requests of the Virtualization Library on the local machine.
+    Install it with install_local_engine.
+
+    Args:
+        latency (float): Seconds every call except log is delayed by.
+        latency_jitter (float): Calls are delayed by up to this many more
+        seconds, at random.
+        failure_rate (float): Probability between 0 and 1 that a call except
+        log fails with an actionable library error instead of running.
+        sync_directory (str): Directory that run_sync copies to. A source
+        directory is copied to the same path under a directory named after
+        the environment reference. Defaults to a new temporary directory.
+        working_directory (str): Directory commands run in. Defaults to the
+        home directory of the current user.
+        bash_binary (str): Bash used for run_bash.
+        expect_binary (str): expect used for run_expect.
+        powershell_binary (str): PowerShell used for run_powershell.
+        seed (int): Seed for the random latency and failures.
+
+    Attributes:
+        logs (list of tuple): The level ('DEBUG', 'INFO' or 'ERROR') and the
+        message of every log request.
+    """
+    def __init__(self, latency=0, latency_jitter=0, failure_rate=0,
+                 sync_directory=None, working_directory=None,
+                 bash_binary='bash', expect_binary='expect',
+                 powershell_binary='pwsh', seed=None):
+        if latency < 0 or latency_jitter < 0 or not 0 <= failure_rate <= 1:
+            raise ValueError('The latency must not be negative and the'
+                             ' failure rate must be between 0 and 1.')
+        self._latency = latency
+        self._latency_jitter = latency_jitter
+        self._failure_rate = failure_rate
+        self.sync_directory = (sync_directory or
+                               tempfile.mkdtemp(prefix='dlpx-local-sync-'))
+        self._working_directory = (working_directory or
+                                   os.path.expanduser('~'))
+        self._bash_binary = bash_binary
+        self._expect_binary = expect_binary
+        self._powershell_binary = powershell_binary
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.logs = []
+
+    def sync_destination(self, environment_reference, source_directory):
+        """Returns the directory run_sync copies source_directory of the
+        given environment to."""
+        return os.path.join(self.sync_directory,
+                            environment_reference or 'environment',
+                            source_directory.lstrip('/'))
+
+    def _inject(self, call, request, response):
+        """Sleeps for the injected latency, and sets an injected error on
+        response if the call is to fail. Returns whether it failed."""
+        with self._lock:
+            delay = self._latency + self._random.uniform(
+                0, self._latency_jitter)
+            failed = self._random.random() < self._failure_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            error = response.error.actionable_error
+            error.id = _INJECTED_FAILURE_ID
+            error.message = 'Injected failure of {} on environment {}.'.format(
+                call, request.remote_connection.environment.reference)
+        return failed
+
+    def _run(self, response, args, variables):
+        env = dict(os.environ)
+        env.update((variable.encode('utf-8'), value.encode('utf-8'))
+                   for variable, value in variables.items())
+        try:
+            with open(os.devnull) as stdin:
+                process = subprocess.Popen(
+                    [arg.encode('utf-8') if isinstance(arg, unicode) else arg
+                     for arg in args],
+                    stdin=stdin,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    env=env,
+                    cwd=self._working_directory)
+                stdout, stderr = process.communicate()
+        except OSError as e:
+            error = response.error.actionable_error
+            error.id = _FAILURE_ID
+            error.message = 'Failed to run {}: {}'.format(args[0], e)
+            return response
+
+        response.return_value.exit_code = process.returncode
+        response.return_value.stdout = stdout.decode('utf-8', 'replace')
+        response.return_value.stderr = stderr.decode('utf-8', 'replace')
+        return response
+
+    def run_bash(self, run_bash_request):
+        response = libs_pb2.RunBashResponse()
+        if self._inject('run_bash', run_bash_request, response):
+            return response
+        args = [self._bash_binary]
+        if run_bash_request.use_login_shell:
+            args.append('-l')
+        args.extend(['-c', run_bash_request.command])
+        return self._run(response, args, run_bash_request.variables)
+
+    def run_expect(self, run_expect_request):
+        response = libs_pb2.RunExpectResponse()
+        if self._inject('run_expect', run_expect_request, response):
+            return response
+        return self._run(response,
+                         [self._expect_binary, '-c',
+                          run_expect_request.command],
+                         run_expect_request.variables)
+
+    def run_powershell(self, run_powershell_request):
+        response = libs_pb2.RunPowerShellResponse()
+        if self._inject('run_powershell', run_powershell_request, response):
+            return response
+        return self._run(response,
+                         [self._powershell_binary, '-NoProfile',
+                          '-NonInteractive', '-Command',
+                          run_powershell_request.command],
+                         run_powershell_request.variables)
+
+    def run_sync(self, run_sync_request):
+        response = libs_pb2.RunSyncResponse()
+        if self._inject('run_sync', run_sync_request, response):
+            return response
+
+        source = run_sync_request.source_directory
+        destination = self.sync_destination(
+            run_sync_request.remote_connection.environment.reference, source)
+        excludes = [_exclude_matcher(pattern)
+                    for pattern in run_sync_request.exclude_paths]
+        follow = set(os.path.normpath(os.path.join(source, path))
+                     for path in run_sync_request.sym_links_to_follow)
+        try:
+            _copy_tree(source, destination, '', excludes, follow)
+        except (IOError, OSError) as e:
+            error = response.error.actionable_error
+            error.id = _FAILURE_ID
+            error.message = 'Failed to sync {}: {}'.format(source, e)
+            return response
+        response.return_value.SetInParent()
+        return response
+
+    def log(self, log_request):
+        with self._lock:
+            self.logs.append((_LOG_LEVELS[log_request.level],
+                              log_request.message))
+        response = libs_pb2.LogResponse()
+        response.return_value.SetInParent()
+        return response
+
+
+_lock = threading.Lock()
+_replaced = []
+
+
+def install_local_engine(engine=None):
+    """Makes the libs wrappers send their requests to a LocalEngine instead
+    of the Delphix Engine, until uninstall_local_engine is called.
+
+    Args:
+        engine (LocalEngine): The engine. Defaults to a LocalEngine with no
+        latency and no failures.
+
+    Returns:
+        LocalEngine: The installed engine.
+    """
+    if engine is None:
+        engine = LocalEngine()
+
+    module = types.ModuleType(_MODULE)
+    for name in ('run_bash', 'run_sync', 'run_powershell', 'run_expect',
+                 'log'):
+        setattr(module, name, getattr(engine, name))
+    package = types.ModuleType(_PACKAGE)
+    package.__path__ = []
+    package.libs = module
+
+    parent = sys.modules.get(_PARENT)
+    with _lock:
+        _replaced.append((sys.modules.get(_PACKAGE), sys.modules.get(_MODULE),
+                          getattr(parent, '_engine', None)))
+        sys.modules[_PACKAGE] = package
+        sys.modules[_MODULE] = module
+        if parent is not None:
+            parent._engine = package
+    return engine
+
+
+def uninstall_local_engine():
+    """Undoes the last install_local_engine."""
+    parent = sys.modules.get(_PARENT)
+    with _lock:
+        if not _replaced:
+            return
+        package, module, attribute = _replaced.pop()
+        for name, replaced in ((_PACKAGE, package), (_MODULE, module)):
+            if replaced is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = replaced
+        if parent is not None:
+            if attribute is None:
+                if hasattr(parent, '_engine'):
+                    del parent._engine
+            else:
+                parent._engine = attribute
@@ -1,20 +1,310 @@
 #
-# Copyright (c) 2019 by Delphix. All rights reserved.
+# Copyright (c) 2019, 2020 by Delphix. All rights reserved.
 #
 
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
 from logging import Handler
 
+from dlpx.virtualization.common import _operation_context
 from dlpx.virtualization.libs import libs
 
 __all__ = [
-    "PlatformHandler"
+    "PlatformHandler",
+    "BufferedPlatformHandler",
+    "set_engine_log_level"
 ]
 
+#
+# Records below this level are dropped by every PlatformHandler before they
+# are formatted.
+#
+_engine_log_level = logging.NOTSET
+
+
+def set_engine_log_level(level):
+    """Sets the lowest level of the records that PlatformHandlers send to the
+    Delphix Engine.
+
+    Set this to mirror the level the engine keeps plugin logs at, so that
+    records the engine would discard are dropped before they are formatted
+    and sent. Dropped records are counted in each handler's dropped counter.
+
+    Args:
+        level (int): A Python logging level, e.g. logging.INFO.
+    """
+    global _engine_log_level
+    _engine_log_level = level
+
 
 class PlatformHandler(Handler):
     """
     A logging handler that calls into the Virtualization Library.
+
+    Records are dropped before they are formatted if they are below the level
+    set with set_engine_log_level, if they repeat the previous record (when
+    suppress_duplicates is True) or if their logger exceeded its rate limit.
+
+    Args:
+        suppress_duplicates (bool): If True, a record with the same logger,
+        level and message as the previous record is not sent. Once a different
+        record is logged, or when the plugin operation ends, a single "Last
+        message repeated N times." record is sent instead.
+        rate_limit (float): Maximum number of records per second sent for each
+        logger, on average. Records at ERROR or above are never rate limited.
+        If None, there is no rate limit.
+        rate_limit_burst (int): Maximum number of records a logger may send at
+        once after it has been quiet. Defaults to rate_limit, and at least 1.
+
+    Attributes:
+        dropped (collections.Counter): Number of records dropped, by reason:
+        'threshold', 'duplicate' or 'rate_limit'.
     """
+    def __init__(self, suppress_duplicates=False, rate_limit=None,
+                 rate_limit_burst=None):
+        super(PlatformHandler, self).__init__()
+        self._suppress_duplicates = suppress_duplicates
+        self._last_record = None
+        self._last_key = None
+        self._repeated = 0
+
+        self._rate_limit = rate_limit
+        if rate_limit_burst is None and rate_limit is not None:
+            rate_limit_burst = max(1, rate_limit)
+        self._rate_limit_burst = rate_limit_burst
+        self._buckets = {}
+
+        self.dropped = collections.Counter()
+        if self._flushes_at_operation_end():
+            _operation_context.add_operation_end_hook(self.flush)
+
+    def handle(self, record):
+        if record.levelno < _engine_log_level:
+            self.dropped['threshold'] += 1
+            return False
+        if not self.filter(record):
+            return False
+        self.acquire()
+        try:
+            if self._is_duplicate(record):
+                self.dropped['duplicate'] += 1
+            elif self._is_rate_limited(record):
+                self.dropped['rate_limit'] += 1
+            else:
+                self.emit(record)
+        finally:
+            self.release()
+        return True
+
     def emit(self, record):
         msg = self.format(record)
         libs._log_request(msg, record.levelno)
+
+    def flush(self):
+        """Sends the "Last message repeated" record of the duplicates
+        suppressed so far, if any."""
+        self.acquire()
+        try:
+            self._emit_repeated()
+        finally:
+            self.release()
+
+    def close(self):
+        _operation_context.remove_operation_end_hook(self.flush)
+        super(PlatformHandler, self).close()
+
+    def _flushes_at_operation_end(self):
+        return self._suppress_duplicates
+
+    def _is_duplicate(self, record):
+        """Must be called with the handler lock held."""
+        if not self._suppress_duplicates:
+            return False
+        key = (record.name, record.levelno, record.getMessage())
+        if key == self._last_key:
+            self._repeated += 1
+            return True
+        self._emit_repeated()
+        self._last_record = record
+        self._last_key = key
+        return False
+
+    def _emit_repeated(self):
+        """Must be called with the handler lock held."""
+        if not self._repeated:
+            return
+        last = self._last_record
+        record = logging.makeLogRecord({
+            'name': last.name,
+            'levelno': last.levelno,
+            'levelname': last.levelname,
+            'msg': 'Last message repeated %d times.',
+            'args': (self._repeated,)})
+        self._repeated = 0
+        self.emit(record)
+
+    def _is_rate_limited(self, record):
+        """Takes a token from the bucket of the record's logger. Must be
+        called with the handler lock held."""
+        if self._rate_limit is None or record.levelno >= logging.ERROR:
+            return False
+        now = time.time()
+        tokens, updated = self._buckets.get(record.name,
+                                            (self._rate_limit_burst, now))
+        tokens = min(self._rate_limit_burst,
+                     tokens + (now - updated) * self._rate_limit)
+        if tokens < 1:
+            self._buckets[record.name] = (tokens, now)
+            return True
+        self._buckets[record.name] = (tokens - 1, now)
+        return False
+
+
+class BufferedPlatformHandler(PlatformHandler):
+    """
+    A logging handler that queues records and sends them to the
+    Virtualization Library in batches, so that logging does not cost a
+    library call per record.
+
+    Records are formatted when they are logged. The queue is sent:
+    - from a background thread every flush_interval seconds,
+    - as soon as batch_size records are queued,
+    - when a record at or above flush_level is logged, and
+    - when a plugin operation ends, so that every record logged during an
+      operation reaches the Delphix Engine before the operation returns.
+
+    Consecutive records that map to the same library log level (DEBUG, INFO
+    or ERROR) are joined with newlines and sent as a single log request.
+
+    Args:
+        capacity (int): Maximum number of queued records.
+        overflow_policy (str): What happens to a record logged while the
+        queue is full. DROP_OLDEST drops the oldest queued record, DROP_NEWEST
+        drops the new record and FLUSH sends the queue from the logging thread
+        before queueing the record.
+        batch_size (int): Maximum number of records sent in one log request.
+        flush_interval (float): Seconds between flushes from the background
+        thread. If None, no background thread is started.
+        flush_level (int): Records at or above this level are sent right away,
+        together with the records queued before them.
+        suppress_duplicates, rate_limit, rate_limit_burst: See PlatformHandler.
+
+    Attributes:
+        dropped (collections.Counter): Number of records dropped, by reason.
+        Besides the reasons of PlatformHandler, 'overflow' counts the records
+        dropped because the queue was full.
+    """
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    FLUSH = 'flush'
+
+    def __init__(self, capacity=10000, overflow_policy=DROP_OLDEST,
+                 batch_size=100, flush_interval=1.0,
+                 flush_level=logging.ERROR, suppress_duplicates=False,
+                 rate_limit=None, rate_limit_burst=None):
+        if overflow_policy not in (self.DROP_OLDEST, self.DROP_NEWEST,
+                                   self.FLUSH):
+            raise ValueError(
+                "Unknown overflow policy '{}'.".format(overflow_policy))
+        super(BufferedPlatformHandler, self).__init__(suppress_duplicates,
+                                                      rate_limit,
+                                                      rate_limit_burst)
+        self._capacity = capacity
+        self._overflow_policy = overflow_policy
+        self._batch_size = batch_size
+        self._flush_level = flush_level
+        self._records = collections.deque()
+        self._queue_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._unreported_drops = 0
+
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval is not None:
+            self._flusher = threading.Thread(target=self._flush_periodically,
+                                             args=(flush_interval,))
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def emit(self, record):
+        msg = self.format(record)
+        flush = record.levelno >= self._flush_level
+        with self._queue_lock:
+            if len(self._records) >= self._capacity:
+                if self._overflow_policy == self.DROP_NEWEST:
+                    self._drop()
+                    return
+                elif self._overflow_policy == self.DROP_OLDEST:
+                    self._records.popleft()
+                    self._drop()
+                else:
+                    flush = True
+            self._records.append((record.levelno, msg))
+            flush = flush or len(self._records) >= self._batch_size
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Sends all queued records to the Virtualization Library."""
+        super(BufferedPlatformHandler, self).flush()
+        with self._send_lock:
+            while True:
+                with self._queue_lock:
+                    batch = self._next_batch()
+                if not batch:
+                    return
+                level, messages = batch
+                libs._log_request('\n'.join(messages), level)
+
+    def close(self):
+        """Sends the queued records and stops the background thread."""
+        _operation_context.remove_operation_end_hook(self.flush)
+        self._closed.set()
+        try:
+            self.flush()
+        finally:
+            super(BufferedPlatformHandler, self).close()
+
+    def _flushes_at_operation_end(self):
+        return True
+
+    def _drop(self):
+        self.dropped['overflow'] += 1
+        self._unreported_drops += 1
+
+    def _next_batch(self):
+        """Takes the next batch of records that map to the same library log
+        level off the queue. Must be called with the queue lock held."""
+        if self._unreported_drops:
+            message = ('{} log records were dropped because the log buffer'
+                       ' was full.'.format(self._unreported_drops))
+            self._unreported_drops = 0
+            return logging.WARNING, [message]
+        if not self._records:
+            return None
+
+        level = self._records[0][0]
+        request_level = libs._log_request_level(level)
+        messages = []
+        while (self._records and len(messages) < self._batch_size and
+               libs._log_request_level(self._records[0][0]) ==
+               request_level):
+            messages.append(self._records.popleft()[1])
+        return level, messages
+
+    def _flush_periodically(self, flush_interval):
+        while not self._closed.wait(flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                #
+                # There is no caller to report to on this thread, nor a record
+                # for handleError. The records that failed to send are lost,
+                # later ones are still sent.
+                #
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
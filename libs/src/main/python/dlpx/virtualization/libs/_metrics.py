@@ -0,0 +1,380 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Latency and payload metrics of the calls to the Virtualization Library.
+
+Every call the libs wrappers make to the Delphix Engine (run_bash, run_sync,
+run_powershell, run_expect and log) is recorded as a CallRecord with its
+wall time, the sizes of the request and response messages, the sizes of
+stdout and stderr and the exit code. The records are aggregated in memory
+into a CallHistogram per kind of call and environment, and handed to the
+registered metrics sinks. Measuring the sizes means encoding the whole
+output of a command, so they are only measured while a sink is registered.
+The sinks are:
+- LogSummarySink logs a summary of the calls made during an operation when
+  the operation ends, slowest environments and kinds of calls first.
+- JsonDumpSink writes the records of an operation as one JSON document when
+  the operation ends.
+
+Custom sinks subclass MetricsSink.
+"""
+
+import json
+import logging
+import threading
+import time
+
+from google.protobuf import message
+
+from dlpx.virtualization.common import _operation_context
+
+__all__ = [
+    "CallRecord",
+    "CallHistogram",
+    "MetricsSink",
+    "LogSummarySink",
+    "JsonDumpSink",
+    "add_metrics_sink",
+    "remove_metrics_sink",
+    "call_histograms",
+    "dump_metrics_json",
+    "reset_metrics"
+]
+
+#
+# Upper bounds, in seconds, of the latency histogram buckets. The last bucket
+# holds everything slower.
+#
+_BUCKET_BOUNDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+                  300)
+
+
+class CallRecord(object):
+    """A call to the Virtualization Library.
+
+    Attributes:
+        kind (str): The library call, e.g. 'run_bash' or 'log'.
+        environment (str): Reference of the environment the call ran on, or
+        None for calls that do not run on an environment.
+        operation (str): The plugin operation the call was made in, or None.
+        start (float): When the call started, in seconds since the epoch.
+        elapsed (float): Wall time of the call in seconds.
+        request_bytes (int): Serialized size of the request, or None if no
+        metrics sink was registered.
+        response_bytes (int): Serialized size of the response, 0 if the call
+        raised, or None if no metrics sink was registered.
+        stdout_bytes (int): Size of the command's stdout encoded as UTF-8, or
+        None if the call does not return output or no metrics sink was
+        registered.
+        stderr_bytes (int): Size of the command's stderr encoded as UTF-8, or
+        None if the call does not return output or no metrics sink was
+        registered.
+        exit_code (int): Exit code of the command, or None if the call does
+        not return one.
+        failed (bool): Whether the call returned a library error or raised.
+    """
+    def __init__(self, kind, environment, operation, start, elapsed,
+                 request_bytes, response_bytes, stdout_bytes, stderr_bytes,
+                 exit_code, failed):
+        self.kind = kind
+        self.environment = environment
+        self.operation = operation
+        self.start = start
+        self.elapsed = elapsed
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+        self.exit_code = exit_code
+        self.failed = failed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class CallHistogram(object):
+    """Aggregated metrics of the calls of one kind on one environment.
+
+    Attributes:
+        count (int): Number of calls.
+        total_seconds (float): Total wall time of the calls.
+        max_seconds (float): Wall time of the slowest call.
+        buckets (list of int): Number of calls per latency bucket. Bucket i
+        counts the calls slower than bounds[i - 1] and at most as slow as
+        bounds[i]; the last bucket counts the calls slower than all bounds.
+        bounds (tuple of float): Upper bounds of the buckets in seconds.
+        request_bytes, response_bytes, stdout_bytes, stderr_bytes (int): Sums
+        of the sizes of the calls made while a metrics sink was registered.
+        failures (int): Number of calls that failed.
+        non_zero_exit_codes (int): Number of calls with a non-zero exit code.
+    """
+    bounds = _BUCKET_BOUNDS
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self.failures = 0
+        self.non_zero_exit_codes = 0
+
+    def add(self, record):
+        self.count += 1
+        self.total_seconds += record.elapsed
+        self.max_seconds = max(self.max_seconds, record.elapsed)
+        bucket = 0
+        while (bucket < len(self.bounds) and
+               record.elapsed > self.bounds[bucket]):
+            bucket += 1
+        self.buckets[bucket] += 1
+        self.request_bytes += record.request_bytes or 0
+        self.response_bytes += record.response_bytes or 0
+        self.stdout_bytes += record.stdout_bytes or 0
+        self.stderr_bytes += record.stderr_bytes or 0
+        self.failures += record.failed
+        self.non_zero_exit_codes += bool(record.exit_code)
+
+    def percentile(self, fraction):
+        """Returns the upper bound of the bucket that holds the given
+        fraction (between 0 and 1) of the calls, or max_seconds if that is
+        the last bucket."""
+        needed = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= needed and count:
+                if bucket < len(self.bounds):
+                    return min(self.bounds[bucket], self.max_seconds)
+                break
+        return self.max_seconds
+
+    def copy(self):
+        histogram = CallHistogram()
+        vars(histogram).update(vars(self))
+        histogram.buckets = list(self.buckets)
+        return histogram
+
+    def to_dict(self):
+        result = dict(vars(self))
+        result['bounds'] = list(self.bounds)
+        return result
+
+
+class MetricsSink(object):
+    """Receives the metrics of the calls to the Virtualization Library.
+    Register sinks with add_metrics_sink.
+    """
+    def record(self, call):
+        """Called with the CallRecord of every call, on the thread that made
+        the call."""
+
+    def operation_ended(self, operation, calls):
+        """Called when a plugin operation ends with the CallRecords of the
+        calls made since the previous operation ended."""
+
+
+class LogSummarySink(MetricsSink):
+    """Logs a summary of the calls made during an operation when it ends:
+    one line per kind of call and environment, those with the longest total
+    time first.
+
+    Args:
+        logger (logging.Logger): The logger to log the summary with.
+        level (int): The level to log the summary at.
+        limit (int): Maximum number of lines in the summary.
+    """
+    def __init__(self, logger=None, level=logging.INFO, limit=10):
+        self._logger = logger or logging.getLogger(__name__)
+        self._level = level
+        self._limit = limit
+
+    def operation_ended(self, operation, calls):
+        if not calls:
+            return
+        histograms = _aggregate(calls)
+        lines = ['{} made {} library calls in {:.3f} seconds:'.format(
+            operation or 'The operation', len(calls),
+            sum(call.elapsed for call in calls))]
+        ranked = sorted(histograms.items(),
+                        key=lambda item: item[1].total_seconds,
+                        reverse=True)
+        for (kind, environment), histogram in ranked[:self._limit]:
+            lines.append(
+                '  {} on {}: {} calls, {:.3f}s total, {:.3f}s max,'
+                ' p90 <= {:.3f}s, {} bytes sent, {} bytes received,'
+                ' {} failed, {} non-zero exit codes'.format(
+                    kind, environment or '-', histogram.count,
+                    histogram.total_seconds, histogram.max_seconds,
+                    histogram.percentile(0.9), histogram.request_bytes,
+                    histogram.response_bytes, histogram.failures,
+                    histogram.non_zero_exit_codes))
+        self._logger.log(self._level, '\n'.join(lines))
+
+
+class JsonDumpSink(MetricsSink):
+    """Writes the CallRecords of an operation as a single line of JSON when
+    the operation ends.
+
+    Args:
+        stream: Object with a write method that takes a str, e.g. a file.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def operation_ended(self, operation, calls):
+        self._stream.write(json.dumps({
+            'operation': operation,
+            'calls': [call.to_dict() for call in calls]},
+            sort_keys=True) + '\n')
+
+
+_lock = threading.Lock()
+_histograms = {}
+_operation_calls = []
+_sinks = []
+
+
+def _aggregate(calls):
+    histograms = {}
+    for call in calls:
+        key = (call.kind, call.environment)
+        if key not in histograms:
+            histograms[key] = CallHistogram()
+        histograms[key].add(call)
+    return histograms
+
+
+def _text_bytes(text):
+    if isinstance(text, unicode):
+        return len(text.encode('utf-8'))
+    return len(text)
+
+
+def _call(kind, function, request):
+    """Calls the engine with request, records the call and returns the
+    response."""
+    environment = None
+    if request.DESCRIPTOR.fields_by_name.get('remote_connection'):
+        environment = request.remote_connection.environment.reference or None
+
+    start = time.time()
+    response = None
+    try:
+        response = function(request)
+        return response
+    finally:
+        elapsed = time.time() - start
+        _record(kind, environment, start, elapsed, request, response)
+
+
+def _record(kind, environment, start, elapsed, request, response):
+    measured = bool(_sinks)
+    request_bytes = request.ByteSize() if measured else None
+    response_bytes = 0 if measured else None
+    stdout_bytes = stderr_bytes = exit_code = None
+    failed = True
+    if isinstance(response, message.Message):
+        failed = response.HasField('error')
+        result = response.return_value
+        if 'exit_code' in result.DESCRIPTOR.fields_by_name:
+            exit_code = result.exit_code
+        if measured:
+            response_bytes = response.ByteSize()
+            if exit_code is not None:
+                stdout_bytes = _text_bytes(result.stdout)
+                stderr_bytes = _text_bytes(result.stderr)
+
+    record = CallRecord(kind, environment,
+                        _operation_context.current_operation(), start,
+                        elapsed, request_bytes, response_bytes,
+                        stdout_bytes, stderr_bytes, exit_code, failed)
+    with _lock:
+        key = (kind, environment)
+        if key not in _histograms:
+            _histograms[key] = CallHistogram()
+        _histograms[key].add(record)
+        if _sinks:
+            _operation_calls.append(record)
+        sinks = list(_sinks)
+    for sink in sinks:
+        sink.record(record)
+
+
+def _operation_ended():
+    with _lock:
+        calls = list(_operation_calls)
+        del _operation_calls[:]
+        sinks = list(_sinks)
+    operation = _operation_context.current_operation()
+    for sink in sinks:
+        sink.operation_ended(operation, calls)
+
+
+def add_metrics_sink(sink):
+    """Registers a MetricsSink.
+
+    Args:
+        sink (MetricsSink): The sink.
+    """
+    with _lock:
+        if not _sinks:
+            #
+            # Run before the other hooks, so that the records a sink logs are
+            # flushed by buffered log handlers at the end of the same
+            # operation.
+            #
+            _operation_context.add_operation_end_hook(_operation_ended,
+                                                      first=True)
+        _sinks.append(sink)
+
+
+def remove_metrics_sink(sink):
+    """Unregisters a MetricsSink added with add_metrics_sink."""
+    with _lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+        if not _sinks:
+            _operation_context.remove_operation_end_hook(_operation_ended)
+            del _operation_calls[:]
+
+
+def call_histograms():
+    """Returns the metrics of all calls since the plugin's Python runtime
+    started or reset_metrics was called.
+
+    Returns:
+        dict of (str, str):CallHistogram: The metrics per kind of call and
+        environment reference (None for calls that do not run on an
+        environment).
+    """
+    with _lock:
+        return {key: histogram.copy()
+                for key, histogram in _histograms.items()}
+
+
+def dump_metrics_json():
+    """Returns the metrics of call_histograms as JSON: a list of objects
+    with the kind of call, the environment reference and the metrics.
+
+    Returns:
+        str: The metrics as JSON.
+    """
+    histograms = call_histograms()
+    return json.dumps(
+        [dict(histogram.to_dict(), kind=kind, environment=environment)
+         for (kind, environment), histogram in sorted(
+            histograms.items(), key=lambda item: (item[0][0],
+                                                  item[0][1] or ''))],
+        sort_keys=True)
+
+
+def reset_metrics():
+    """Discards the metrics of all calls made so far."""
+    with _lock:
+        _histograms.clear()
+        del _operation_calls[:]
@@ -0,0 +1,152 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Bounds on the command output the libs wrappers keep in memory.
+
+The Delphix Engine returns the whole stdout and stderr of a command in its
+response. With an output budget set (see set_output_budget), run_bash,
+run_bash_batch, run_powershell and run_expect replace the output of a stream
+that is larger than the budget with its head and tail as soon as the
+response arrives, and write the full output to a temporary file. The
+replaced output says where that file is. The budget only applies to results
+that are returned to plugin code: the libs helpers that parse the output of
+the commands they run, like read_file and run_bash_stream, run them without
+it.
+
+With a budget set, the stdout and stderr copied into the message of a
+PluginScriptError are also cut down to a head and tail excerpt, and their
+full text is written to a temporary file that the message points to.
+Without a budget, the message holds the whole output.
+"""
+
+import contextlib
+import os
+import tempfile
+import threading
+
+from dlpx.virtualization.libs.exceptions import IncorrectArgumentTypeError
+
+__all__ = [
+    "set_output_budget"
+]
+
+_DEFAULT_EXCERPT_SIZE = 8 * 1024
+
+#
+# Output that is at most this much longer than two excerpts is not cut down
+# for exception messages, so that the pointer to the full output of a result
+# that was already cut down is kept.
+#
+_MARKER_ALLOWANCE = 512
+
+_lock = threading.Lock()
+_max_size = None
+_excerpt_size = _DEFAULT_EXCERPT_SIZE
+_spill_directory = None
+_local = threading.local()
+
+
+def set_output_budget(max_size=None, excerpt_size=_DEFAULT_EXCERPT_SIZE,
+                      spill_directory=None):
+    """Sets how much command output the libs wrappers keep in memory.
+
+    Args:
+        max_size (int): Maximum number of characters of stdout and of stderr
+        kept in the result of a command. Larger output is written to a file
+        in spill_directory and replaced by its first and last excerpt_size
+        characters. If None, the output is kept as it is.
+        excerpt_size (int): Number of characters kept from the beginning and
+        from the end of output that is cut down, both in results and in the
+        messages of PluginScriptError.
+        spill_directory (str): Local directory for the files with the full
+        output. Defaults to the system's temporary directory. The files are
+        not removed.
+    """
+    global _max_size, _excerpt_size, _spill_directory
+
+    if max_size is not None and (not isinstance(max_size, int) or
+                                 isinstance(max_size, bool)):
+        raise IncorrectArgumentTypeError(
+            'max_size', type(max_size), int, False)
+    if not isinstance(excerpt_size, int) or isinstance(excerpt_size, bool):
+        raise IncorrectArgumentTypeError(
+            'excerpt_size', type(excerpt_size), int, False)
+    if (spill_directory is not None and
+            not isinstance(spill_directory, basestring)):
+        raise IncorrectArgumentTypeError(
+            'spill_directory', type(spill_directory), basestring, False)
+    if excerpt_size < 0 or (max_size is not None and
+                            max_size < 2 * excerpt_size):
+        raise ValueError('excerpt_size must not be negative and max_size must'
+                         ' be at least twice excerpt_size.')
+
+    with _lock:
+        _max_size = max_size
+        _excerpt_size = excerpt_size
+        _spill_directory = spill_directory
+
+
+def _excerpt(text, excerpt_size, location):
+    omitted = len(text) - 2 * excerpt_size
+    return u'{}\n... {} characters omitted{} ...\n{}'.format(
+        text[:excerpt_size], omitted, location,
+        text[len(text) - excerpt_size:])
+
+
+def _spill(name, text, directory):
+    """Writes text to a new file in directory and returns its path."""
+    descriptor, path = tempfile.mkstemp(prefix='dlpx-{}-'.format(name),
+                                        suffix='.log', dir=directory)
+    with os.fdopen(descriptor, 'wb') as spill_file:
+        spill_file.write(text.encode('utf-8')
+                         if isinstance(text, unicode) else text)
+    return path
+
+
+@contextlib.contextmanager
+def _full_output():
+    """Keeps the full output of the commands run on this thread in the
+    context, for the libs helpers that parse it."""
+    previous = getattr(_local, 'full_output', False)
+    _local.full_output = True
+    try:
+        yield
+    finally:
+        _local.full_output = previous
+
+
+def _limit_output(response):
+    """Cuts down the stdout and stderr of the result in response to the
+    output budget, spilling the full output to files."""
+    if response.HasField('return_value'):
+        _limit_result(response.return_value)
+
+
+def _limit_result(result):
+    """Cuts down the stdout and stderr of result to the output budget, unless
+    called in _full_output."""
+    with _lock:
+        max_size, excerpt_size = _max_size, _excerpt_size
+        spill_directory = _spill_directory
+    if max_size is None or getattr(_local, 'full_output', False):
+        return
+    for name in ('stdout', 'stderr'):
+        text = getattr(result, name)
+        if len(text) > max_size:
+            path = _spill(name, text, spill_directory)
+            setattr(result, name, _excerpt(
+                text, excerpt_size, ', full output in {}'.format(path)))
+
+
+def _error_excerpt(name, text):
+    """Returns text, or, with an output budget set, its head and tail if it
+    is too long to be copied into an exception message. The full text is
+    then spilled to a file."""
+    with _lock:
+        max_size, excerpt_size = _max_size, _excerpt_size
+        spill_directory = _spill_directory
+    if max_size is None or len(text) <= 2 * excerpt_size + _MARKER_ALLOWANCE:
+        return text
+    path = _spill(name, text, spill_directory)
+    return _excerpt(text, excerpt_size, ', full output in {}'.format(path))
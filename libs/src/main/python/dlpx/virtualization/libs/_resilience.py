@@ -0,0 +1,236 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Circuit breaking and retries for calls to unavailable environments.
+
+When a host is down, every call to it waits for the Delphix Engine to fail
+with a LibraryError, or until its deadline passes. Two opt-in mechanisms
+keep such hosts from using up the time of an operation:
+
+- With a circuit breaker set (see set_circuit_breaker), the libs wrappers
+  count the consecutive calls to each environment that failed with a
+  LibraryError or that the engine did not answer before their deadline
+  (see set_operation_timeout). Once there are failure_threshold of them,
+  the circuit of the environment opens and calls to it raise
+  CircuitOpenError right away, without going to the engine. After the
+  cooldown, the next call is let through as a probe while the others still
+  fail fast: if the probe succeeds the circuit closes, otherwise it opens
+  for another cooldown.
+- With retries set (see set_library_retries), calls that fail with a
+  LibraryError are made again after a random delay that grows exponentially
+  with every attempt ("full jitter"), unless the circuit of the environment
+  opened or the deadline of the call (see set_operation_timeout) would pass
+  during the delay.
+
+A LibraryError does not say whether the command ran on the environment, so
+retries should only be enabled for plugins whose commands can safely run
+again.
+"""
+
+import random
+import threading
+import time
+
+from dlpx.virtualization.libs.exceptions import (CircuitOpenError,
+                                                 IncorrectArgumentTypeError)
+
+__all__ = [
+    "set_circuit_breaker",
+    "set_library_retries",
+    "circuit_states",
+    "reset_circuits"
+]
+
+CLOSED = 'CLOSED'
+OPEN = 'OPEN'
+HALF_OPEN = 'HALF_OPEN'
+
+_DEFAULT_COOLDOWN = 30.0
+_DEFAULT_BASE_DELAY = 0.5
+_DEFAULT_MAX_DELAY = 10.0
+
+
+class _Circuit(object):
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+
+_lock = threading.Lock()
+_failure_threshold = None
+_cooldown = _DEFAULT_COOLDOWN
+_circuits = {}
+_attempts = 1
+_base_delay = _DEFAULT_BASE_DELAY
+_max_delay = _DEFAULT_MAX_DELAY
+
+
+def _is_seconds(seconds):
+    return (isinstance(seconds, (int, long, float)) and
+            not isinstance(seconds, bool))
+
+
+def _is_count(count):
+    return isinstance(count, (int, long)) and not isinstance(count, bool)
+
+
+def set_circuit_breaker(failure_threshold=None, cooldown=_DEFAULT_COOLDOWN):
+    """Sets when calls to an environment fail fast because its previous
+    calls failed.
+
+    Args:
+        failure_threshold (int): Number of consecutive calls to an
+        environment that have to fail with a LibraryError, or that the
+        engine did not answer before their deadline, for its circuit to
+        open. If None, there is no circuit breaker.
+        cooldown (float): Seconds a circuit stays open before a probe call
+        is let through.
+    """
+    global _failure_threshold, _cooldown
+
+    if failure_threshold is not None and not _is_count(failure_threshold):
+        raise IncorrectArgumentTypeError(
+            'failure_threshold', type(failure_threshold), int, False)
+    if not _is_seconds(cooldown):
+        raise IncorrectArgumentTypeError(
+            'cooldown', type(cooldown), float, False)
+    if ((failure_threshold is not None and failure_threshold < 1) or
+            cooldown < 0):
+        raise ValueError('failure_threshold must be at least 1 and cooldown'
+                         ' must not be negative.')
+
+    with _lock:
+        _failure_threshold = failure_threshold
+        _cooldown = cooldown
+        if failure_threshold is None:
+            _circuits.clear()
+
+
+def set_library_retries(attempts=1, base_delay=_DEFAULT_BASE_DELAY,
+                        max_delay=_DEFAULT_MAX_DELAY):
+    """Sets how often calls that fail with a LibraryError are made.
+
+    Before attempt n + 1 the call waits a random time between 0 and
+    min(max_delay, base_delay * 2 ** (n - 1)) seconds.
+
+    Args:
+        attempts (int): Maximum number of times a call is made. 1 disables
+        retries.
+        base_delay (float): The upper bound of the first delay in seconds.
+        max_delay (float): The largest upper bound of a delay in seconds.
+    """
+    global _attempts, _base_delay, _max_delay
+
+    if not _is_count(attempts):
+        raise IncorrectArgumentTypeError('attempts', type(attempts), int)
+    if not _is_seconds(base_delay):
+        raise IncorrectArgumentTypeError(
+            'base_delay', type(base_delay), float, False)
+    if not _is_seconds(max_delay):
+        raise IncorrectArgumentTypeError(
+            'max_delay', type(max_delay), float, False)
+    if attempts < 1 or base_delay < 0 or max_delay < 0:
+        raise ValueError('attempts must be at least 1 and the delays must not'
+                         ' be negative.')
+
+    with _lock:
+        _attempts = attempts
+        _base_delay = base_delay
+        _max_delay = max_delay
+
+
+def circuit_states():
+    """Returns the state of the circuits of the environments that calls
+    failed on.
+
+    Returns:
+        dict of str:str: CLOSED, OPEN or HALF_OPEN per environment
+        reference.
+    """
+    with _lock:
+        return {environment: circuit.state
+                for environment, circuit in _circuits.items()}
+
+
+def reset_circuits():
+    """Closes all circuits and forgets the failures counted so far."""
+    with _lock:
+        _circuits.clear()
+
+
+def _environment(request):
+    if not request.DESCRIPTOR.fields_by_name.get('remote_connection'):
+        return None
+    return request.remote_connection.environment.reference or None
+
+
+def _check(call, request):
+    """Raises CircuitOpenError if the circuit of the environment of request
+    is open. Returns the token to pass to _record once the call returned,
+    or None if the call is not tracked."""
+    environment = _environment(request)
+    with _lock:
+        if _failure_threshold is None or environment is None:
+            return None
+        circuit = _circuits.get(environment)
+        if circuit is None or circuit.state == CLOSED:
+            return environment, False
+        if circuit.state == OPEN:
+            retry_after = circuit.opened + _cooldown - time.time()
+            if retry_after > 0:
+                raise CircuitOpenError(call, environment, retry_after)
+            circuit.state = HALF_OPEN
+        if circuit.probing:
+            raise CircuitOpenError(call, environment, 0)
+        circuit.probing = True
+        return environment, True
+
+
+def _record(token, failed):
+    """Records the outcome of a call checked with _check. failed is None
+    if the call raised for another reason than the engine failing or not
+    answering in time."""
+    if token is None:
+        return
+    environment, probe = token
+    with _lock:
+        if _failure_threshold is None:
+            return
+        circuit = _circuits.get(environment)
+        if circuit is None:
+            if not failed:
+                return
+            circuit = _circuits[environment] = _Circuit()
+        if probe:
+            circuit.probing = False
+        if failed is None:
+            return
+        if not failed:
+            del _circuits[environment]
+            return
+        circuit.failures += 1
+        if probe or circuit.failures >= _failure_threshold:
+            circuit.state = OPEN
+            circuit.opened = time.time()
+
+
+def _retry_delay(attempt, limit, token):
+    """Returns the seconds to wait before making a call again that failed
+    attempt times, or None if it must not be made again. limit is the
+    deadline of the call returned by _deadline._earliest and token the one
+    returned by _check."""
+    with _lock:
+        if attempt >= _attempts:
+            return None
+        if token is not None:
+            circuit = _circuits.get(token[0])
+            if circuit is not None and circuit.state != CLOSED:
+                return None
+        delay = random.uniform(
+            0, min(_max_delay, _base_delay * 2 ** (attempt - 1)))
+    if limit is not None and time.time() + delay >= limit[0]:
+        return None
+    return delay
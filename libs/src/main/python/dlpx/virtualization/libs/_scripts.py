@@ -0,0 +1,470 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Running resource scripts that are staged on the host.
+
+Plugins usually ship their Bash and PowerShell scripts as resources and send
+the whole script with every run_bash or run_powershell call. run_bash_script
+and run_powershell_script instead keep a copy of the script on the host,
+under the host's scratch path in a file named after the SHA-256 hash of its
+content, and send only the path and the arguments of the call.
+
+Each call first tries to run the staged copy. If the file does not exist yet
+(or the scratch path was cleaned up), the script reports that with a
+reserved exit code and the call is repeated with the content of the script,
+which is then staged and run in the same call. So only the first call per
+host and script sends the script. Since the file name depends on the
+content, a changed script is staged under a new name and old copies are
+never run. Before a staged copy is run, its SHA-256 hash is checked against
+its name, and a copy that does not match (e.g. one that was cut short when
+the disk filled up) is staged again. Bash only checks it on hosts that have
+sha256sum, shasum or openssl.
+
+A call that fails to stage the script reports that with another reserved
+exit code, and raises PluginScriptError.
+
+A single environment variable can only hold a limited amount of text (128KiB
+on Linux, 32767 characters on Windows), so larger scripts are staged with
+separate calls, in chunks, before the call that runs them.
+"""
+
+import hashlib
+import uuid
+
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import RemoteConnection
+from dlpx.virtualization.libs import _files, _output, libs
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+__all__ = [
+    "run_bash_script",
+    "run_powershell_script"
+]
+
+_STAGING_DIRECTORY = 'dlpx-scripts'
+
+#
+# Exit code and stderr of a call that found no staged copy of the script.
+#
+_MISSING_EXIT_CODE = 213
+_MISSING_MARKER = '__DLPX_SCRIPT_NOT_STAGED__'
+
+#
+# Exit code and stderr of a call that failed to stage the script.
+#
+_STAGE_FAILED_EXIT_CODE = 214
+_STAGE_FAILED_MARKER = '__DLPX_SCRIPT_STAGE_FAILED__'
+
+#
+# Scripts up to this size are staged in the call that runs them. Larger Bash
+# scripts are written with write_file, and larger PowerShell scripts are
+# appended in chunks of this many characters.
+#
+_MAX_BASH_STAGE_SIZE = 64 * 1024
+_MAX_POWERSHELL_STAGE_SIZE = 16 * 1024
+
+_BASH_STAGE_FAILED = "printf '%s' \"{}\" >&2; exit {}".format(
+    _STAGE_FAILED_MARKER, _STAGE_FAILED_EXIT_CODE)
+
+#
+# Writes the script to a temporary file first and renames it, so that no
+# other call runs a partially written script.
+#
+_BASH_STAGE = '''\
+mkdir -p "$(dirname "$DLPX_SCRIPT_PATH")" || {{ {failed}; }}
+dlpx_script_tmp=$(mktemp "$DLPX_SCRIPT_PATH.XXXXXX") || {{ {failed}; }}
+printf '%s' "$DLPX_SCRIPT_CONTENT" > "$dlpx_script_tmp" &&
+    mv -f "$dlpx_script_tmp" "$DLPX_SCRIPT_PATH" || {{
+  rm -f "$dlpx_script_tmp"
+  {failed}
+}}
+unset DLPX_SCRIPT_CONTENT dlpx_script_tmp
+'''.format(failed=_BASH_STAGE_FAILED)
+
+#
+# Creates the staging directory and a temporary file to write a large script
+# to, and prints the path of that file.
+#
+_BASH_PREPARE = '''\
+mkdir -p "$(dirname "$DLPX_SCRIPT_PATH")" || exit 1
+mktemp "$DLPX_SCRIPT_PATH.XXXXXX"
+'''
+
+_BASH_MOVE = '''\
+mv -f "$DLPX_SCRIPT_TMP" "$DLPX_SCRIPT_PATH" || {{ {failed}; }}
+unset DLPX_SCRIPT_TMP
+'''.format(failed=_BASH_STAGE_FAILED)
+
+_BASH_REMOVE = 'rm -f "$DLPX_SCRIPT_TMP"\n'
+
+#
+# Removes a staged copy whose hash does not match its name, so that it is
+# reported as not staged. Hosts without any of the tools skip the check.
+#
+_BASH_VERIFY = '''\
+if [ -f "$DLPX_SCRIPT_PATH" ]; then
+  dlpx_script_sum=$( (sha256sum || shasum -a 256 || openssl dgst -sha256 -r) \\
+      < "$DLPX_SCRIPT_PATH" 2> /dev/null)
+  dlpx_script_sum=${dlpx_script_sum%% *}
+  if [ -n "$dlpx_script_sum" ] &&
+      [ "$dlpx_script_sum" != "$DLPX_SCRIPT_SHA256" ]; then
+    rm -f "$DLPX_SCRIPT_PATH"
+  fi
+  unset dlpx_script_sum
+fi
+'''
+
+_BASH_RUN = '''\
+if [ ! -f "$DLPX_SCRIPT_PATH" ]; then
+  printf '%s' "{marker}" >&2
+  exit {exit_code}
+fi
+set --
+dlpx_script_arg=0
+while [ "$dlpx_script_arg" -lt "$DLPX_SCRIPT_ARGC" ]; do
+  eval "set -- \\"\\$@\\" \\"\\$DLPX_SCRIPT_ARG_$dlpx_script_arg\\""
+  unset "DLPX_SCRIPT_ARG_$dlpx_script_arg"
+  dlpx_script_arg=$((dlpx_script_arg + 1))
+done
+dlpx_script_path=$DLPX_SCRIPT_PATH
+unset DLPX_SCRIPT_PATH DLPX_SCRIPT_SHA256 DLPX_SCRIPT_ARGC dlpx_script_arg
+exec "$BASH" "$dlpx_script_path" "$@"
+'''.format(marker=_MISSING_MARKER, exit_code=_MISSING_EXIT_CODE)
+
+_POWERSHELL_STAGE_FAILED = (
+    '[Console]::Error.Write("$_`n{}"); exit {}'.format(
+        _STAGE_FAILED_MARKER, _STAGE_FAILED_EXIT_CODE))
+
+_POWERSHELL_STAGE = '''\
+$dlpxScriptPath = $env:DLPX_SCRIPT_PATH
+$dlpxScriptTmp = "$dlpxScriptPath." + [Guid]::NewGuid()
+try {{
+  New-Item -ItemType Directory -Force -ErrorAction Stop `
+      -Path (Split-Path $dlpxScriptPath) | Out-Null
+  [IO.File]::WriteAllText($dlpxScriptTmp, $env:DLPX_SCRIPT_CONTENT)
+  Move-Item -Force -ErrorAction Stop $dlpxScriptTmp $dlpxScriptPath
+}} catch {{
+  Remove-Item -Force -ErrorAction SilentlyContinue $dlpxScriptTmp
+  {failed}
+}}
+$env:DLPX_SCRIPT_CONTENT = $null
+'''.format(failed=_POWERSHELL_STAGE_FAILED)
+
+_POWERSHELL_APPEND = '''\
+$dlpxScriptTmp = $env:DLPX_SCRIPT_TMP
+try {{
+  New-Item -ItemType Directory -Force -ErrorAction Stop `
+      -Path (Split-Path $dlpxScriptTmp) | Out-Null
+  [IO.File]::AppendAllText($dlpxScriptTmp, $env:DLPX_SCRIPT_CONTENT)
+}} catch {{
+  {failed}
+}}
+'''.format(failed=_POWERSHELL_STAGE_FAILED)
+
+_POWERSHELL_MOVE = '''\
+try {{
+  Move-Item -Force -ErrorAction Stop $env:DLPX_SCRIPT_TMP `
+      $env:DLPX_SCRIPT_PATH
+}} catch {{
+  {failed}
+}}
+$env:DLPX_SCRIPT_TMP = $null
+'''.format(failed=_POWERSHELL_STAGE_FAILED)
+
+_POWERSHELL_REMOVE = '''\
+Remove-Item -Force -ErrorAction SilentlyContinue $env:DLPX_SCRIPT_TMP
+'''
+
+_POWERSHELL_VERIFY = '''\
+if (Test-Path -PathType Leaf $env:DLPX_SCRIPT_PATH) {
+  $dlpxScriptSha256 = [BitConverter]::ToString(
+      [Security.Cryptography.SHA256]::Create().ComputeHash(
+          [IO.File]::ReadAllBytes($env:DLPX_SCRIPT_PATH))).Replace('-', '')
+  if ($dlpxScriptSha256 -ne $env:DLPX_SCRIPT_SHA256) {
+    Remove-Item -Force -ErrorAction SilentlyContinue $env:DLPX_SCRIPT_PATH
+  }
+}
+'''
+
+#
+# The script is run as a script block rather than by path so that the
+# execution policy of the host does not apply, like for commands sent with
+# run_powershell.
+#
+_POWERSHELL_RUN = '''\
+if (-not (Test-Path -PathType Leaf $env:DLPX_SCRIPT_PATH)) {{
+  [Console]::Error.Write("{marker}")
+  exit {exit_code}
+}}
+$dlpxScriptArgs = @()
+for ($i = 0; $i -lt [int]$env:DLPX_SCRIPT_ARGC; $i++) {{
+  $dlpxScriptArgs += [Environment]::GetEnvironmentVariable(
+      "DLPX_SCRIPT_ARG_$i")
+}}
+$dlpxScript = [ScriptBlock]::Create(
+    [IO.File]::ReadAllText($env:DLPX_SCRIPT_PATH))
+& $dlpxScript @dlpxScriptArgs
+exit $LASTEXITCODE
+'''.format(marker=_MISSING_MARKER, exit_code=_MISSING_EXIT_CODE)
+
+
+def _script_variables(args, variables, path, sha256):
+    script_variables = dict(variables)
+    script_variables['DLPX_SCRIPT_PATH'] = path
+    script_variables['DLPX_SCRIPT_SHA256'] = sha256
+    script_variables['DLPX_SCRIPT_ARGC'] = str(len(args))
+    for index, arg in enumerate(args):
+        script_variables['DLPX_SCRIPT_ARG_{}'.format(index)] = arg
+    return script_variables
+
+
+def _utf8(script):
+    if isinstance(script, unicode):
+        return script.encode('utf-8')
+    return script
+
+
+def _sha256(script):
+    return hashlib.sha256(_utf8(script)).hexdigest()
+
+
+def _reported(result, exit_code, marker):
+    #
+    # Other output may come before the marker, e.g. from the profile of a
+    # login shell or the error that made staging fail.
+    #
+    return (result.exit_code == exit_code and
+            result.stderr.rstrip().endswith(marker))
+
+
+def _not_staged(result):
+    return _reported(result, _MISSING_EXIT_CODE, _MISSING_MARKER)
+
+
+def _stage_failed(result):
+    return _reported(result, _STAGE_FAILED_EXIT_CODE, _STAGE_FAILED_MARKER)
+
+
+def _staging_error(path, result):
+    return PluginScriptError('Failed to stage the script {} with exit code'
+                             ' {}. stdout : {} and '
+                             ' stderr : {}'.format(path, result.exit_code,
+                                                   result.stdout,
+                                                   result.stderr))
+
+
+def _stage_bash_in_chunks(remote_connection, script, path):
+    """Writes script to a temporary file next to path and returns the path
+    of that file."""
+    result = libs._run_bash_full_output(remote_connection, _BASH_PREPARE,
+                                        {'DLPX_SCRIPT_PATH': path})
+    if result.exit_code != 0:
+        raise _staging_error(path, result)
+    tmp = result.stdout.strip()
+    try:
+        _files.write_file(remote_connection, tmp, script)
+    except Exception:
+        libs._run_bash_full_output(remote_connection, _BASH_REMOVE,
+                                   {'DLPX_SCRIPT_TMP': tmp})
+        raise
+    return tmp
+
+
+def _stage_powershell_in_chunks(remote_connection, script, path):
+    """Writes script to a temporary file next to path and returns the path
+    of that file."""
+    if isinstance(script, str):
+        script = script.decode('utf-8')
+    tmp = '{}.{}'.format(path, uuid.uuid4().hex)
+    for start in range(0, len(script), _MAX_POWERSHELL_STAGE_SIZE):
+        result = libs._run_powershell_full_output(
+            remote_connection, _POWERSHELL_APPEND,
+            {'DLPX_SCRIPT_TMP': tmp,
+             'DLPX_SCRIPT_CONTENT':
+                 script[start:start + _MAX_POWERSHELL_STAGE_SIZE]})
+        if _stage_failed(result) or result.exit_code != 0:
+            libs._run_powershell_full_output(remote_connection,
+                                             _POWERSHELL_REMOVE,
+                                             {'DLPX_SCRIPT_TMP': tmp})
+            raise _staging_error(path, result)
+    return tmp
+
+
+def _check(result, response_class, check):
+    #
+    # The scripts run with their full output, so that _not_staged sees all of
+    # stderr. The output budget applies to the result returned to the plugin.
+    #
+    _output._limit_result(result)
+    response = response_class()
+    response.return_value.CopyFrom(result)
+    libs._check_exit_code(response, check)
+    return result
+
+
+def run_bash_script(remote_connection, script, args=None, variables=None,
+                    use_login_shell=False, check=False):
+    """Runs a Bash script that is staged on a remote Unix environment.
+
+    The script is copied to the host's scratch path on the first call, and
+    later calls with the same script only send its arguments. The script runs
+    in a new Bash process, with args as its positional parameters.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        script (str): Bash script to run.
+        args (list of str): Arguments to pass to the script.
+        variables (dict of str:str): Environment variables to set before
+        running the script.
+        use_login_shell (bool): Whether to use login shell.
+        check (bool): if True and non-zero exitcode is received, raise
+        PluginScriptError
+
+    Returns:
+        RunBashResult: The return value of the script.
+    """
+    if args is None:
+        args = []
+    if variables is None:
+        variables = {}
+
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(script, basestring):
+        raise IncorrectArgumentTypeError('script', type(script), basestring)
+    if args and not isinstance(args, list):
+        raise IncorrectArgumentTypeError(
+            'args', type(args), [basestring], False)
+    if args and not all(isinstance(arg, basestring) for arg in args):
+        raise IncorrectArgumentTypeError(
+            'args', [type(arg) for arg in args], [basestring], False)
+    if variables and not isinstance(variables, dict):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            type(variables),
+            {basestring: basestring},
+            False)
+    if (variables and (not all(isinstance(variable, basestring)
+                               for variable in variables.keys()) or
+                       not all(isinstance(value, basestring)
+                               for value in variables.values()))):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            {(type(variable), type(value))
+             for variable, value in variables.items()},
+            {basestring: basestring},
+            False)
+    if use_login_shell and not isinstance(use_login_shell, bool):
+        raise IncorrectArgumentTypeError(
+            'use_login_shell', type(use_login_shell), bool, False)
+
+    sha256 = _sha256(script)
+    path = '/'.join([remote_connection.environment.host.scratch_path,
+                     _STAGING_DIRECTORY, sha256 + '.sh'])
+    script_variables = _script_variables(args, variables, path, sha256)
+
+    result = libs._run_bash_full_output(remote_connection,
+                                        _BASH_VERIFY + _BASH_RUN,
+                                        script_variables, use_login_shell)
+    if _not_staged(result):
+        stage = _BASH_STAGE
+        if len(_utf8(script)) > _MAX_BASH_STAGE_SIZE:
+            script_variables['DLPX_SCRIPT_TMP'] = _stage_bash_in_chunks(
+                remote_connection, script, path)
+            stage = _BASH_MOVE
+        else:
+            script_variables['DLPX_SCRIPT_CONTENT'] = script
+        result = libs._run_bash_full_output(remote_connection,
+                                            stage + _BASH_RUN,
+                                            script_variables, use_login_shell)
+        if _stage_failed(result):
+            raise _staging_error(path, result)
+    return _check(result, libs_pb2.RunBashResponse, check)
+
+
+def run_powershell_script(remote_connection, script, args=None,
+                          variables=None, check=False):
+    """Runs a PowerShell script that is staged on a remote Windows
+    environment.
+
+    The script is copied to the host's scratch path on the first call, and
+    later calls with the same script only send its arguments. The script runs
+    as a script block with args as its arguments.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        script (str): PowerShell script to run.
+        args (list of str): Arguments to pass to the script.
+        variables (dict of str:str): Environment variables to set before
+        running the script.
+        check (bool): if True and non-zero exitcode is received, raise
+        PluginScriptError
+
+    Returns:
+        RunPowerShellResult: The return value of the script.
+    """
+    if args is None:
+        args = []
+    if variables is None:
+        variables = {}
+
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(script, basestring):
+        raise IncorrectArgumentTypeError('script', type(script), basestring)
+    if args and not isinstance(args, list):
+        raise IncorrectArgumentTypeError(
+            'args', type(args), [basestring], False)
+    if args and not all(isinstance(arg, basestring) for arg in args):
+        raise IncorrectArgumentTypeError(
+            'args', [type(arg) for arg in args], [basestring], False)
+    if variables and not isinstance(variables, dict):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            type(variables),
+            {basestring: basestring},
+            False)
+    if (variables and (not all(isinstance(variable, basestring)
+                               for variable in variables.keys()) or
+                       not all(isinstance(value, basestring)
+                               for value in variables.values()))):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            {(type(variable), type(value))
+             for variable, value in variables.items()},
+            {basestring: basestring},
+            False)
+
+    sha256 = _sha256(script)
+    path = '\\'.join([remote_connection.environment.host.scratch_path,
+                      _STAGING_DIRECTORY, sha256 + '.ps1'])
+    script_variables = _script_variables(args, variables, path, sha256)
+
+    result = libs._run_powershell_full_output(
+        remote_connection, _POWERSHELL_VERIFY + _POWERSHELL_RUN,
+        script_variables)
+    if _not_staged(result):
+        stage = _POWERSHELL_STAGE
+        if len(script) > _MAX_POWERSHELL_STAGE_SIZE:
+            script_variables['DLPX_SCRIPT_TMP'] = (
+                _stage_powershell_in_chunks(remote_connection, script, path))
+            stage = _POWERSHELL_MOVE
+        else:
+            script_variables['DLPX_SCRIPT_CONTENT'] = script
+        result = libs._run_powershell_full_output(
+            remote_connection, stage + _POWERSHELL_RUN, script_variables)
+        if _stage_failed(result):
+            raise _staging_error(path, result)
+    return _check(result, libs_pb2.RunPowerShellResponse, check)
@@ -0,0 +1,225 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Shell sessions that keep their state across run_bash calls.
+
+Every run_bash call runs in a new shell on the environment, so a plugin that
+needs a login shell pays for sourcing the profile on every call, and
+variables or the working directory set by one call are gone in the next.
+The Virtualization Libs API cannot keep a shell alive between calls, so a
+BashSession keeps the state of the shell instead: the exported variables,
+the shell functions and the working directory are saved to a temporary
+directory under the host's scratch path after every command and restored
+before the next one. The login shell, if requested, only runs once, when
+the session starts.
+
+Shell variables that are not exported, aliases and shell options are not
+kept.
+"""
+
+import re
+
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import RemoteConnection
+from dlpx.virtualization.libs import libs
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+__all__ = [
+    "bash_session"
+]
+
+#
+# Saves the state of the shell. Runs when the shell exits, so the state is
+# also saved if the command calls exit.
+#
+_SAVE_STATE = '''\
+_dlpx_session_save() {
+  { export -p; declare -f; } > "$_dlpx_session_dir/state"
+  printf '%s' "$PWD" > "$_dlpx_session_dir/cwd"
+}
+trap _dlpx_session_save EXIT
+'''
+
+_START_SCRIPT = '''\
+_dlpx_session_dir=$(mktemp -d \\
+    "$DLPX_SESSION_SCRATCH_PATH/dlpx-session.XXXXXX") || exit 1
+unset DLPX_SESSION_SCRATCH_PATH
+''' + _SAVE_STATE + '''\
+printf '\\n%s' "$_dlpx_session_dir"
+'''
+
+#
+# Restores the saved state, then sets the variables of this command (which
+# are passed with a prefix so that the saved state does not overwrite them)
+# and runs the command in the current shell.
+#
+_RUN_SCRIPT = '''\
+_dlpx_session_dir=$DLPX_SESSION_DIRECTORY
+_dlpx_session_command=$DLPX_SESSION_COMMAND
+_dlpx_session_variables=$DLPX_SESSION_VARIABLES
+unset DLPX_SESSION_DIRECTORY DLPX_SESSION_COMMAND DLPX_SESSION_VARIABLES
+. "$_dlpx_session_dir/state" 2> /dev/null
+cd "$(cat "$_dlpx_session_dir/cwd")"
+for _dlpx_session_name in $_dlpx_session_variables; do
+  eval "export $_dlpx_session_name=\\"\\$DLPX_SESSION_VARIABLE_$_dlpx_session_name\\""
+  unset "DLPX_SESSION_VARIABLE_$_dlpx_session_name"
+done
+unset _dlpx_session_name _dlpx_session_variables
+''' + _SAVE_STATE + '''\
+eval "$_dlpx_session_command"
+'''
+
+_CLOSE_SCRIPT = 'rm -rf "$DLPX_SESSION_DIRECTORY"\n'
+
+_VARIABLE_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class BashSession(object):
+    """A sequence of Bash commands on a remote Unix environment that share
+    their exported variables, shell functions and working directory, as if
+    they ran in the same shell. Created by bash_session.
+
+    A session must not be used by several threads at the same time.
+
+    Attributes:
+        exit_codes (list of int): The exit code of every command run so far,
+        in order.
+    """
+    def __init__(self, remote_connection, directory):
+        self._remote_connection = remote_connection
+        self._directory = directory
+        self.exit_codes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._directory is None
+
+    def run(self, command, variables=None, check=False):
+        """Runs a command in the session.
+
+        Args:
+            command (str): Bash command to run.
+            variables (dict of str:str): Environment variables to export
+            before running the command. Like variables the command exports,
+            they are kept for the commands that follow.
+            check (bool): if True and non-zero exitcode is received, raise
+            PluginScriptError
+
+        Returns:
+            RunBashResult: The return value of the command.
+        """
+        if variables is None:
+            variables = {}
+
+        # Validate all the arguments passed in are the right types based on docs.
+        if not isinstance(command, basestring):
+            raise IncorrectArgumentTypeError(
+                'command', type(command), basestring)
+        if variables and not isinstance(variables, dict):
+            raise IncorrectArgumentTypeError(
+                'variables',
+                type(variables),
+                {basestring: basestring},
+                False)
+        if (variables and (not all(isinstance(variable, basestring)
+                                   for variable in variables.keys()) or
+                           not all(isinstance(value, basestring)
+                                   for value in variables.values()))):
+            raise IncorrectArgumentTypeError(
+                'variables',
+                {(type(variable), type(value))
+                 for variable, value in variables.items()},
+                {basestring: basestring},
+                False)
+        invalid = [name for name in variables
+                   if not _VARIABLE_NAME.match(name)]
+        if invalid:
+            raise ValueError('Invalid environment variable names: {}'.format(
+                ', '.join(sorted(invalid))))
+        if self.closed:
+            raise RuntimeError('The shell session is closed.')
+
+        run_variables = {'DLPX_SESSION_VARIABLE_{}'.format(name): value
+                         for name, value in variables.items()}
+        run_variables.update({
+            'DLPX_SESSION_DIRECTORY': self._directory,
+            'DLPX_SESSION_COMMAND': command,
+            'DLPX_SESSION_VARIABLES': ' '.join(sorted(variables))})
+        result = libs.run_bash(self._remote_connection, _RUN_SCRIPT,
+                               run_variables)
+        self.exit_codes.append(result.exit_code)
+
+        response = libs_pb2.RunBashResponse()
+        response.return_value.CopyFrom(result)
+        libs._check_exit_code(response, check)
+        return result
+
+    def close(self):
+        """Removes the saved state of the session from the environment.
+        Closing a closed session does nothing."""
+        if self.closed:
+            return
+        directory, self._directory = self._directory, None
+        libs._run_bash_full_output(self._remote_connection, _CLOSE_SCRIPT,
+                                   {'DLPX_SESSION_DIRECTORY': directory})
+
+
+def bash_session(remote_connection, use_login_shell=False):
+    """Starts a shell session on a remote Unix environment.
+
+    Commands run with the run method of the returned session see the
+    variables that earlier commands exported, their shell functions and
+    their working directory. The first command starts in the home directory
+    of the environment user. If use_login_shell is True, the login shell
+    runs once, when the session starts, and its environment is kept for all
+    commands.
+
+    The session saves its state in a temporary directory under the host's
+    scratch path. Use it as a context manager, or call close, to remove it:
+
+        with libs.bash_session(connection, use_login_shell=True) as session:
+            session.run('cd /opt/app && export APP_HOME=$PWD', check=True)
+            result = session.run('./bin/version')
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        use_login_shell (bool): Whether to start the session with a login
+        shell.
+
+    Returns:
+        BashSession: The session.
+    """
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if use_login_shell and not isinstance(use_login_shell, bool):
+        raise IncorrectArgumentTypeError(
+            'use_login_shell', type(use_login_shell), bool, False)
+
+    result = libs._run_bash_full_output(
+        remote_connection, _START_SCRIPT,
+        {'DLPX_SESSION_SCRATCH_PATH':
+            remote_connection.environment.host.scratch_path},
+        use_login_shell)
+    if result.exit_code != 0:
+        raise PluginScriptError('Failed to start the shell session with exit'
+                                ' code {}. stdout : {} and '
+                                ' stderr : {}'.format(result.exit_code,
+                                                      result.stdout,
+                                                      result.stderr))
+    #
+    # The directory is on the last line, after anything the profile printed.
+    #
+    return BashSession(remote_connection, result.stdout.rpartition('\n')[2])
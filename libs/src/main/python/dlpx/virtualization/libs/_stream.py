@@ -0,0 +1,299 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Streaming output of long-running remote commands.
+
+The Virtualization Libs API returns the output of a command only once it has
+finished. run_bash_stream works around that on top of run_bash: it starts the
+command in the background on the remote host with its stdout and stderr
+redirected to files under the host's scratch path, and then reads the lines
+that were added to those files with a short run_bash call every poll
+interval. Only complete lines are returned while the command is running, so
+memory use on the plugin side is bounded by the page size rather than by the
+total output of the command.
+"""
+
+import collections
+import time
+
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import RemoteConnection
+from dlpx.virtualization.libs import libs
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+__all__ = [
+    "run_bash_stream"
+]
+
+#
+# Starts the command in the background and prints the directory that holds
+# its output. The exit code is written to a temporary file first and renamed,
+# so that a poll never sees a partially written exit code.
+#
+_START_SCRIPT = '''\
+dir=$(mktemp -d "$DLPX_STREAM_SCRATCH_PATH/dlpx-stream.XXXXXX") || exit 1
+(
+  "$BASH" $DLPX_STREAM_SHELL_OPTIONS -c "$DLPX_STREAM_COMMAND" \\
+      > "$dir/stdout" 2> "$dir/stderr" < /dev/null &
+  echo $! > "$dir/pid"
+  wait $!
+  echo $? > "$dir/exit_code.tmp"
+  mv "$dir/exit_code.tmp" "$dir/exit_code"
+) > /dev/null 2>&1 < /dev/null &
+printf '%s' "$dir"
+'''
+
+#
+# Prints the state of the command on the first line of stdout, followed by
+# up to DLPX_STREAM_MAX_LINES lines of stdout from the byte offset that was
+# read up to. The stderr lines go to stderr. The first line also holds the
+# size in bytes of the complete lines of each page, by which the offsets
+# advance. tail seeks to the offset, so a poll only reads the new output.
+# The exit code is checked before reading the output so that the output
+# read after the command finished is complete.
+#
+_POLL_SCRIPT = '''\
+dir="$DLPX_STREAM_DIRECTORY"
+if [ -f "$dir/exit_code" ]; then
+  printf 'done %s' "$(cat "$dir/exit_code")"
+else
+  printf 'running'
+fi
+page() {
+  tail -c +$(($2 + 1)) "$dir/$1" |
+      head -n "$DLPX_STREAM_MAX_LINES" > "$dir/$1.page"
+  lines=$(($(wc -l < "$dir/$1.page")))
+  printf ' %s' $(($(head -n "$lines" "$dir/$1.page" | wc -c)))
+}
+page stdout "$DLPX_STREAM_STDOUT_OFFSET"
+page stderr "$DLPX_STREAM_STDERR_OFFSET"
+printf '\\n'
+cat "$dir/stdout.page"
+cat "$dir/stderr.page" >&2
+rm -f "$dir/stdout.page" "$dir/stderr.page"
+'''
+
+_CLEANUP_SCRIPT = '''\
+dir="$DLPX_STREAM_DIRECTORY"
+if [ ! -f "$dir/exit_code" ] && [ -f "$dir/pid" ]; then
+  kill "$(cat "$dir/pid")"
+fi
+rm -rf "$dir"
+'''
+
+_STDOUT = 'stdout'
+_STDERR = 'stderr'
+
+#
+# How many of the last lines of each stream are kept to build the
+# PluginScriptError message when check is True.
+#
+_ERROR_TAIL_LINES = 20
+
+
+def _split_lines(text):
+    """Splits text after every newline, keeping the newlines. Unlike
+    splitlines, this only splits on the newlines that head counts lines by."""
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def _encode(text):
+    if isinstance(text, unicode):
+        return text.encode('utf-8')
+    return text
+
+
+class BashOutputStream(object):
+    """The output of a command started by run_bash_stream.
+
+    Iterating over this object yields (stream, line) tuples while the command
+    runs, where stream is either 'stdout' or 'stderr' and line is a line of
+    output including its trailing newline (the last line of a stream may not
+    have one). Lines of each stream are yielded in order, but stdout and
+    stderr lines are not interleaved the way the command wrote them.
+
+    Once the iteration is over, exit_code holds the exit code of the command.
+    If the iteration is stopped early, the remote command is killed and its
+    output is removed.
+
+    Attributes:
+        exit_code (int): The exit code of the command, None while it runs.
+    """
+    def __init__(self, remote_connection, directory, check, poll_interval,
+                 max_lines):
+        self._remote_connection = remote_connection
+        self._directory = directory
+        self._check = check
+        self._poll_interval = poll_interval
+        self._max_lines = max_lines
+        self._iterated = False
+        self.exit_code = None
+
+    def __iter__(self):
+        if self._iterated:
+            raise RuntimeError('The output of a command can only be read'
+                               ' once.')
+        self._iterated = True
+
+        offsets = {_STDOUT: 0, _STDERR: 0}
+        tails = {_STDOUT: collections.deque(maxlen=_ERROR_TAIL_LINES),
+                 _STDERR: collections.deque(maxlen=_ERROR_TAIL_LINES)}
+        try:
+            while True:
+                exit_code, pages = self._poll(offsets)
+                full_page = False
+                for stream in (_STDOUT, _STDERR):
+                    size, lines = pages[stream]
+                    complete = lines
+                    if lines and not lines[-1].endswith('\n'):
+                        complete = lines[:-1]
+                    full_page = full_page or len(complete) == self._max_lines
+                    #
+                    # The last line may still be written to while the command
+                    # runs. The offset stops at its start, so it is read again
+                    # on the next poll.
+                    #
+                    if exit_code is None:
+                        lines = complete
+                    elif lines is not complete:
+                        #
+                        # Another stream may still have a full page to read,
+                        # so skip past the last line yielded here.
+                        #
+                        size += len(_encode(lines[-1]))
+                    offsets[stream] += size
+                    tails[stream].extend(lines)
+                    for line in lines:
+                        yield stream, line
+
+                if exit_code is not None and not full_page:
+                    self.exit_code = exit_code
+                    break
+                if not full_page:
+                    time.sleep(self._poll_interval)
+        finally:
+            self._cleanup()
+
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = self.exit_code
+        response.return_value.stdout = ''.join(tails[_STDOUT])
+        response.return_value.stderr = ''.join(tails[_STDERR])
+        libs._check_exit_code(response, self._check)
+
+    def _poll(self, offsets):
+        variables = {'DLPX_STREAM_DIRECTORY': self._directory,
+                     'DLPX_STREAM_MAX_LINES': str(self._max_lines)}
+        for stream in (_STDOUT, _STDERR):
+            variables['DLPX_STREAM_{}_OFFSET'.format(stream.upper())] = str(
+                offsets[stream])
+        result = libs._run_bash_full_output(self._remote_connection,
+                                            _POLL_SCRIPT, variables,
+                                            check=True)
+
+        state, _, stdout = result.stdout.partition('\n')
+        fields = state.split()
+        exit_code = None
+        if fields[0] == 'done':
+            exit_code = int(fields[1])
+        stdout_size, stderr_size = (int(field) for field in fields[-2:])
+        pages = {_STDOUT: (stdout_size, _split_lines(stdout)),
+                 _STDERR: (stderr_size, _split_lines(result.stderr))}
+        return exit_code, pages
+
+    def _cleanup(self):
+        libs._run_bash_full_output(
+            self._remote_connection, _CLEANUP_SCRIPT,
+            {'DLPX_STREAM_DIRECTORY': self._directory})
+
+
+def run_bash_stream(remote_connection, command, variables=None,
+                    use_login_shell=False, check=False, poll_interval=1.0,
+                    max_lines=10000):
+    """Streaming run_bash operation wrapper.
+
+    The run_bash_stream function starts a shell command or script on a remote
+    Unix environment and returns its output line by line while the command is
+    still running, instead of buffering all of it until the command finishes.
+    The command runs in the background on the environment and writes its
+    output to a temporary directory under the host's scratch path, which is
+    removed once the output has been read.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        command (str): Bash command to run.
+        variables (dict of str:str): Environment variables to set before
+        running the command.
+        use_login_shell (bool): Whether to use login shell.
+        check (bool): if True and non-zero exitcode is received, raise
+        PluginScriptError at the end of the iteration
+        poll_interval (float): Seconds to wait between checks for new output.
+        max_lines (int): Maximum number of lines of each stream to read per
+        check.
+
+    Returns:
+        BashOutputStream: An iterable over the (stream, line) tuples of the
+        output of the command.
+    """
+    if variables is None:
+        variables = {}
+
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(command, basestring):
+        raise IncorrectArgumentTypeError('command', type(command), basestring)
+    if variables and not isinstance(variables, dict):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            type(variables),
+            {basestring: basestring},
+            False)
+    if (variables and (not all(isinstance(variable, basestring)
+                               for variable in variables.keys()) or
+                       not all(isinstance(value, basestring)
+                               for value in variables.values()))):
+        raise IncorrectArgumentTypeError(
+            'variables',
+            {(type(variable), type(value))
+             for variable, value in variables.items()},
+            {basestring: basestring},
+            False)
+    if use_login_shell and not isinstance(use_login_shell, bool):
+        raise IncorrectArgumentTypeError(
+            'use_login_shell', type(use_login_shell), bool, False)
+    if not isinstance(poll_interval, (int, float)):
+        raise IncorrectArgumentTypeError(
+            'poll_interval', type(poll_interval), float, False)
+    if not isinstance(max_lines, int):
+        raise IncorrectArgumentTypeError(
+            'max_lines', type(max_lines), int, False)
+    if poll_interval <= 0:
+        raise ValueError('poll_interval must be positive.')
+    if max_lines < 1:
+        raise ValueError('max_lines must be at least 1.')
+
+    start_variables = dict(variables)
+    start_variables.update({
+        'DLPX_STREAM_COMMAND': command,
+        'DLPX_STREAM_SCRATCH_PATH':
+            remote_connection.environment.host.scratch_path,
+        'DLPX_STREAM_SHELL_OPTIONS': '-l' if use_login_shell else ''})
+    result = libs._run_bash_full_output(remote_connection, _START_SCRIPT,
+                                        start_variables)
+    if result.exit_code != 0:
+        raise PluginScriptError('Failed to start the script with exit code {}.'
+                                ' stdout : {} and '
+                                ' stderr : {}'.format(result.exit_code,
+                                                      result.stdout,
+                                                      result.stderr))
+
+    return BashOutputStream(remote_connection, result.stdout, check,
+                            poll_interval, max_lines)
@@ -0,0 +1,317 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Partitioned run_sync for large source directories.
+
+The Virtualization Libs API syncs a source directory as a single rsync
+stream. run_sync_partitioned splits the top-level entries of the directory
+into disjoint partitions and syncs them with concurrent run_sync calls.
+
+Every call syncs the same source directory, so the files keep their place in
+the dSource, but excludes the top-level entries of all other partitions with
+patterns anchored at the source directory. The caller's exclude_paths and
+sym_links_to_follow are passed to every call unchanged.
+
+The calls run on a pool of their own, not on the pool of the asynchronous
+library wrappers: the caller may itself run on that pool, and would wait
+forever for partitions queued behind it. The pool also limits how many
+rsyncs run at once, over all partitioned syncs, into the same dSource.
+
+With a progress callback, the reports count the bytes and files of every
+partition that was synced (see _sync_progress).
+"""
+
+import re
+import time
+import types
+
+from dlpx.virtualization.common._common_classes import RemoteConnection
+from dlpx.virtualization.libs import (_deadline, _futures, _sync_progress,
+                                      libs)
+from dlpx.virtualization.libs.exceptions import (FutureCancelledError,
+                                                 IncorrectArgumentTypeError,
+                                                 PartitionedSyncError,
+                                                 PluginScriptError)
+
+__all__ = [
+    "run_sync_partitioned",
+    "SyncPartitionResult"
+]
+
+#
+# How many partitions are synced at the same time, over all calls of
+# run_sync_partitioned.
+#
+_MAX_SYNC_WORKERS = 8
+
+_executor = _futures._Executor(_MAX_SYNC_WORKERS)
+
+#
+# Prints the top-level entries of the source directory, including hidden
+# ones, each followed by a NUL byte.
+#
+_LIST_SCRIPT = '''\
+cd "$DLPX_SYNC_SOURCE_DIRECTORY" || exit 1
+for entry in * .[!.]* ..?*; do
+  if [ -e "$entry" ] || [ -h "$entry" ]; then
+    printf '%s\\0' "$entry"
+  fi
+done
+'''
+
+_WILDCARD = re.compile(r'[*?[]')
+_ESCAPE = re.compile(r'([*?[\\])')
+
+
+class SyncPartitionResult(object):
+    """The outcome of syncing one partition with run_sync_partitioned.
+
+    Attributes:
+        entries (list of str): The top-level entries of the source directory
+        in this partition.
+        elapsed (float): Seconds the run_sync call of this partition took.
+        error (Exception): The exception raised by the run_sync call, or None
+        if it succeeded.
+    """
+    def __init__(self, entries, elapsed, error):
+        self.entries = entries
+        self.elapsed = elapsed
+        self.error = error
+
+
+def _exclude_pattern(entry):
+    """Returns the rsync exclude pattern that matches only the top-level
+    entry. rsync only treats a backslash as an escape character in patterns
+    that contain wildcards."""
+    if _WILDCARD.search(entry):
+        entry = _ESCAPE.sub(r'\\\1', entry)
+    return '/' + entry
+
+
+def _list_entries(remote_connection, source_directory):
+    result = libs._run_bash_full_output(
+        remote_connection, _LIST_SCRIPT,
+        {'DLPX_SYNC_SOURCE_DIRECTORY': source_directory})
+    if result.exit_code != 0:
+        raise PluginScriptError('Failed to list {} with exit code {}.'
+                                ' stdout : {} and '
+                                ' stderr : {}'.format(source_directory,
+                                                      result.exit_code,
+                                                      result.stdout,
+                                                      result.stderr))
+    return sorted(entry for entry in result.stdout.split('\0') if entry)
+
+
+def _partition_entries(entries, max_partitions, partitions):
+    """Splits the entries into disjoint partitions. Entries that are not in
+    any of the given partitions form one more partition, or are spread
+    round-robin over max_partitions if no partitions are given."""
+    assigned = set(entry for partition in partitions for entry in partition)
+    remaining = [entry for entry in entries if entry not in assigned]
+    result = [list(partition) for partition in partitions if partition]
+    if partitions:
+        if remaining:
+            result.append(remaining)
+    else:
+        count = min(max_partitions, len(remaining))
+        result.extend(remaining[i::count] for i in range(count))
+    return result
+
+
+def _sync_partition(remote_connection, source_directory, rsync_user,
+                    exclude_paths, sym_links_to_follow, entries,
+                    other_entries):
+    excludes = list(exclude_paths or [])
+    excludes.extend(_exclude_pattern(entry) for entry in other_entries)
+
+    start = time.time()
+    error = None
+    try:
+        libs.run_sync(remote_connection, source_directory, rsync_user,
+                      excludes, sym_links_to_follow)
+    except Exception as e:
+        error = e
+    return SyncPartitionResult(entries, time.time() - start, error)
+
+
+def run_sync_partitioned(remote_connection, source_directory, rsync_user=None,
+                         exclude_paths=None, sym_links_to_follow=None,
+                         max_partitions=4, partitions=None, progress=None,
+                         progress_interval=30):
+    """Partitioned run_sync operation wrapper.
+
+    Copies files from the remote source host directly into the dSource like
+    run_sync, but splits the top-level entries of source_directory into
+    disjoint partitions and syncs them with concurrent run_sync calls. All
+    partitions are synced into the same dSource, each into its own top-level
+    entries. At most 8 partitions, of all partitioned syncs that run, are
+    synced at the same time. The partitions are synced under the deadlines of
+    the caller; those that have not started when a deadline passes fail with
+    a FutureCancelledError.
+
+    The top-level entries are listed as the environment user of
+    remote_connection. Entries created after they were listed are synced by
+    every partition. Only partition a directory that does not change while it
+    is synced.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        source_directory (str): Directory of files to be synced.
+        rsync_user (str): User who has access to the directory to be synced.
+        exclude_paths (list of str): Paths to be excluded.
+        sym_links_to_follow (list of str): Sym links to follow if any.
+        max_partitions (int): Number of partitions to spread the top-level
+        entries over round-robin. Ignored if partitions is given.
+        partitions (list of list of str): Top-level entry names of
+        source_directory to sync together, e.g. to balance partitions by size.
+        The top-level entries that are not listed are synced as one more
+        partition. An entry may only be listed once.
+        progress (function): Called with a SyncProgress every
+        progress_interval seconds while the partitions are synced, and once
+        they all ended, e.g. a SyncProgressLogger.
+        progress_interval (float): Seconds between the progress reports. If
+        None, only the final report is made.
+
+    Returns:
+        list of SyncPartitionResult: The entries and timing of every
+        partition.
+
+    Raises:
+        PartitionedSyncError: Syncing one or more partitions failed. The
+        results of all partitions are in its results attribute.
+    """
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(source_directory, basestring):
+        raise IncorrectArgumentTypeError(
+            'source_directory', type(source_directory), basestring)
+    if rsync_user and not isinstance(rsync_user, basestring):
+        raise IncorrectArgumentTypeError(
+            'rsync_user',
+            type(rsync_user),
+            basestring,
+            False)
+    if exclude_paths and not isinstance(exclude_paths, list):
+        raise IncorrectArgumentTypeError(
+            'exclude_paths',
+            type(exclude_paths),
+            [basestring],
+            False)
+    if (exclude_paths and not all(isinstance(
+            path, basestring) for path in exclude_paths)):
+        raise IncorrectArgumentTypeError(
+            'exclude_paths',
+            [type(path) for path in exclude_paths],
+            [basestring],
+            False)
+    if sym_links_to_follow and not isinstance(sym_links_to_follow, list):
+        raise IncorrectArgumentTypeError(
+            'sym_links_to_follow',
+            type(sym_links_to_follow),
+            [basestring],
+            False)
+    if (sym_links_to_follow and not all(isinstance(link, basestring)
+                                        for link in sym_links_to_follow)):
+        raise IncorrectArgumentTypeError(
+            'sym_links_to_follow',
+            [type(link) for link in sym_links_to_follow],
+            [basestring],
+            False)
+    if (not isinstance(max_partitions, int) or
+            isinstance(max_partitions, bool)):
+        raise IncorrectArgumentTypeError(
+            'max_partitions', type(max_partitions), int, False)
+    if partitions and not isinstance(partitions, list):
+        raise IncorrectArgumentTypeError(
+            'partitions', type(partitions), [list], False)
+    if partitions and not all(
+            isinstance(partition, list) and
+            all(isinstance(entry, basestring) for entry in partition)
+            for partition in partitions):
+        raise IncorrectArgumentTypeError(
+            'partitions',
+            [type(partition) for partition in partitions],
+            [list],
+            False)
+    if progress is not None and not callable(progress):
+        raise IncorrectArgumentTypeError(
+            'progress', type(progress), types.FunctionType, False)
+    if progress_interval is not None and (
+            not isinstance(progress_interval, (int, long, float)) or
+            isinstance(progress_interval, bool)):
+        raise IncorrectArgumentTypeError(
+            'progress_interval', type(progress_interval), float, False)
+    if max_partitions < 1:
+        raise ValueError('max_partitions must be at least 1.')
+    if progress_interval is not None and progress_interval <= 0:
+        raise ValueError('progress_interval must be positive.')
+    if partitions and any('/' in entry for partition in partitions
+                          for entry in partition):
+        raise ValueError('partitions must only contain the names of'
+                         ' top-level entries of the source directory.')
+    if partitions:
+        listed = [entry for partition in partitions for entry in partition]
+        if len(set(listed)) != len(listed):
+            #
+            # Every partition excludes the entries of the others, so an entry
+            # listed twice would not be synced by any partition.
+            #
+            raise ValueError('partitions must not list an entry more than'
+                             ' once.')
+
+    start = time.time()
+    sizes = None
+    if progress is not None:
+        sizes = _sync_progress._measure(libs._run_bash_full_output,
+                                        remote_connection, source_directory)
+    if sizes is not None:
+        entries = sorted(sizes)
+    else:
+        entries = _list_entries(remote_connection, source_directory)
+    entry_partitions = _partition_entries(entries, max_partitions,
+                                          partitions or [])
+
+    tracker = None
+    if progress is not None:
+        tracker = _sync_progress._Tracker(source_directory, progress,
+                                          progress_interval, sizes,
+                                          counted=True, start=start).start()
+
+    def sync(entries, other_entries):
+        result = _sync_partition(remote_connection, source_directory,
+                                 rsync_user, exclude_paths,
+                                 sym_links_to_follow, entries, other_entries)
+        if tracker is not None and result.error is None:
+            tracker.completed(result.entries)
+        return result
+
+    if len(entry_partitions) < 2:
+        results = [sync(entries, [])]
+    else:
+        futures = []
+        for partition in entry_partitions:
+            other_entries = [entry for other in entry_partitions
+                             if other is not partition for entry in other]
+            futures.append(_deadline._submit_to(_executor, sync, partition,
+                                                other_entries))
+        results = []
+        for partition, future in zip(entry_partitions, futures):
+            try:
+                results.append(future.result())
+            except FutureCancelledError as e:
+                results.append(SyncPartitionResult(partition, 0, e))
+
+    error = None
+    if any(result.error is not None for result in results):
+        error = PartitionedSyncError(source_directory, results)
+    if tracker is not None:
+        tracker.finish(error)
+    if error is not None:
+        raise error
+    return results
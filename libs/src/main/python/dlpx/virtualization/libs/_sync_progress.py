@@ -0,0 +1,281 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Progress reporting for run_sync and run_sync_partitioned.
+
+The Delphix Engine reports nothing about a run_sync call until the rsync
+stream ended. When given a progress callback, the sync wrappers first
+measure the regular files of the source directory with run_bash, then call
+the callback with a SyncProgress every progress_interval seconds while the
+sync runs, and once more with a final summary when it ended.
+
+The measured size is that of the whole source directory, before
+exclude_paths are applied, so it is an upper bound of what is transferred.
+A single run_sync call does not learn what it transferred, so its reports,
+including the final one, only give the elapsed time against the measured
+size. run_sync_partitioned counts the size of every partition that
+finished, so its reports also give the bytes and files transferred so far
+and the current rate.
+
+SyncProgressLogger is a callback that writes the reports to a logger, and
+through the handlers of the plugin to the Delphix Engine.
+"""
+
+import logging
+import threading
+import time
+
+__all__ = [
+    "SyncProgress",
+    "SyncProgressLogger"
+]
+
+#
+# Prints every top-level entry of the source directory, including hidden
+# ones, followed by the total size in bytes and the number of the regular
+# files in it, each followed by a NUL byte.
+#
+_MEASURE_SCRIPT = '''\
+cd "$DLPX_SYNC_SOURCE_DIRECTORY" || exit 1
+for entry in * .[!.]* ..?*; do
+  if [ -e "$entry" ] || [ -h "$entry" ]; then
+    size=$(find "./$entry" -type f -exec ls -ln {} + 2> /dev/null |
+           awk '{ bytes += $5; files++ } END { printf "%.0f %d", bytes, files }')
+    printf '%s\\0%s\\0' "$entry" "$size"
+  fi
+done
+'''
+
+_UNITS = ('bytes', 'KB', 'MB', 'GB', 'TB')
+
+
+class SyncProgress(object):
+    """A progress report of a sync.
+
+    Attributes:
+        source_directory (str): The directory being synced.
+        elapsed (float): Seconds since the sync started, including measuring
+        the source directory.
+        total_bytes (int): Size of the regular files in the source directory,
+        or None if it could not be measured.
+        total_files (int): Number of regular files in the source directory,
+        or None if it could not be measured.
+        transferred_bytes (int): Size of the files synced so far, or None if
+        it is not known, as for a single run_sync call.
+        transferred_files (int): Number of files synced so far, or None if it
+        is not known.
+        rate (float): Bytes synced per second since the previous report, or
+        on average over the whole sync in the final report. None if it is
+        not known.
+        done (bool): Whether this is the final report.
+        error (Exception): The exception the sync failed with, in the final
+        report, or None.
+    """
+    def __init__(self, source_directory, elapsed, total_bytes, total_files,
+                 transferred_bytes, transferred_files, rate, done,
+                 error=None):
+        self.source_directory = source_directory
+        self.elapsed = elapsed
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.transferred_bytes = transferred_bytes
+        self.transferred_files = transferred_files
+        self.rate = rate
+        self.done = done
+        self.error = error
+
+    @property
+    def fraction(self):
+        """The part of the measured bytes synced so far, between 0 and 1, or
+        None if it is not known."""
+        if self.transferred_bytes is None or self.total_bytes is None:
+            return None
+        if not self.total_bytes:
+            return 1.0
+        return min(1.0, float(self.transferred_bytes) / self.total_bytes)
+
+
+def _format_bytes(count):
+    size = float(count)
+    for unit in _UNITS[:-1]:
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = _UNITS[-1]
+    if unit == 'bytes':
+        return '{} bytes'.format(int(size))
+    return '{:.1f} {}'.format(size, unit)
+
+
+class SyncProgressLogger(object):
+    """A progress callback for run_sync and run_sync_partitioned that logs
+    every report.
+
+        libs.run_sync(connection, '/data',
+                      progress=libs.SyncProgressLogger(logger))
+
+    Args:
+        logger (logging.Logger): The logger to write to. Defaults to the
+        logger of this module, which propagates to the root logger.
+        level (int): The level of the messages. Failed syncs are logged at
+        least at logging.WARNING.
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self._logger = logger or logging.getLogger(__name__)
+        self._level = level
+
+    @staticmethod
+    def format(progress):
+        """Returns the log message for a SyncProgress."""
+        directory = progress.source_directory
+        if progress.done and progress.error is not None:
+            return 'Failed to sync {} after {:.1f} seconds: {}'.format(
+                directory, progress.elapsed, progress.error)
+        if progress.done:
+            if progress.transferred_bytes is None:
+                message = 'Synced {} in {:.1f} seconds'.format(
+                    directory, progress.elapsed)
+                if progress.total_bytes is not None:
+                    message += ', which held {} in {} files'.format(
+                        _format_bytes(progress.total_bytes),
+                        progress.total_files)
+                return message + '.'
+            message = 'Synced {} in {} files in {:.1f} seconds'.format(
+                _format_bytes(progress.transferred_bytes),
+                progress.transferred_files, progress.elapsed)
+            if progress.rate is not None:
+                message += ', {}/s on average'.format(
+                    _format_bytes(progress.rate))
+            return '{} from {}.'.format(message, directory)
+
+        message = 'Syncing {} for {:.0f} seconds'.format(directory,
+                                                         progress.elapsed)
+        if progress.transferred_bytes is not None:
+            message += ': {} of {} ({:.0%}), {} of {} files'.format(
+                _format_bytes(progress.transferred_bytes),
+                _format_bytes(progress.total_bytes),
+                progress.fraction,
+                progress.transferred_files,
+                progress.total_files)
+            if progress.rate is not None:
+                message += ', {}/s'.format(_format_bytes(progress.rate))
+        elif progress.total_bytes is not None:
+            message += ': {} in {} files to sync'.format(
+                _format_bytes(progress.total_bytes), progress.total_files)
+        return message + '.'
+
+    def __call__(self, progress):
+        level = self._level
+        if progress.error is not None:
+            level = max(level, logging.WARNING)
+        self._logger.log(level, self.format(progress))
+
+
+def _measure(run_bash, remote_connection, source_directory):
+    """Returns the (bytes, files) of the regular files in every top-level
+    entry of source_directory, measured with the run_bash wrapper, or None
+    if the directory could not be measured."""
+    result = run_bash(remote_connection, _MEASURE_SCRIPT,
+                      {'DLPX_SYNC_SOURCE_DIRECTORY': source_directory})
+    if result.exit_code != 0:
+        return None
+    fields = result.stdout.split('\0')
+    sizes = {}
+    for entry, size in zip(fields[0:-1:2], fields[1::2]):
+        size = size.split()
+        sizes[entry] = ((int(size[0]), int(size[1])) if len(size) == 2
+                        else (0, 0))
+    return sizes
+
+
+class _Tracker(object):
+    """Reports the progress of a sync to a callback, periodically from a
+    daemon thread and finally from the thread that calls finish.
+
+    If counted is True, the transferred bytes and files are those of the
+    entries passed to completed, otherwise they are not known. sizes is the
+    result of _measure."""
+    def __init__(self, source_directory, callback, interval, sizes,
+                 counted=False, start=None):
+        self._source_directory = source_directory
+        self._callback = callback
+        self._interval = interval
+        self._sizes = sizes
+        self._counted = counted and sizes is not None
+        self._start = time.time() if start is None else start
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        if sizes is None:
+            self._total = (None, None)
+        else:
+            self._total = (sum(size[0] for size in sizes.values()),
+                           sum(size[1] for size in sizes.values()))
+        self._transferred = (0, 0) if self._counted else (None, None)
+        self._last = (self._start, 0)
+
+    def start(self):
+        if self._interval is not None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def completed(self, entries):
+        """Counts the entries of a partition that was synced."""
+        if not self._counted:
+            return
+        with self._lock:
+            transferred_bytes, transferred_files = self._transferred
+            for entry in entries:
+                entry_bytes, entry_files = self._sizes.get(entry, (0, 0))
+                transferred_bytes += entry_bytes
+                transferred_files += entry_files
+            self._transferred = (transferred_bytes, transferred_files)
+
+    def _report(self, done, error=None):
+        now = time.time()
+        with self._lock:
+            transferred = self._transferred
+            rate = None
+            if transferred[0] is not None:
+                since, transferred_before = ((self._start, 0) if done
+                                             else self._last)
+                if now > since:
+                    rate = (transferred[0] - transferred_before) / (now - since)
+                self._last = (now, transferred[0])
+        return self._callback(SyncProgress(
+            self._source_directory, now - self._start, self._total[0],
+            self._total[1], transferred[0], transferred[1], rate, done,
+            error))
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._report(False)
+            except Exception:
+                #
+                # There is no caller to raise to on this thread, and a
+                # failing report must not end the sync.
+                #
+                pass
+
+    def finish(self, error=None):
+        """Stops the periodic reports and makes the final one."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._report(True, error)
+
+
+def _start(run_bash, remote_connection, source_directory, callback,
+           interval):
+    """Measures source_directory and starts reporting the progress of a
+    single run_sync call to callback. Returns the _Tracker to finish once
+    the call ended."""
+    start = time.time()
+    sizes = _measure(run_bash, remote_connection, source_directory)
+    return _Tracker(source_directory, callback, interval, sizes,
+                    start=start).start()
@@ -85,3 +85,125 @@ class IncorrectArgumentTypeError(PluginRuntimeError):
             expected,
             (' if defined', '')[required]))
         super(IncorrectArgumentTypeError, self).__init__(message)
+
+
+class FutureTimeoutError(Exception):
+    """Plugin-catchable exception
+
+    This exception will be thrown when waiting for the result of an
+    asynchronous library call takes longer than the given timeout. The call
+    itself keeps running.
+
+    Attributes:
+    message - A localized user-readable message.
+    """
+
+    @property
+    def message(self):
+        return self.args[0]
+
+    def __init__(self, timeout):
+        super(FutureTimeoutError, self).__init__(
+            'The asynchronous library call did not finish within {}'
+            ' seconds.'.format(timeout))
+
+
+class FutureCancelledError(Exception):
+    """Plugin-catchable exception
+
+    This exception will be thrown when waiting for the result of an
+    asynchronous library call that was cancelled before it started.
+
+    Attributes:
+    message - A localized user-readable message.
+    """
+
+    @property
+    def message(self):
+        return self.args[0]
+
+    def __init__(self):
+        super(FutureCancelledError, self).__init__(
+            'The asynchronous library call was cancelled.')
+
+
+class PartitionedSyncError(Exception):
+    """Plugin-catchable exception
+
+    This exception will be thrown by run_sync_partitioned when syncing one or
+    more partitions failed. The other partitions were synced.
+
+    Attributes:
+    message - A localized user-readable message.
+    results - The SyncPartitionResult of every partition.
+    """
+
+    @property
+    def message(self):
+        return self.args[0]
+
+    def __init__(self, source_directory, results):
+        failed = [result for result in results if result.error is not None]
+        super(PartitionedSyncError, self).__init__(
+            'Failed to sync {} of {} partitions of {}: {}'.format(
+                len(failed),
+                len(results),
+                source_directory,
+                '; '.join('{} : {}'.format(', '.join(result.entries),
+                                           result.error)
+                          for result in failed)))
+        self.results = results
+
+
+class DeadlineExceededError(Exception):
+    """Plugin-catchable exception
+
+    This exception will be thrown when a library call does not finish within
+    its timeout or before the deadline of the plugin operation it was made
+    in, or when it is made after the deadline passed. The Delphix Engine
+    cannot abort a call it already started, so the command may keep running
+    on the environment.
+
+    Attributes:
+    message - A localized user-readable message.
+    call - The library call, e.g. 'run_bash'.
+    timeout - The seconds the call was given.
+    """
+
+    @property
+    def message(self):
+        return self.args[0]
+
+    def __init__(self, call, timeout, deadline=None):
+        super(DeadlineExceededError, self).__init__(
+            'The {} call did not finish within {:.3f} seconds{}.'.format(
+                call, timeout,
+                ' before the deadline of {}'.format(deadline)
+                if deadline else ''))
+        self.call = call
+        self.timeout = timeout
+
+
+class CircuitOpenError(LibraryError):
+    """Plugin-catchable exception
+
+    This exception will be thrown instead of making a library call when the
+    previous calls to the same environment failed (see set_circuit_breaker).
+    Since it is a LibraryError, plugins that handle unreachable hosts by
+    catching LibraryError handle it the same way.
+
+    Attributes:
+    message - A localized user-readable message.
+    environment - The reference of the environment.
+    retry_after - Seconds until a call to the environment is let through
+    again, 0 if one is being made right now.
+    """
+
+    def __init__(self, call, environment, retry_after):
+        super(CircuitOpenError, self).__init__(
+            None,
+            'The {} call to environment {} was not made because the previous'
+            ' calls to it failed. It will be tried again in {:.3f}'
+            ' seconds.'.format(call, environment, retry_after))
+        self.environment = environment
+        self.retry_after = retry_after
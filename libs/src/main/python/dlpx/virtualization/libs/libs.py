@@ -24,10 +24,18 @@ of a lib operation.
 
 """
 
+import pipes
 import sys
+import time
+import types
+import uuid
 
 from dlpx.virtualization.api import libs_pb2
-from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+from dlpx.virtualization.libs import (_admission, _compression, _deadline,
+                                      _metrics, _output, _resilience,
+                                      _sync_progress)
+from dlpx.virtualization.libs.exceptions import (DeadlineExceededError,
+                                                 IncorrectArgumentTypeError,
                                                  LibraryError,
                                                  PluginScriptError)
 from dlpx.virtualization.common._common_classes import RemoteConnection
@@ -37,9 +45,13 @@ import logging
 
 __all__ = [
     "run_bash",
+    "run_bash_async",
+    "run_bash_batch",
     "run_sync",
     "run_powershell",
-    "run_expect"
+    "run_powershell_async",
+    "run_expect",
+    "run_expect_async"
 ]
 
 
@@ -67,6 +79,77 @@ def _handle_response(response):
     return response.return_value
 
 
+def _call_engine(call, function, request, timeout=None):
+    """Calls function, the engine's implementation of call, with request
+    and returns the response. The call has to finish within timeout and
+    before the deadlines of the current thread, and is retried and broken
+    off according to set_library_retries and set_circuit_breaker."""
+    limit = _deadline._earliest(timeout)
+    called = []
+
+    def call_function(request):
+        called.append(True)
+        return function(request)
+
+    attempt = 0
+    while True:
+        attempt += 1
+        del called[:]
+        token = _resilience._check(call, request)
+        failed = None
+        try:
+            response = _call_admitted(call, call_function, request, limit)
+            failed = (response.HasField('error') and
+                      response.error.HasField('actionable_error'))
+        except DeadlineExceededError:
+            #
+            # A host that is down often hangs instead of failing, so a call
+            # the engine did not answer in time counts as failed. One that
+            # ran out of time before it got to the engine does not.
+            #
+            if called:
+                failed = True
+            raise
+        finally:
+            _resilience._record(token, failed)
+        if not failed:
+            return response
+        delay = _resilience._retry_delay(attempt, limit, token)
+        if delay is None:
+            return response
+        time.sleep(delay)
+
+
+def _call_admitted(call, function, request, limit):
+    """Calls function with request once the environment of the request
+    admits it, and records the call. Waiting for admission and the call
+    itself have to finish before limit."""
+    slot = _admission._acquire(call, request, limit)
+    if slot is None:
+        return _metrics._call(call, _deadline._limit(call, function, limit),
+                              request)
+
+    started = []
+
+    def run(request):
+        #
+        # The slot is released when the engine returns, even if the call ran
+        # out of time before.
+        #
+        started.append(True)
+        try:
+            return function(request)
+        finally:
+            slot.release()
+
+    try:
+        return _metrics._call(call, _deadline._limit(call, run, limit),
+                              request)
+    finally:
+        if not started:
+            slot.release()
+
+
 def _check_exit_code(response, check):
   """
   This functions checks the exitcode received in response and throws PluginScriptError
@@ -83,12 +166,12 @@ def _check_exit_code(response, check):
                             ' stdout : {} and '
                             ' stderr : {}'.format(
       response.return_value.exit_code,
-      response.return_value.stdout,
-      response.return_value.stderr))
+      _output._error_excerpt('stdout', response.return_value.stdout),
+      _output._error_excerpt('stderr', response.return_value.stderr)))
 
 
 def run_bash(remote_connection, command, variables=None, use_login_shell=False,
-             check=False):
+             check=False, timeout=None):
     """run_bash operation wrapper.
 
     The run_bash function executes a shell command or script on a remote Unix
@@ -110,6 +193,8 @@ def run_bash(remote_connection, command, variables=None, use_login_shell=False,
         running the command.
         use_login_shell (bool): Whether to use login shell.
         check (bool): if True and non-zero exitcode is received, raise PluginScriptError
+        timeout (float): Seconds the command may take. If it takes longer,
+        DeadlineExceededError is raised. See also set_operation_timeout.
 
     Returns:
         RunBashResponse: The return value of run_bash operation.
@@ -150,6 +235,12 @@ def run_bash(remote_connection, command, variables=None, use_login_shell=False,
     if use_login_shell and not isinstance(use_login_shell, bool):
         raise IncorrectArgumentTypeError(
             'use_login_shell', type(use_login_shell), bool, False)
+    if timeout is not None and (not isinstance(timeout, (int, long, float))
+                                or isinstance(timeout, bool)):
+        raise IncorrectArgumentTypeError(
+            'timeout', type(timeout), float, False)
+
+    command, variables = _compression._compress_bash(command, variables)
 
     run_bash_request = libs_pb2.RunBashRequest()
     run_bash_request.remote_connection.CopyFrom(remote_connection.to_proto())
@@ -158,13 +249,210 @@ def run_bash(remote_connection, command, variables=None, use_login_shell=False,
     for variable, value in variables.items():
         run_bash_request.variables[variable] = value
 
-    run_bash_response = internal_libs.run_bash(run_bash_request)
+    run_bash_response = _call_engine('run_bash', internal_libs.run_bash,
+                                     run_bash_request, timeout)
+    _output._limit_output(run_bash_response)
     _check_exit_code(run_bash_response, check)
     return _handle_response(run_bash_response)
 
 
+def _run_bash_full_output(*args, **kwargs):
+    """run_bash without the output budget, for the libs helpers that parse
+    the output of their commands."""
+    with _output._full_output():
+        return run_bash(*args, **kwargs)
+
+
+def run_bash_async(remote_connection, command, variables=None,
+                   use_login_shell=False, check=False, timeout=None):
+    """Asynchronous run_bash operation wrapper.
+
+    Runs run_bash on a thread from a bounded pool (see set_max_async_workers)
+    and returns immediately, so that independent remote commands can run at
+    the same time.
+
+    Args:
+        See run_bash.
+
+    Returns:
+        Future: A future whose result() is the RunBashResult of the command.
+        result() raises the same exceptions as run_bash, including
+        IncorrectArgumentTypeError, LibraryError and PluginScriptError.
+    """
+    return _deadline._submit(run_bash, remote_connection, command, variables,
+                             use_login_shell, check, timeout)
+
+
+def _build_batch_script(marker, commands):
+    """Packs a list of (command, variables, check) entries into one Bash
+    script and the variables it needs.
+
+    Every command runs in its own subshell so that exported variables, the
+    working directory and calls to exit do not leak into the next command.
+    The marker is written to both stdout and stderr before and after each
+    command (followed by the exit code on stdout) so that the output of every
+    command can be split apart again by _split_batch_output. The values of the
+    variables are passed as request variables rather than being embedded in
+    the script.
+    """
+    lines = []
+    request_variables = {}
+    for index, (command, variables, _) in enumerate(commands):
+        lines.append("printf '%s' '{0}'; printf '%s' '{0}' >&2".format(marker))
+        lines.append('(')
+        for position, (variable, value) in enumerate(
+                sorted((variables or {}).items())):
+            request_variable = 'DLPX_BATCH_{}_{}'.format(index, position)
+            request_variables[request_variable] = value
+            lines.append('export {}="${{{}}}" || exit 1'.format(
+                pipes.quote(variable), request_variable))
+        lines.append(command)
+        lines.append(')')
+        lines.append(
+            "printf '%s%d' '{0}' \"$?\"; printf '%s' '{0}' >&2".format(marker))
+    lines.append('exit 0')
+    return '\n'.join(lines), request_variables
+
+
+def _split_batch_output(marker, output, count):
+    """Splits the output of a batch script into the output of each command.
+
+    Returns a list with one (output, trailer) tuple per command that finished,
+    where trailer is whatever was printed after the closing marker (the exit
+    code on stdout and nothing on stderr). Anything printed before the first
+    marker, e.g. by a login shell profile, is dropped.
+    """
+    pieces = output.split(marker)[1:]
+    return [(pieces[2 * index], pieces[2 * index + 1])
+            for index in range(min(count, len(pieces) // 2))]
+
+
+def run_bash_batch(remote_connection, commands, use_login_shell=False,
+                   check=False):
+    """run_bash_batch operation wrapper.
+
+    The run_bash_batch function executes a list of shell commands on a remote
+    Unix environment with a single run_bash call to the Delphix Engine. The
+    commands run one after another, each in its own subshell, so environment
+    variables, the working directory and calls to exit do not carry over from
+    one command to the next. The stdout, stderr and exit code of every command
+    are captured separately. All commands are run even if some of them fail.
+
+    Args:
+        remote_connection (RemoteConnection): Connection to a remote
+        environment.
+        commands (list of tuple): Commands to run. Every entry is either
+        (command, variables) or (command, variables, check), where command
+        (str) is the Bash command to run, variables (dict of str:str) are the
+        environment variables to set before running it and check (bool)
+        overrides the check argument for this command.
+        use_login_shell (bool): Whether to use login shell.
+        check (bool): if True and non-zero exitcode is received for a command,
+        raise PluginScriptError
+
+    Returns:
+        list of RunBashResult: The return value of every command, in the same
+        order as commands.
+    """
+    #
+    # Since this import only resolves at runtime, we keep it in the function
+    # scope to allow unit testing of this module.
+    #
+    from dlpx.virtualization._engine import libs as internal_libs
+
+    # Validate all the arguments passed in are the right types based on docs.
+    if not isinstance(remote_connection, RemoteConnection):
+        raise IncorrectArgumentTypeError(
+            'remote_connection',
+            type(remote_connection),
+            RemoteConnection)
+    if not isinstance(commands, list):
+        raise IncorrectArgumentTypeError('commands', type(commands), [tuple])
+    if not all(isinstance(entry, tuple) and len(entry) in (2, 3)
+               for entry in commands):
+        raise IncorrectArgumentTypeError(
+            'commands',
+            [type(entry) for entry in commands],
+            [tuple])
+
+    entries = []
+    for entry in commands:
+        command, variables = entry[:2]
+        entry_check = entry[2] if len(entry) == 3 else check
+        if not isinstance(command, basestring):
+            raise IncorrectArgumentTypeError(
+                'command', type(command), basestring)
+        if variables and not isinstance(variables, dict):
+            raise IncorrectArgumentTypeError(
+                'variables',
+                type(variables),
+                {basestring: basestring},
+                False)
+        if (variables and (not all(isinstance(variable, basestring)
+                                   for variable in variables.keys()) or
+                           not all(isinstance(value, basestring)
+                                   for value in variables.values()))):
+            raise IncorrectArgumentTypeError(
+                'variables',
+                {(type(variable), type(value))
+                 for variable, value in variables.items()},
+                {basestring: basestring},
+                False)
+        if not isinstance(entry_check, bool):
+            raise IncorrectArgumentTypeError(
+                'check', type(entry_check), bool, False)
+        entries.append((command, variables, entry_check))
+    if use_login_shell and not isinstance(use_login_shell, bool):
+        raise IncorrectArgumentTypeError(
+            'use_login_shell', type(use_login_shell), bool, False)
+
+    marker = '__DLPX_BATCH_{}__'.format(uuid.uuid4().hex)
+    script, script_variables = _build_batch_script(marker, entries)
+
+    script, script_variables = _compression._compress_bash(script,
+                                                           script_variables)
+
+    run_bash_request = libs_pb2.RunBashRequest()
+    run_bash_request.remote_connection.CopyFrom(remote_connection.to_proto())
+    run_bash_request.command = script
+    run_bash_request.use_login_shell = use_login_shell
+    for variable, value in script_variables.items():
+        run_bash_request.variables[variable] = value
+
+    run_bash_response = _call_engine('run_bash', internal_libs.run_bash,
+                                     run_bash_request)
+    batch_result = _handle_response(run_bash_response)
+
+    stdouts = _split_batch_output(marker, batch_result.stdout, len(entries))
+    stderrs = _split_batch_output(marker, batch_result.stderr, len(entries))
+    if len(stdouts) < len(entries):
+        raise PluginScriptError(
+            'The batch script failed with exit code {}'
+            ' after {} of {} commands.'
+            ' stdout : {} and '
+            ' stderr : {}'.format(
+                batch_result.exit_code,
+                len(stdouts),
+                len(entries),
+                _output._error_excerpt('stdout', batch_result.stdout),
+                _output._error_excerpt('stderr', batch_result.stderr)))
+
+    results = []
+    for (_, _, entry_check), (stdout, exit_code), (stderr, _) in zip(
+            entries, stdouts, stderrs):
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = int(exit_code)
+        response.return_value.stdout = stdout
+        response.return_value.stderr = stderr
+        _output._limit_output(response)
+        _check_exit_code(response, entry_check)
+        results.append(_handle_response(response))
+    return results
+
+
 def run_sync(remote_connection, source_directory, rsync_user=None,
-             exclude_paths=None, sym_links_to_follow=None):
+             exclude_paths=None, sym_links_to_follow=None, progress=None,
+             progress_interval=30):
     """run_sync operation wrapper.
 
      The run_sync function copies files from the remote source host directly
@@ -177,6 +465,12 @@ def run_sync(remote_connection, source_directory, rsync_user=None,
         rsync_user (str): User who has access to the directory to be synced.
         exclude_paths (list of str): Paths to be excluded.
         sym_links_to_follow (list of str): Sym links to follow if any.
+        progress (function): Called with a SyncProgress every
+        progress_interval seconds while the sync runs, and once it ended,
+        e.g. a SyncProgressLogger. The source directory is measured first
+        for the reports.
+        progress_interval (float): Seconds between the progress reports. If
+        None, only the final report is made.
     """
 
     #
@@ -227,6 +521,16 @@ def run_sync(remote_connection, source_directory, rsync_user=None,
             [type(link) for link in sym_links_to_follow],
             [basestring],
             False)
+    if progress is not None and not callable(progress):
+        raise IncorrectArgumentTypeError(
+            'progress', type(progress), types.FunctionType, False)
+    if progress_interval is not None and (
+            not isinstance(progress_interval, (int, long, float)) or
+            isinstance(progress_interval, bool)):
+        raise IncorrectArgumentTypeError(
+            'progress_interval', type(progress_interval), float, False)
+    if progress_interval is not None and progress_interval <= 0:
+        raise ValueError('progress_interval must be positive.')
 
     run_sync_request = libs_pb2.RunSyncRequest()
     run_sync_request.remote_connection.CopyFrom(remote_connection.to_proto())
@@ -238,11 +542,27 @@ def run_sync(remote_connection, source_directory, rsync_user=None,
     if sym_links_to_follow is not None:
         run_sync_request.sym_links_to_follow.extend(sym_links_to_follow)
 
-    response = internal_libs.run_sync(run_sync_request)
-    _handle_response(response)
-
-
-def run_powershell(remote_connection, command, variables=None, check=False):
+    if progress is None:
+        response = _call_engine('run_sync', internal_libs.run_sync,
+                                run_sync_request)
+        _handle_response(response)
+        return
+
+    tracker = _sync_progress._start(_run_bash_full_output,
+                                    remote_connection, source_directory,
+                                    progress, progress_interval)
+    try:
+        response = _call_engine('run_sync', internal_libs.run_sync,
+                                run_sync_request)
+        _handle_response(response)
+    except Exception as e:
+        tracker.finish(e)
+        raise
+    tracker.finish()
+
+
+def run_powershell(remote_connection, command, variables=None, check=False,
+                   timeout=None):
     """run_powershell operation wrapper.
 
     The run_powershell function executes a powershell command or script on a
@@ -263,6 +583,8 @@ def run_powershell(remote_connection, command, variables=None, check=False):
         variables (dict): Environment variables to set before running the
         command.
         check (bool): if True and non-zero exitcode is received, raise PluginScriptError
+        timeout (float): Seconds the command may take. If it takes longer,
+        DeadlineExceededError is raised. See also set_operation_timeout.
 
     Returns:
         RunPowerShellResponse: The return value of run_powershell operation.
@@ -301,18 +623,55 @@ def run_powershell(remote_connection, command, variables=None, check=False):
             {basestring: basestring},
             False)
 
+    if timeout is not None and (not isinstance(timeout, (int, long, float))
+                                or isinstance(timeout, bool)):
+        raise IncorrectArgumentTypeError(
+            'timeout', type(timeout), float, False)
+
+    command, variables = _compression._compress_powershell(command,
+                                                           variables)
+
     run_powershell_request = libs_pb2.RunPowerShellRequest()
     run_powershell_request.remote_connection.CopyFrom(remote_connection.to_proto())
     run_powershell_request.command = command
     for variable, value in variables.items():
         run_powershell_request.variables[variable] = value
-    run_powershell_response = internal_libs.run_powershell(
-        run_powershell_request)
+    run_powershell_response = _call_engine('run_powershell',
+                                           internal_libs.run_powershell,
+                                           run_powershell_request, timeout)
+    _output._limit_output(run_powershell_response)
     _check_exit_code(run_powershell_response, check)
     return _handle_response(run_powershell_response)
 
 
-def run_expect(remote_connection, command, variables=None, check=False):
+def _run_powershell_full_output(*args, **kwargs):
+    """run_powershell without the output budget, for the libs helpers that
+    parse the output of their commands."""
+    with _output._full_output():
+        return run_powershell(*args, **kwargs)
+
+
+def run_powershell_async(remote_connection, command, variables=None,
+                         check=False, timeout=None):
+    """Asynchronous run_powershell operation wrapper.
+
+    Runs run_powershell on a thread from a bounded pool (see
+    set_max_async_workers) and returns immediately, so that independent remote
+    commands can run at the same time.
+
+    Args:
+        See run_powershell.
+
+    Returns:
+        Future: A future whose result() is the RunPowerShellResult of the
+        command. result() raises the same exceptions as run_powershell.
+    """
+    return _deadline._submit(run_powershell, remote_connection, command,
+                             variables, check, timeout)
+
+
+def run_expect(remote_connection, command, variables=None, check=False,
+               timeout=None):
     """run_expect operation wrapper.
 
     The run_expect function executes a tcl command or script on a remote Unix
@@ -331,6 +690,8 @@ def run_expect(remote_connection, command, variables=None, check=False):
         command (str): Expect(TCL) command to run.
         variables (dict): Environment variables to set before running the
         command.
+        timeout (float): Seconds the command may take. If it takes longer,
+        DeadlineExceededError is raised. See also set_operation_timeout.
     """
     #
     # Since this import only resolves at runtime, we keep it in the function
@@ -366,17 +727,44 @@ def run_expect(remote_connection, command, variables=None, check=False):
             {basestring: basestring},
             False)
 
+    if timeout is not None and (not isinstance(timeout, (int, long, float))
+                                or isinstance(timeout, bool)):
+        raise IncorrectArgumentTypeError(
+            'timeout', type(timeout), float, False)
+
     run_expect_request = libs_pb2.RunExpectRequest()
     run_expect_request.remote_connection.CopyFrom(remote_connection.to_proto())
     run_expect_request.command = command
     for variable, value in variables.items():
         run_expect_request.variables[variable] = value
 
-    run_expect_response = internal_libs.run_expect(run_expect_request)
+    run_expect_response = _call_engine('run_expect',
+                                       internal_libs.run_expect,
+                                       run_expect_request, timeout)
+    _output._limit_output(run_expect_response)
     _check_exit_code(run_expect_response, check)
     return _handle_response(run_expect_response)
 
 
+def run_expect_async(remote_connection, command, variables=None,
+                     check=False, timeout=None):
+    """Asynchronous run_expect operation wrapper.
+
+    Runs run_expect on a thread from a bounded pool (see
+    set_max_async_workers) and returns immediately, so that independent remote
+    commands can run at the same time.
+
+    Args:
+        See run_expect.
+
+    Returns:
+        Future: A future whose result() is the RunExpectResult of the command.
+        result() raises the same exceptions as run_expect.
+    """
+    return _deadline._submit(run_expect, remote_connection, command,
+                             variables, check, timeout)
+
+
 def _log_request(message, log_level):
     """This is an internal wrapper around the Virtualization library's logging
     API. It maps Python logging level to the library's logging levels:
@@ -396,17 +784,21 @@ def _log_request(message, log_level):
 
     log_request = libs_pb2.LogRequest()
     log_request.message = message
+    log_request.level = _log_request_level(log_level)
 
-    #
-    # The Virtualization Library API defines only DEBUG, INFO, and ERROR. Map
-    # all logging levels into one of those three buckets.
-    #
+    response = _metrics._call('log', internal_libs.log, log_request)
+    _handle_response(response)
+
+
+def _log_request_level(log_level):
+    """Maps a Python logging level to the LogRequest level it is logged at.
+
+    The Virtualization Library API defines only DEBUG, INFO, and ERROR. Map
+    all logging levels into one of those three buckets.
+    """
     if log_level <= logging.DEBUG:
-        log_request.level = libs_pb2.LogRequest.DEBUG
+        return libs_pb2.LogRequest.DEBUG
     elif log_level <= logging.INFO:
-        log_request.level = libs_pb2.LogRequest.INFO
+        return libs_pb2.LogRequest.INFO
     else:
-        log_request.level = libs_pb2.LogRequest.ERROR
-
-    response = internal_libs.log(log_request)
-    _handle_response(response)
+        return libs_pb2.LogRequest.ERROR
@@ -0,0 +1,111 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Microbenchmark for building libs requests from a RemoteConnection.
+
+Compares the cost per call of filling in RunBashRequest.remote_connection
+when the RemoteConnection protobuf message is rebuilt on every call (what
+to_proto() used to do) against the cached message to_proto() returns now.
+It reports the time per call and the number of protobuf messages built per
+call. This is not collected by pytest; run it directly:
+
+    python benchmark_to_proto.py [iterations]
+"""
+
+import sys
+import timeit
+
+from dlpx.virtualization.api import common_pb2, libs_pb2
+from dlpx.virtualization.common import _common_classes
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteEnvironment,
+                                                        RemoteHost,
+                                                        RemoteUser)
+
+
+class _CountingMessages(object):
+    """Stands in for common_pb2 and counts how many messages are built."""
+    def __init__(self):
+        self.count = 0
+
+    def __getattr__(self, name):
+        message_class = getattr(common_pb2, name)
+
+        def build():
+            self.count += 1
+            return message_class()
+
+        return build
+
+
+def _rebuild_proto(connection):
+    """Builds the RemoteConnection message from scratch, like to_proto() did
+    before it was cached."""
+    host = _common_classes.common_pb2.RemoteHost()
+    host.name = connection.environment.host.name
+    host.reference = connection.environment.host.reference
+    host.binary_path = connection.environment.host.binary_path
+    host.scratch_path = connection.environment.host.scratch_path
+    environment = _common_classes.common_pb2.RemoteEnvironment()
+    environment.name = connection.environment.name
+    environment.reference = connection.environment.reference
+    environment.host.CopyFrom(host)
+    user = _common_classes.common_pb2.RemoteUser()
+    user.name = connection.user.name
+    user.reference = connection.user.reference
+    remote_connection = _common_classes.common_pb2.RemoteConnection()
+    remote_connection.environment.CopyFrom(environment)
+    remote_connection.user.CopyFrom(user)
+    return remote_connection
+
+
+def _build_request(connection, to_proto):
+    request = libs_pb2.RunBashRequest()
+    request.remote_connection.CopyFrom(to_proto(connection))
+    request.command = 'cat /etc/os-release'
+    return request
+
+
+def _measure(connection, to_proto, iterations):
+    seconds = timeit.timeit(lambda: _build_request(connection, to_proto),
+                            number=iterations)
+
+    counting = _CountingMessages()
+    original = _common_classes.common_pb2
+    _common_classes.common_pb2 = counting
+    try:
+        _build_request(connection, to_proto)
+        counting.count = 0
+        _build_request(connection, to_proto)
+    finally:
+        _common_classes.common_pb2 = original
+    return seconds / iterations, counting.count
+
+
+def main(iterations):
+    host = RemoteHost('host', 'UNIX_HOST-1', '/opt/delphix/toolkit',
+                      '/opt/delphix/toolkit/scratch')
+    environment = RemoteEnvironment('environment', 'UNIX_HOST_ENVIRONMENT-1',
+                                    host)
+    connection = RemoteConnection(environment,
+                                  RemoteUser('delphix', 'HOST_USER-1'))
+
+    rebuilt_time, rebuilt_messages = _measure(connection, _rebuild_proto,
+                                              iterations)
+    cached_time, cached_messages = _measure(
+        connection, RemoteConnection.to_proto, iterations)
+
+    print('{:<10} {:>14} {:>22}'.format('to_proto', 'us per call',
+                                        'messages built per call'))
+    print('{:<10} {:>14.2f} {:>22}'.format('rebuilt', rebuilt_time * 1e6,
+                                           rebuilt_messages))
+    print('{:<10} {:>14.2f} {:>22}'.format('cached', cached_time * 1e6,
+                                           cached_messages))
+    print('saved {:.2f} us ({:.0%}) per call'.format(
+        (rebuilt_time - cached_time) * 1e6,
+        (rebuilt_time - cached_time) / rebuilt_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -2,7 +2,11 @@
 # Copyright (c) 2019 by Delphix. All rights reserved.
 #
 
+import os
+import subprocess
+
 import pytest
+from dlpx.virtualization.api import libs_pb2
 from dlpx.virtualization.common._common_classes import RemoteUser, RemoteHost, RemoteEnvironment, RemoteConnection
 
 
@@ -26,3 +30,28 @@ def remote_environment(remote_host):
 @pytest.fixture
 def remote_connection(remote_environment, remote_user):
     return RemoteConnection(remote_environment, remote_user)
+
+
+@pytest.fixture
+def run_bash_locally():
+    """Returns a stand-in for the engine's run_bash that runs the command of
+    a RunBashRequest with the local bash binary, which lets tests check the
+    scripts that the wrappers generate."""
+    def run_bash(run_bash_request):
+        env = dict(os.environ)
+        env.update((variable.encode('utf-8'), value.encode('utf-8'))
+                   for variable, value in run_bash_request.variables.items())
+        process = subprocess.Popen(
+            ['bash', '-c', run_bash_request.command.encode('utf-8')],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env)
+        stdout, stderr = process.communicate()
+
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = process.returncode
+        response.return_value.stdout = stdout.decode('utf-8')
+        response.return_value.stderr = stderr.decode('utf-8')
+        return response
+
+    return run_bash
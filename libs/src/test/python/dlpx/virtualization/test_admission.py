@@ -0,0 +1,201 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import threading
+import time
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteEnvironment)
+from dlpx.virtualization.libs.exceptions import (DeadlineExceededError,
+                                                 IncorrectArgumentTypeError)
+
+
+@pytest.fixture(autouse=True)
+def limits():
+    yield
+    libs.set_concurrency_limits()
+    libs.reset_admission_stats()
+
+
+@pytest.fixture
+def connections(remote_host, remote_user):
+    def connection(reference):
+        return RemoteConnection(
+            RemoteEnvironment(reference, reference, remote_host), remote_user)
+
+    return {reference: connection(reference) for reference in ('a', 'b')}
+
+
+class Engine(object):
+    """Fake run_bash that blocks every command until it is released and
+    records the order in which commands started."""
+    def __init__(self):
+        self.started = []
+        self._condition = threading.Condition()
+        self._released = set()
+
+    def run_bash(self, request):
+        with self._condition:
+            self.started.append(request.command)
+            self._condition.notify_all()
+            while request.command not in self._released:
+                self._condition.wait()
+        return libs_pb2.RunBashResponse()
+
+    def release(self, *commands):
+        with self._condition:
+            self._released.update(commands)
+            self._condition.notify_all()
+
+    def wait_started(self, count):
+        with self._condition:
+            end = time.time() + 5
+            while len(self.started) < count and time.time() < end:
+                self._condition.wait(0.01)
+        return list(self.started)
+
+
+@pytest.fixture
+def engine():
+    engine = Engine()
+    with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                    side_effect=engine.run_bash, create=True):
+        yield engine
+    engine.release(*engine.started)
+
+
+def start(connection, command):
+    thread = threading.Thread(target=libs.run_bash,
+                              args=(connection, command))
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def wait_waiting(environment, count):
+    end = time.time() + 5
+    while time.time() < end:
+        stats = libs.admission_stats().get(environment)
+        if stats is not None and stats.waiting == count:
+            return
+        time.sleep(0.005)
+    raise AssertionError('Calls did not start waiting.')
+
+
+class TestAdmission:
+    @staticmethod
+    def test_per_environment_limit_in_order(connections, engine):
+        libs.set_concurrency_limits(per_environment=1)
+
+        threads = [start(connections['a'], 'a1')]
+        assert engine.wait_started(1) == ['a1']
+        threads.append(start(connections['a'], 'a2'))
+        wait_waiting('a', 1)
+        threads.append(start(connections['a'], 'a3'))
+        wait_waiting('a', 2)
+
+        # Another environment is not held up by the waiting calls.
+        threads.append(start(connections['b'], 'b1'))
+        assert engine.wait_started(2) == ['a1', 'b1']
+
+        engine.release('a1')
+        assert engine.wait_started(3) == ['a1', 'b1', 'a2']
+        engine.release('a2', 'a3', 'b1')
+        for thread in threads:
+            thread.join(5)
+
+        assert engine.started == ['a1', 'b1', 'a2', 'a3']
+        stats = libs.admission_stats()
+        assert stats['a'].admitted == 3
+        assert stats['a'].running == 0
+        assert stats['a'].waiting == 0
+        assert stats['a'].max_wait_seconds > 0
+        assert stats['a'].wait_seconds >= stats['a'].max_wait_seconds
+        assert stats['b'].admitted == 1
+
+    @staticmethod
+    def test_total_limit(connections, engine):
+        libs.set_concurrency_limits(total=1, environments={'b': 5})
+
+        threads = [start(connections['a'], 'a1')]
+        assert engine.wait_started(1) == ['a1']
+        threads.append(start(connections['b'], 'b1'))
+        wait_waiting('b', 1)
+
+        engine.release('a1')
+        assert engine.wait_started(2) == ['a1', 'b1']
+        engine.release('b1')
+        for thread in threads:
+            thread.join(5)
+
+    @staticmethod
+    def test_deadline_while_waiting(connections, engine):
+        libs.set_concurrency_limits(environments={'a': 1})
+        thread = start(connections['a'], 'a1')
+        engine.wait_started(1)
+
+        with pytest.raises(DeadlineExceededError) as err_info:
+            libs.run_bash(connections['a'], 'a2', timeout=0.05)
+
+        assert err_info.value.call == 'run_bash'
+        engine.release('a1')
+        thread.join(5)
+        assert engine.started == ['a1']
+        assert libs.admission_stats()['a'].expired == 1
+
+    @staticmethod
+    def test_slot_released_after_timeout(connections, engine):
+        libs.set_concurrency_limits(per_environment=1)
+
+        with pytest.raises(DeadlineExceededError):
+            libs.run_bash(connections['a'], 'a1', timeout=0.05)
+        assert libs.admission_stats()['a'].running == 1
+
+        engine.release('a1')
+        end = time.time() + 5
+        while libs.admission_stats()['a'].running and time.time() < end:
+            time.sleep(0.005)
+        assert libs.admission_stats()['a'].running == 0
+
+    @staticmethod
+    def test_reset_stats_while_waiting(connections, engine):
+        libs.set_concurrency_limits(per_environment=1)
+        threads = [start(connections['a'], 'a1')]
+        engine.wait_started(1)
+        threads.append(start(connections['a'], 'a2'))
+        wait_waiting('a', 1)
+
+        libs.reset_admission_stats()
+        stats = libs.admission_stats()['a']
+        assert (stats.admitted, stats.running, stats.waiting) == (0, 1, 1)
+
+        engine.release('a1', 'a2')
+        for thread in threads:
+            thread.join(5)
+        stats = libs.admission_stats()['a']
+        assert (stats.admitted, stats.running, stats.waiting) == (1, 0, 0)
+
+    @staticmethod
+    def test_no_limits(connections, engine):
+        engine.release('a1')
+        libs.run_bash(connections['a'], 'a1')
+
+        assert libs.admission_stats() == {}
+
+    @staticmethod
+    def test_bad_limits():
+        with pytest.raises(ValueError):
+            libs.set_concurrency_limits(total=0)
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.set_concurrency_limits(environments={'a': '1'})
+
+        assert err_info.value.message == (
+            "The function set_concurrency_limits's argument 'environments'"
+            " was a dict of {type 'str':type 'str'} but should be of type"
+            " 'dict of basestring:int' if defined.")
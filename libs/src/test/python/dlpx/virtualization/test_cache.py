@@ -0,0 +1,152 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteUser)
+from dlpx.virtualization.libs import _cache
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(_cache, '_cache', _cache._ResultCache(4))
+
+
+@pytest.fixture
+def mock_run_bash():
+    def run_bash(request):
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = int(
+            request.variables.get('EXIT_CODE', '0'))
+        response.return_value.stdout = request.command
+        return response
+
+    with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                    side_effect=run_bash, create=True) as mock_run_bash:
+        yield mock_run_bash
+
+
+class TestLibsRunBashCached:
+    @staticmethod
+    def test_run_bash_cached(remote_connection, mock_run_bash):
+        first = libs.run_bash_cached(remote_connection, 'cat /etc/os-release')
+        first.stdout = 'modified'
+        second = libs.run_bash_cached(remote_connection,
+                                      'cat /etc/os-release')
+
+        assert mock_run_bash.call_count == 1
+        assert second.stdout == 'cat /etc/os-release'
+        assert libs.result_cache_stats() == {
+            'hits': 1, 'misses': 1, 'expirations': 0, 'evictions': 0,
+            'invalidations': 0, 'size': 1}
+
+    @staticmethod
+    def test_run_bash_cached_key(remote_connection, remote_environment,
+                                 mock_run_bash):
+        other_user = RemoteConnection(remote_environment,
+                                      RemoteUser('other', 'other-reference'))
+
+        libs.run_bash_cached(remote_connection, 'command')
+        libs.run_bash_cached(remote_connection, 'command', {'A': 'a'})
+        libs.run_bash_cached(remote_connection, 'command',
+                             use_login_shell=True)
+        libs.run_bash_cached(other_user, 'command')
+        libs.run_bash_cached(remote_connection, 'command', {'A': 'a'})
+
+        assert mock_run_bash.call_count == 4
+
+    @staticmethod
+    def test_run_bash_cached_expired(remote_connection, mock_run_bash):
+        with mock.patch('time.time', return_value=100.0):
+            libs.run_bash_cached(remote_connection, 'command', ttl=10)
+        with mock.patch('time.time', return_value=109.0):
+            libs.run_bash_cached(remote_connection, 'command', ttl=10)
+        with mock.patch('time.time', return_value=110.0):
+            libs.run_bash_cached(remote_connection, 'command', ttl=10)
+
+        assert mock_run_bash.call_count == 2
+        assert libs.result_cache_stats()['expirations'] == 1
+
+    @staticmethod
+    def test_run_bash_cached_failure_not_cached(remote_connection,
+                                                mock_run_bash):
+        for _ in range(2):
+            result = libs.run_bash_cached(remote_connection, 'command',
+                                          {'EXIT_CODE': '1'})
+            assert result.exit_code == 1
+        with pytest.raises(PluginScriptError):
+            libs.run_bash_cached(remote_connection, 'command',
+                                 {'EXIT_CODE': '1'}, check=True)
+
+        assert mock_run_bash.call_count == 3
+        assert libs.result_cache_stats()['size'] == 0
+
+    @staticmethod
+    def test_run_bash_cached_lru_eviction(remote_connection, mock_run_bash):
+        for command in ('one', 'two', 'three', 'four'):
+            libs.run_bash_cached(remote_connection, command)
+        libs.run_bash_cached(remote_connection, 'one')
+        libs.run_bash_cached(remote_connection, 'five')
+        libs.run_bash_cached(remote_connection, 'one')
+        libs.run_bash_cached(remote_connection, 'two')
+
+        assert mock_run_bash.call_count == 6
+        stats = libs.result_cache_stats()
+        assert stats['evictions'] == 2
+        assert stats['size'] == 4
+
+    @staticmethod
+    def test_set_result_cache_size(remote_connection, mock_run_bash):
+        for command in ('one', 'two', 'three'):
+            libs.run_bash_cached(remote_connection, command)
+
+        libs.set_result_cache_size(1)
+
+        assert libs.result_cache_stats()['size'] == 1
+        libs.run_bash_cached(remote_connection, 'three')
+        assert mock_run_bash.call_count == 3
+
+    @staticmethod
+    def test_invalidate_cached_results(remote_connection, remote_environment,
+                                       mock_run_bash):
+        other_user = RemoteConnection(remote_environment,
+                                      RemoteUser('other', 'other-reference'))
+        libs.run_bash_cached(remote_connection, 'one')
+        libs.run_bash_cached(remote_connection, 'two')
+        libs.run_bash_cached(other_user, 'one')
+
+        assert libs.invalidate_cached_results(remote_connection, 'one') == 1
+        assert libs.invalidate_cached_results(other_user) == 1
+        assert libs.invalidate_cached_results() == 1
+        assert libs.result_cache_stats()['invalidations'] == 3
+
+    @staticmethod
+    def test_run_bash_cached_bad_ttl(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_bash_cached(remote_connection, 'command', ttl='10')
+
+        assert err_info.value.message == (
+            "The function run_bash_cached's argument 'ttl' was type 'str'"
+            " but should be of type 'float' if defined.")
+
+    @staticmethod
+    def test_run_powershell_cached(remote_connection):
+        response = libs_pb2.RunPowerShellResponse()
+        response.return_value.stdout = 'version'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        return_value=response,
+                        create=True) as mock_run_powershell:
+            for _ in range(2):
+                result = libs.run_powershell_cached(remote_connection,
+                                                    '$PSVersionTable')
+                assert result.stdout == 'version'
+
+        assert mock_run_powershell.call_count == 1
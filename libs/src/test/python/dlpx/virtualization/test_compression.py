@@ -0,0 +1,146 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import base64
+import os
+import zlib
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.libs.exceptions import IncorrectArgumentTypeError
+
+BIG_COMMAND = 'echo "$GREETING" | wc -c\n' + '# padding\n' * 1000
+
+
+@pytest.fixture(autouse=True)
+def compression():
+    libs.reset_compression_stats()
+    libs.set_compression(threshold=1024)
+    yield
+    libs.set_compression()
+    libs.reset_compression_stats()
+
+
+@pytest.fixture
+def local_run_bash(run_bash_locally):
+    with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                    side_effect=run_bash_locally, create=True) as run_bash:
+        yield run_bash
+
+
+class TestCompressionBash:
+    @staticmethod
+    def test_compressed_command_and_variable(remote_connection,
+                                             local_run_bash):
+        value = 'hello world\n' * 1000 + '\n\n'
+        result = libs.run_bash(remote_connection,
+                               BIG_COMMAND + 'printf %s "$SMALL"',
+                               {'GREETING': value, 'SMALL': 'small'})
+
+        assert result.exit_code == 0
+        assert result.stdout == '{}\nsmall'.format(len(value) + 1)
+
+        request = local_run_bash.call_args[0][0]
+        assert dict(request.variables) == {'SMALL': 'small'}
+        assert 'gzip -dc' in request.command
+        assert len(request.command) < len(BIG_COMMAND)
+
+        stats = libs.compression_stats()
+        assert stats.requests == 1
+        assert stats.skipped == 0
+        assert stats.original_bytes == (len(BIG_COMMAND) + 18 + len(value) +
+                                        len('small'))
+        assert stats.compressed_bytes == len(request.command) + len('small')
+        assert 0 < stats.ratio < 0.2
+        assert stats.seconds >= 0
+
+    @staticmethod
+    def test_compressed_command_exit_code(remote_connection, local_run_bash):
+        result = libs.run_bash(remote_connection, BIG_COMMAND + 'exit 3')
+
+        assert result.exit_code == 3
+        assert libs.compression_stats().requests == 1
+
+    @staticmethod
+    def test_compressed_batch(remote_connection, local_run_bash):
+        results = libs.run_bash_batch(
+            remote_connection,
+            [('echo first', {}), (BIG_COMMAND, {'GREETING': 'hi'})])
+
+        assert [result.stdout for result in results] == ['first\n', '3\n']
+        assert 'gzip -dc' in local_run_bash.call_args[0][0].command
+
+    @staticmethod
+    def test_small_request_not_compressed(remote_connection, local_run_bash):
+        libs.run_bash(remote_connection, 'echo "$GREETING"',
+                      {'GREETING': 'hello'})
+
+        request = local_run_bash.call_args[0][0]
+        assert request.command == 'echo "$GREETING"'
+        assert dict(request.variables) == {'GREETING': 'hello'}
+        assert libs.compression_stats().skipped == 0
+
+    @staticmethod
+    def test_incompressible_request_skipped(remote_connection,
+                                            local_run_bash):
+        value = base64.b64encode(os.urandom(4096))
+        result = libs.run_bash(remote_connection, 'printf %s "$RANDOM_DATA"',
+                               {'RANDOM_DATA': value})
+
+        assert result.stdout == value
+        request = local_run_bash.call_args[0][0]
+        assert request.command == 'printf %s "$RANDOM_DATA"'
+        stats = libs.compression_stats()
+        assert stats.requests == 0
+        assert stats.skipped == 1
+        assert stats.ratio is None
+
+    @staticmethod
+    def test_compression_disabled(remote_connection, local_run_bash):
+        libs.set_compression()
+        libs.run_bash(remote_connection, BIG_COMMAND)
+
+        assert local_run_bash.call_args[0][0].command == BIG_COMMAND
+
+
+class TestCompressionPowerShell:
+    @staticmethod
+    def test_compressed_powershell(remote_connection):
+        response = libs_pb2.RunPowerShellResponse()
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        return_value=response, create=True) as run_powershell:
+            libs.run_powershell(remote_connection, BIG_COMMAND,
+                                {"IT'S": 'x' * 2048, 'SMALL': 'small'})
+
+        request = run_powershell.call_args[0][0]
+        assert dict(request.variables) == {'SMALL': 'small'}
+        command = request.command
+        assert command.startswith('function Expand-DlpxCompressed')
+        assert "SetEnvironmentVariable(\n    'IT''S'," in command
+
+        #
+        # The command is the last here-string of the request.
+        #
+        data = command.rsplit("@'\n", 1)[1].split("'@", 1)[0]
+        assert zlib.decompress(base64.b64decode(data),
+                               16 + zlib.MAX_WBITS) == BIG_COMMAND
+
+
+class TestSetCompression:
+    @staticmethod
+    def test_bad_threshold():
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.set_compression(threshold='1024')
+
+        assert err_info.value.message == (
+            "The function set_compression's argument 'threshold' was type"
+            " 'str' but should be of type 'int' if defined.")
+
+    @staticmethod
+    def test_bad_level():
+        with pytest.raises(ValueError):
+            libs.set_compression(threshold=1024, level=10)
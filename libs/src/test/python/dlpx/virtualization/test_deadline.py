@@ -0,0 +1,176 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import threading
+import time
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._operation_context import operation_wrapper
+from dlpx.virtualization.libs import _futures
+from dlpx.virtualization.libs.exceptions import (DeadlineExceededError,
+                                                 FutureCancelledError,
+                                                 IncorrectArgumentTypeError)
+
+
+@pytest.fixture(autouse=True)
+def operation_timeouts():
+    yield
+    libs.set_operation_timeout(None)
+    libs.set_operation_timeout(None, 'operation')
+
+
+@pytest.fixture
+def slow_run_bash():
+    release = threading.Event()
+
+    def run_bash(request):
+        release.wait(5)
+        return libs_pb2.RunBashResponse()
+
+    with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                    side_effect=run_bash, create=True) as mock_run_bash:
+        yield mock_run_bash
+    release.set()
+
+
+@pytest.fixture
+def fast_run_bash():
+    response = libs_pb2.RunBashResponse()
+    response.return_value.stdout = 'output'
+    with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                    return_value=response, create=True) as mock_run_bash:
+        yield mock_run_bash
+
+
+class TestCallTimeout:
+    @staticmethod
+    def test_timeout_expires(remote_connection, slow_run_bash):
+        start = time.time()
+        with pytest.raises(DeadlineExceededError) as err_info:
+            libs.run_bash(remote_connection, 'sleep 60', timeout=0.05)
+
+        assert time.time() - start < 1
+        assert err_info.value.call == 'run_bash'
+        assert err_info.value.message == (
+            'The run_bash call did not finish within 0.050 seconds.')
+
+    @staticmethod
+    def test_call_within_timeout(remote_connection, fast_run_bash):
+        result = libs.run_bash(remote_connection, 'echo', timeout=5)
+
+        assert result.stdout == 'output'
+
+    @staticmethod
+    def test_error_within_timeout(remote_connection):
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        side_effect=RuntimeError('engine error'),
+                        create=True):
+            with pytest.raises(RuntimeError) as err_info:
+                libs.run_powershell(remote_connection, 'dir', timeout=5)
+
+        assert err_info.value.args == ('engine error',)
+
+    @staticmethod
+    def test_bad_timeout(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_expect(remote_connection, 'command', timeout='5')
+
+        assert err_info.value.message == (
+            "The function run_expect's argument 'timeout' was type 'str' but"
+            " should be of type 'float' if defined.")
+
+
+class TestDeadline:
+    @staticmethod
+    def test_operation_timeout(remote_connection, slow_run_bash):
+        libs.set_operation_timeout(0.05, 'operation')
+
+        @operation_wrapper('operation')
+        def operation():
+            libs.run_bash(remote_connection, 'sleep 60')
+
+        with pytest.raises(DeadlineExceededError) as err_info:
+            operation()
+
+        assert err_info.value.message.endswith(
+            ' seconds before the deadline of the operation operation.')
+
+    @staticmethod
+    def test_operation_timeout_of_other_operation(remote_connection,
+                                                  fast_run_bash):
+        libs.set_operation_timeout(0.001, 'operation')
+        libs.set_operation_timeout(10)
+
+        @operation_wrapper('other')
+        def other():
+            time.sleep(0.01)
+            return (libs.run_bash(remote_connection, 'echo'),
+                    libs.remaining_time())
+
+        result, remaining = other()
+
+        assert result.stdout == 'output'
+        assert 9 < remaining <= 10
+
+    @staticmethod
+    def test_deadline_block(remote_connection, slow_run_bash):
+        assert libs.remaining_time() is None
+        with libs.deadline(10):
+            with libs.deadline(0.05):
+                assert libs.remaining_time() <= 0.05
+                with pytest.raises(DeadlineExceededError) as err_info:
+                    libs.run_bash(remote_connection, 'sleep 60', timeout=5)
+            assert libs.remaining_time() > 9
+        assert libs.remaining_time() is None
+
+        assert err_info.value.message.endswith(
+            ' seconds before the deadline of a deadline(0.05) block.')
+
+    @staticmethod
+    def test_call_after_deadline(remote_connection, fast_run_bash):
+        with libs.deadline(0):
+            with pytest.raises(DeadlineExceededError) as err_info:
+                libs.run_bash(remote_connection, 'echo')
+
+        assert not fast_run_bash.called
+        assert err_info.value.message == (
+            'The run_bash call did not finish within 0.000 seconds before the'
+            ' deadline of a deadline(0) block.')
+
+    @staticmethod
+    def test_async_call_under_deadline(remote_connection, slow_run_bash):
+        with libs.deadline(0.05):
+            future = libs.run_bash_async(remote_connection, 'sleep 60')
+
+        with pytest.raises(DeadlineExceededError):
+            future.result(timeout=5)
+
+    @staticmethod
+    def test_pending_async_call_cancelled(remote_connection, fast_run_bash):
+        release = threading.Event()
+        libs.set_max_async_workers(1)
+        try:
+            blocker = _futures._submit(release.wait, 5)
+            with libs.deadline(0.05):
+                future = libs.run_bash_async(remote_connection, 'echo')
+            time.sleep(0.2)
+
+            assert future.cancelled()
+        finally:
+            release.set()
+            blocker.result(timeout=5)
+            libs.set_max_async_workers(_futures._DEFAULT_MAX_WORKERS)
+
+        with pytest.raises(FutureCancelledError):
+            future.result()
+        assert not fast_run_bash.called
+
+    @staticmethod
+    def test_bad_operation_timeout():
+        with pytest.raises(ValueError):
+            libs.set_operation_timeout(-1)
@@ -0,0 +1,197 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import os
+import threading
+import time
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.common._operation_context import operation_wrapper
+from dlpx.virtualization.libs.exceptions import (DeadlineExceededError,
+                                                 IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+CONTENT = ''.join(chr(i) for i in range(256)) * 3 + 'tail'
+
+
+@pytest.fixture
+def local_run_bash(run_bash_locally):
+    with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                    side_effect=run_bash_locally, create=True) as run_bash:
+        yield run_bash
+
+
+class TestLibsReadFile:
+    @staticmethod
+    def test_read_file(remote_connection, local_run_bash, tmpdir):
+        path = tmpdir.join('file')
+        path.write(CONTENT, mode='wb')
+
+        assert libs.read_file(remote_connection, str(path),
+                              chunk_size=100) == CONTENT
+        # One call for the size and one per chunk.
+        assert local_run_bash.call_count == 1 + 8
+
+    @staticmethod
+    def test_read_file_chunks(remote_connection, local_run_bash, tmpdir):
+        path = tmpdir.join('file')
+        path.write(CONTENT, mode='wb')
+
+        chunks = list(libs.read_file_chunks(remote_connection, str(path),
+                                            chunk_size=256, max_in_flight=2))
+
+        assert [len(chunk) for chunk in chunks] == [256, 256, 256, 4]
+        assert ''.join(chunks) == CONTENT
+
+    @staticmethod
+    def test_read_file_empty(remote_connection, local_run_bash, tmpdir):
+        path = tmpdir.join('file')
+        path.write('')
+
+        assert libs.read_file(remote_connection, str(path)) == ''
+
+    @staticmethod
+    def test_read_file_missing(remote_connection, local_run_bash, tmpdir):
+        path = str(tmpdir.join('missing'))
+
+        with pytest.raises(PluginScriptError) as err_info:
+            libs.read_file(remote_connection, path)
+
+        assert err_info.value.message == (
+            'Failed to get the size of {0} with exit code 1. stdout :  and '
+            ' stderr : {0} is not a regular file.\n'.format(path))
+
+    @staticmethod
+    def test_read_file_checksum_retry(remote_connection, run_bash_locally,
+                                      tmpdir):
+        path = tmpdir.join('file')
+        path.write('content')
+        calls = []
+
+        def corrupt_first_read(request):
+            response = run_bash_locally(request)
+            calls.append(request)
+            if len(calls) == 2:
+                response.return_value.stdout = (
+                    response.return_value.stdout.replace('Y29', 'Y30'))
+            return response
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=corrupt_first_read, create=True):
+            assert libs.read_file(remote_connection, str(path)) == 'content'
+
+        assert len(calls) == 3
+
+    @staticmethod
+    def test_read_file_operation_timeout(remote_connection, run_bash_locally,
+                                         tmpdir):
+        path = tmpdir.join('file')
+        path.write(CONTENT, mode='wb')
+        release = threading.Event()
+        calls = []
+
+        def slow_chunk_reads(request):
+            calls.append(request)
+            if len(calls) > 1:
+                release.wait(5)
+            return run_bash_locally(request)
+
+        @operation_wrapper('operation')
+        def operation():
+            return libs.read_file(remote_connection, str(path),
+                                  chunk_size=100)
+
+        libs.set_operation_timeout(0.1, 'operation')
+        start = time.time()
+        try:
+            with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                            side_effect=slow_chunk_reads, create=True):
+                with pytest.raises(DeadlineExceededError):
+                    operation()
+        finally:
+            release.set()
+            libs.set_operation_timeout(None, 'operation')
+
+        assert time.time() - start < 2
+
+    @staticmethod
+    def test_read_file_bad_path(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.read_file(remote_connection, 10)
+
+        assert err_info.value.message == (
+            "The function read_file's argument 'path' was type 'int' but"
+            " should be of type 'basestring'.")
+
+
+class TestLibsWriteFile:
+    @staticmethod
+    def test_write_file(remote_connection, local_run_bash, tmpdir):
+        path = tmpdir.join('file')
+        path.write('previous content that is longer than the new one' * 50)
+        os.chmod(str(path), 0o640)
+
+        libs.write_file(remote_connection, str(path), CONTENT,
+                        chunk_size=100)
+
+        assert path.read(mode='rb') == CONTENT
+        assert os.stat(str(path)).st_mode & 0o777 == 0o640
+        # One call to truncate and one per chunk.
+        assert local_run_bash.call_count == 1 + 8
+
+    @staticmethod
+    def test_write_file_chunks(remote_connection, local_run_bash, tmpdir):
+        path = tmpdir.join('file')
+
+        libs.write_file_chunks(remote_connection, str(path),
+                               (CONTENT[i:i + 7]
+                                for i in range(0, len(CONTENT), 7)),
+                               chunk_size=64, max_in_flight=3)
+
+        assert path.read(mode='rb') == CONTENT
+
+    @staticmethod
+    def test_write_file_unicode(remote_connection, local_run_bash, tmpdir):
+        path = tmpdir.join('file')
+
+        libs.write_file(remote_connection, str(path), u'caf\xe9')
+
+        assert path.read(mode='rb') == 'caf\xc3\xa9'
+
+    @staticmethod
+    def test_write_file_empty(remote_connection, local_run_bash, tmpdir):
+        path = tmpdir.join('file')
+        path.write('previous')
+
+        libs.write_file(remote_connection, str(path), '')
+
+        assert path.read() == ''
+
+    @staticmethod
+    def test_write_file_checksum_mismatch(remote_connection, tmpdir):
+        from dlpx.virtualization.api import libs_pb2
+        response = libs_pb2.RunBashResponse()
+        response.return_value.stdout = '0' * 32 + '  -\n'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True) as run_bash:
+            with pytest.raises(PluginScriptError) as err_info:
+                libs.write_file(remote_connection, 'path', 'content')
+
+        assert err_info.value.message == (
+            'Failed to write chunk 0 of path: the checksum of the written'
+            ' data does not match.')
+        assert run_bash.call_count == 3
+
+    @staticmethod
+    def test_write_file_bad_content(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.write_file(remote_connection, 'path', 10)
+
+        assert err_info.value.message == (
+            "The function write_file's argument 'content' was type 'int' but"
+            " should be of type 'basestring'.")
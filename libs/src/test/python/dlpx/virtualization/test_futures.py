@@ -0,0 +1,153 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import threading
+import time
+
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.libs import _futures
+from dlpx.virtualization.libs.exceptions import (FutureCancelledError,
+                                                 FutureTimeoutError,
+                                                 IncorrectArgumentTypeError,
+                                                 LibraryError)
+
+
+class TestFuture:
+    @staticmethod
+    def test_result():
+        future = _futures._submit(lambda x, y: x + y, 1, y=2)
+        assert future.result(timeout=5) == 3
+        assert future.done()
+        assert future.exception() is None
+
+    @staticmethod
+    def test_exception_propagates():
+        def fail():
+            raise LibraryError(1, 'Host unreachable')
+
+        future = _futures._submit(fail)
+        with pytest.raises(LibraryError) as err_info:
+            future.result(timeout=5)
+        assert err_info.value.message == 'Host unreachable'
+        assert isinstance(future.exception(), LibraryError)
+
+    @staticmethod
+    def test_system_exit_propagates():
+        def exit_plugin():
+            raise SystemExit()
+
+        future = _futures._submit(exit_plugin)
+        with pytest.raises(SystemExit):
+            future.result(timeout=5)
+
+    @staticmethod
+    def test_result_timeout():
+        release = threading.Event()
+        future = _futures._submit(release.wait)
+        try:
+            with pytest.raises(FutureTimeoutError) as err_info:
+                future.result(timeout=0.01)
+        finally:
+            release.set()
+
+        assert err_info.value.message == (
+            'The asynchronous library call did not finish within 0.01'
+            ' seconds.')
+        assert future.result(timeout=5)
+
+    @staticmethod
+    def test_cancel():
+        future = _futures.Future()
+        called = []
+        future.add_done_callback(called.append)
+
+        assert future.cancel()
+        assert future.cancelled()
+        assert called == [future]
+        assert not future._set_running()
+        with pytest.raises(FutureCancelledError):
+            future.result()
+
+    @staticmethod
+    def test_cancel_running():
+        future = _futures.Future()
+        assert future._set_running()
+        assert not future.cancel()
+        assert future.running()
+
+    @staticmethod
+    def test_done_callback_after_done():
+        future = _futures.Future()
+        future._set_result('result')
+        called = []
+        future.add_done_callback(called.append)
+        assert called == [future]
+
+
+class TestAsCompleted:
+    @staticmethod
+    def test_as_completed_order():
+        first = _futures.Future()
+        second = _futures.Future()
+        second._set_result('second')
+
+        completed = libs.as_completed([first, second], timeout=5)
+        assert next(completed) is second
+        first._set_result('first')
+        assert next(completed) is first
+        with pytest.raises(StopIteration):
+            next(completed)
+
+    @staticmethod
+    def test_as_completed_timeout():
+        with pytest.raises(FutureTimeoutError):
+            list(libs.as_completed([_futures.Future()], timeout=0.01))
+
+
+class TestExecutor:
+    @staticmethod
+    def test_max_workers_bounds_concurrency():
+        executor = _futures._Executor(2)
+        lock = threading.Lock()
+        release = threading.Event()
+        state = {'running': 0, 'max_running': 0}
+
+        def work():
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'],
+                                           state['running'])
+            release.wait(5)
+            with lock:
+                state['running'] -= 1
+
+        futures = [executor.submit(work) for _ in range(6)]
+        release.set()
+        list(libs.as_completed(futures, timeout=5))
+
+        assert state['max_running'] <= 2
+
+    @staticmethod
+    def test_burst_after_idle_runs_concurrently():
+        executor = _futures._Executor(8)
+        executor.submit(lambda: None).result(5)
+        # Let the worker go back to waiting for work.
+        time.sleep(0.05)
+
+        start = time.time()
+        futures = [executor.submit(time.sleep, 0.1) for _ in range(8)]
+        list(libs.as_completed(futures, timeout=5))
+
+        assert time.time() - start < 0.4
+
+    @staticmethod
+    def test_set_max_async_workers_bad_type():
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.set_max_async_workers('4')
+
+        assert err_info.value.message == (
+            "The function set_max_async_workers's argument 'max_workers' was"
+            " type 'str' but should be of type 'int'.")
@@ -2,6 +2,8 @@
 # Copyright (c) 2019, 2020 by Delphix. All rights reserved.
 #
 
+import os
+
 import mock
 import pytest
 
@@ -211,6 +213,235 @@ class TestLibsRunBash:
             " type 'str' but should be of type 'bool' if defined.")
 
 
+class TestLibsRunBashBatch:
+    @staticmethod
+    def test_run_bash_batch(remote_connection, run_bash_locally):
+        commands = [
+            ('echo "one: $VALUE"; echo "err" >&2', {'VALUE': 'first'}),
+            ('printf "two: %s" "$VALUE"; exit 3', {'VALUE': "it's second"}),
+            ('echo "three: ${VALUE:-unset}"', None)
+        ]
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True) as run_bash:
+            results = libs.run_bash_batch(remote_connection, commands)
+
+        assert run_bash.call_count == 1
+        assert [result.exit_code for result in results] == [0, 3, 0]
+        assert [result.stdout for result in results] == [
+            'one: first\n', "two: it's second", 'three: unset\n']
+        assert [result.stderr for result in results] == ['err\n', '', '']
+
+    @staticmethod
+    def test_run_bash_batch_request(remote_connection, run_bash_locally):
+        def mock_run_bash(actual_run_bash_request):
+            assert actual_run_bash_request.use_login_shell
+            assert 'secret' not in actual_run_bash_request.command
+            assert 'secret' in actual_run_bash_request.variables.values()
+
+            actual_environment = (
+                actual_run_bash_request.remote_connection.environment)
+            assert (actual_environment.reference ==
+                    remote_connection.environment.reference)
+            return run_bash_locally(actual_run_bash_request)
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=mock_run_bash, create=True):
+            results = libs.run_bash_batch(
+                remote_connection,
+                [('echo "$PASSWORD"', {'PASSWORD': 'secret'})],
+                use_login_shell=True)
+
+        assert results[0].stdout == 'secret\n'
+
+    @staticmethod
+    def test_run_bash_batch_commands_are_isolated(remote_connection,
+                                                  run_bash_locally):
+        commands = [
+            ('cd /; export LEAKED=yes; exit 1', {'VALUE': 'first'}),
+            ('pwd; echo "${LEAKED:-no} ${VALUE:-unset}"', None)
+        ]
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            results = libs.run_bash_batch(remote_connection, commands)
+
+        assert results[0].exit_code == 1
+        assert results[1].exit_code == 0
+        assert results[1].stdout == '{}\nno unset\n'.format(os.getcwd())
+
+    @staticmethod
+    def test_run_bash_batch_check_true_failed_exitcode(remote_connection,
+                                                       run_bash_locally):
+        expected_message = (
+            'The script failed with exit code 2.'
+            ' stdout : second and  stderr : '
+        )
+        commands = [('echo first', None), ('printf second; exit 2', None)]
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            with pytest.raises(PluginScriptError) as info:
+                libs.run_bash_batch(remote_connection, commands, check=True)
+
+        assert info.value.message == expected_message
+
+    @staticmethod
+    def test_run_bash_batch_per_entry_check(remote_connection,
+                                            run_bash_locally):
+        commands = [('exit 1', None, False), ('exit 2', None, True)]
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            with pytest.raises(PluginScriptError) as info:
+                libs.run_bash_batch(remote_connection, commands)
+
+        assert info.value.message.startswith(
+            'The script failed with exit code 2.')
+
+    @staticmethod
+    def test_run_bash_batch_incomplete_output(remote_connection):
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = 137
+        response.return_value.stdout = 'stdout'
+        response.return_value.stderr = 'stderr'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True):
+            with pytest.raises(PluginScriptError) as info:
+                libs.run_bash_batch(remote_connection, [('command', None)])
+
+        assert info.value.message == (
+            'The batch script failed with exit code 137 after 0 of 1'
+            ' commands. stdout : stdout and  stderr : stderr')
+
+    @staticmethod
+    def test_run_bash_batch_with_actionable_error(remote_connection):
+        expected_id = 15
+        expected_message = 'Some message'
+
+        response = libs_pb2.RunBashResponse()
+        response.error.actionable_error.id = expected_id
+        response.error.actionable_error.message = expected_message
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True):
+            with pytest.raises(LibraryError) as err_info:
+                libs.run_bash_batch(remote_connection, [('command', None)])
+
+        assert err_info.value._id == expected_id
+        assert err_info.value.message == expected_message
+
+    @staticmethod
+    def test_run_bash_batch_commands_not_list(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_bash_batch(remote_connection, ('command', None))
+
+        assert err_info.value.message == (
+            "The function run_bash_batch's argument 'commands' was"
+            " type 'tuple' but should be of type 'list of tuple'.")
+
+    @staticmethod
+    def test_run_bash_batch_bad_entry(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_bash_batch(remote_connection, [('command', None), 'echo'])
+
+        assert err_info.value.message == (
+            "The function run_bash_batch's argument 'commands' was"
+            " a list of [type 'tuple', type 'str']"
+            " but should be of type 'list of tuple'.")
+
+    @staticmethod
+    def test_run_bash_batch_bad_variables(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_bash_batch(remote_connection, [('command', {'one': 1})])
+
+        assert err_info.value.message == (
+            "The function run_bash_batch's argument 'variables' was"
+            " a dict of {type 'str':type 'int'} but should be of"
+            " type 'dict of basestring:basestring' if defined.")
+
+
+class TestLibsRunAsync:
+    @staticmethod
+    def test_run_bash_async(remote_connection):
+        expected_run_bash_response = libs_pb2.RunBashResponse()
+        expected_run_bash_response.return_value.exit_code = 0
+        expected_run_bash_response.return_value.stdout = 'stdout'
+
+        def mock_run_bash(actual_run_bash_request):
+            assert actual_run_bash_request.command == 'command'
+            assert actual_run_bash_request.use_login_shell
+            return expected_run_bash_response
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=mock_run_bash, create=True):
+            future = libs.run_bash_async(remote_connection, 'command',
+                                         use_login_shell=True)
+            result = future.result(timeout=5)
+
+        assert result.stdout == 'stdout'
+
+    @staticmethod
+    def test_run_bash_async_check_true_failed_exitcode(remote_connection):
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = 1
+        response.return_value.stdout = 'stdout'
+        response.return_value.stderr = 'stderr'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True):
+            future = libs.run_bash_async(remote_connection, 'command',
+                                         check=True)
+            with pytest.raises(PluginScriptError) as info:
+                future.result(timeout=5)
+
+        assert info.value.message == (
+            'The script failed with exit code 1.'
+            ' stdout : stdout and  stderr : stderr')
+
+    @staticmethod
+    def test_run_bash_async_bad_command(remote_connection):
+        future = libs.run_bash_async(remote_connection, 10)
+
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            future.result(timeout=5)
+
+        assert err_info.value.message == (
+            "The function run_bash's argument 'command' was"
+            " type 'int' but should be of type 'basestring'.")
+
+    @staticmethod
+    def test_run_powershell_async_with_actionable_error(remote_connection):
+        response = libs_pb2.RunPowerShellResponse()
+        response.error.actionable_error.id = 15
+        response.error.actionable_error.message = 'Some message'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        return_value=response, create=True):
+            future = libs.run_powershell_async(remote_connection, 'command')
+            with pytest.raises(LibraryError) as err_info:
+                future.result(timeout=5)
+
+        assert err_info.value.message == 'Some message'
+
+    @staticmethod
+    def test_run_expect_async_as_completed(remote_connection):
+        def mock_run_expect(actual_run_expect_request):
+            response = libs_pb2.RunExpectResponse()
+            response.return_value.stdout = actual_run_expect_request.command
+            return response
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_expect',
+                        side_effect=mock_run_expect, create=True):
+            futures = [libs.run_expect_async(remote_connection, command)
+                       for command in ('one', 'two', 'three')]
+            outputs = {future.result().stdout
+                       for future in libs.as_completed(futures, timeout=5)}
+
+        assert outputs == {'one', 'two', 'three'}
+
+
 class TestLibsRunSync:
     @staticmethod
     def test_run_sync(remote_connection):
@@ -0,0 +1,182 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import logging
+import os
+import time
+from distutils.spawn import find_executable
+
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.libs import _local_engine
+from dlpx.virtualization.libs.exceptions import LibraryError
+
+
+@pytest.fixture
+def install(tmpdir):
+    def install(**kwargs):
+        kwargs.setdefault('sync_directory', str(tmpdir.join('sync')))
+        kwargs.setdefault('working_directory', str(tmpdir))
+        return _local_engine.install_local_engine(
+            _local_engine.LocalEngine(**kwargs))
+
+    yield install
+    _local_engine.uninstall_local_engine()
+
+
+class TestLocalEngine:
+    @staticmethod
+    def test_not_public():
+        assert not hasattr(libs, 'LocalEngine')
+        assert not hasattr(libs, 'install_local_engine')
+
+    @staticmethod
+    def test_run_bash(remote_connection, install, tmpdir):
+        install()
+
+        result = libs.run_bash(remote_connection,
+                               'echo "$GREETING"; pwd; echo oops >&2; exit 3',
+                               {'GREETING': u'caf\xe9'})
+
+        assert result.exit_code == 3
+        assert result.stdout == u'caf\xe9\n{}\n'.format(str(tmpdir))
+        assert result.stderr == 'oops\n'
+
+    @staticmethod
+    def test_latency(remote_connection, install):
+        install(latency=0.05, latency_jitter=0.01, seed=1)
+
+        start = time.time()
+        libs.run_bash(remote_connection, 'true')
+
+        assert time.time() - start >= 0.05
+
+    @staticmethod
+    def test_injected_failure(remote_connection, install):
+        install(failure_rate=1)
+
+        with pytest.raises(LibraryError) as err_info:
+            libs.run_bash(remote_connection, 'true')
+
+        assert err_info.value.message == (
+            'Injected failure of run_bash on environment'
+            ' environment-reference.')
+
+    @staticmethod
+    def test_missing_binary(remote_connection, install):
+        install(powershell_binary='no-such-powershell')
+
+        with pytest.raises(LibraryError) as err_info:
+            libs.run_powershell(remote_connection, 'Write-Output 1')
+
+        assert err_info.value.message.startswith(
+            'Failed to run no-such-powershell: ')
+
+    @staticmethod
+    @pytest.mark.skipif(not find_executable('expect'),
+                        reason='expect is not installed')
+    def test_run_expect(remote_connection, install):
+        install()
+
+        result = libs.run_expect(remote_connection, 'puts $env(NAME)',
+                                 {'NAME': 'value'})
+
+        assert result.stdout.strip() == 'value'
+
+    @staticmethod
+    def test_run_sync(remote_connection, install, tmpdir):
+        source = tmpdir.join('source')
+        source.join('keep', 'file').write('data', ensure=True)
+        source.join('keep', 'file.log').write('log', ensure=True)
+        source.join('cache', 'file').write('cache', ensure=True)
+        source.join('nested', 'cache', 'file').write('cache', ensure=True)
+        source.join('star*', 'file').write('star', ensure=True)
+        source.join('other', 'file').write('other', ensure=True)
+        os.symlink(str(source.join('other')), str(source.join('link')))
+        os.symlink(str(source.join('other')), str(source.join('followed')))
+        engine = install()
+
+        libs.run_sync(remote_connection, str(source),
+                      exclude_paths=['/cache/', '*.log', '/star\\*'],
+                      sym_links_to_follow=['followed'])
+
+        destination = engine.sync_destination('environment-reference',
+                                              str(source))
+        copied = sorted(
+            os.path.relpath(os.path.join(root, name), destination)
+            for root, directories, files in os.walk(destination)
+            for name in files + directories)
+        assert copied == ['followed', 'followed/file', 'keep', 'keep/file',
+                          'link', 'nested', 'nested/cache',
+                          'nested/cache/file', 'other', 'other/file']
+        assert os.path.islink(os.path.join(destination, 'link'))
+        assert not os.path.islink(os.path.join(destination, 'followed'))
+
+    @staticmethod
+    def test_run_sync_existing_destination(remote_connection, install,
+                                           tmpdir):
+        source = tmpdir.join('source')
+        source.join('data', 'file').write('old', ensure=True)
+        source.join('replaced').write('file', ensure=True)
+        engine = install()
+        destination = tmpdir.join(engine.sync_destination(
+            'environment-reference', str(source)), abs=True)
+        destination.join('extra').write('extra', ensure=True)
+        destination.join('data', 'file.log').write('log', ensure=True)
+        destination.join('replaced', 'file').write('directory', ensure=True)
+        source.join('data', 'file').write('new')
+
+        libs.run_sync(remote_connection, str(source),
+                      exclude_paths=['*.log'])
+
+        assert destination.join('data', 'file').read() == 'new'
+        assert destination.join('data', 'file.log').read() == 'log'
+        assert destination.join('extra').read() == 'extra'
+        assert destination.join('replaced').read() == 'file'
+
+    @staticmethod
+    def test_run_sync_partitioned(remote_connection, install, tmpdir):
+        source = tmpdir.join('source')
+        for index in range(20):
+            source.join('entry{}'.format(index), 'nested',
+                        'file').write(str(index), ensure=True)
+        engine = install(latency_jitter=0.01)
+
+        results = libs.run_sync_partitioned(remote_connection, str(source),
+                                            max_partitions=8)
+
+        assert all(result.error is None for result in results)
+        destination = tmpdir.join(engine.sync_destination(
+            'environment-reference', str(source)), abs=True)
+        assert sorted(path.basename for path in destination.listdir()) == (
+            sorted('entry{}'.format(index) for index in range(20)))
+        assert all(
+            destination.join('entry{}'.format(index), 'nested',
+                             'file').read() == str(index)
+            for index in range(20))
+
+    @staticmethod
+    def test_log(install):
+        engine = install()
+        handler = libs.PlatformHandler()
+        logger = logging.getLogger('test_local_engine')
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        try:
+            logger.info('message')
+        finally:
+            logger.removeHandler(handler)
+
+        assert engine.logs == [('INFO', 'message')]
+
+    @staticmethod
+    def test_uninstall(install):
+        engine = install()
+        from dlpx.virtualization._engine import libs as internal_libs
+        assert internal_libs.run_bash == engine.run_bash
+
+        _local_engine.uninstall_local_engine()
+        from dlpx.virtualization._engine import libs as internal_libs
+        assert internal_libs.run_bash != engine.run_bash
@@ -3,10 +3,14 @@
 #
 
 import logging
+import time
+
 import mock
 import pytest
 
-from dlpx.virtualization.libs import PlatformHandler
+from dlpx.virtualization.common._operation_context import operation_wrapper
+from dlpx.virtualization.libs import (BufferedPlatformHandler, PlatformHandler,
+                                      set_engine_log_level)
 from dlpx.virtualization.api.libs_pb2 import LogRequest
 from dlpx.virtualization.api.libs_pb2 import LogResult
 from dlpx.virtualization.api.libs_pb2 import LogResponse
@@ -86,3 +90,321 @@ class TestPythonHandler:
         log_request.level = LogRequest.ERROR
 
         mock_internal_libs.log.assert_called_with(log_request)
+
+
+class TestPlatformHandlerDropping:
+
+    @staticmethod
+    @pytest.fixture()
+    def mock_log():
+        response = LogResponse()
+        response.return_value.CopyFrom(LogResult())
+        with mock.patch("dlpx.virtualization._engine.libs.log",
+                        return_value=response, create=True) as mock_log:
+            yield mock_log
+
+    @staticmethod
+    @pytest.fixture()
+    def handler_logger():
+        handlers = []
+
+        def make_logger(name='dropping', **kwargs):
+            handler = PlatformHandler(**kwargs)
+            handlers.append(handler)
+            logger = logging.getLogger(name)
+            logger.propagate = False
+            logger.setLevel(logging.NOTSET)
+            logger.handlers = [handler]
+            return logger, handler
+
+        yield make_logger
+        for handler in handlers:
+            handler.close()
+        set_engine_log_level(logging.NOTSET)
+
+    @staticmethod
+    def _messages(mock_log):
+        return [(c[0][0].message, c[0][0].level)
+                for c in mock_log.call_args_list]
+
+    @staticmethod
+    def test_engine_log_level(mock_log, handler_logger):
+        logger, handler = handler_logger()
+        set_engine_log_level(logging.INFO)
+
+        with mock.patch.object(handler, 'format',
+                               wraps=handler.format) as mock_format:
+            logger.debug('debug')
+            logger.info('info')
+
+        assert mock_format.call_count == 1
+        assert TestPlatformHandlerDropping._messages(mock_log) == [
+            ('info', LogRequest.INFO)]
+        assert handler.dropped == {'threshold': 1}
+
+    @staticmethod
+    def test_suppress_duplicates(mock_log, handler_logger):
+        logger, handler = handler_logger(suppress_duplicates=True)
+
+        for _ in range(4):
+            logger.info('retrying %s', 'command')
+        logger.info('done')
+        logger.info('done')
+
+        assert TestPlatformHandlerDropping._messages(mock_log) == [
+            ('retrying command', LogRequest.INFO),
+            ('Last message repeated 3 times.', LogRequest.INFO),
+            ('done', LogRequest.INFO)]
+        assert handler.dropped == {'duplicate': 4}
+
+        operation_wrapper('operation')(lambda: None)()
+
+        assert TestPlatformHandlerDropping._messages(mock_log)[-1] == (
+            'Last message repeated 1 times.', LogRequest.INFO)
+
+    @staticmethod
+    def test_duplicates_sent_by_default(mock_log, handler_logger):
+        logger, handler = handler_logger()
+
+        logger.info('same')
+        logger.info('same')
+
+        assert mock_log.call_count == 2
+        assert not handler.dropped
+
+    @staticmethod
+    def test_rate_limit(mock_log, handler_logger):
+        logger, handler = handler_logger(rate_limit=1, rate_limit_burst=2)
+        other_logger, _ = handler_logger('other', rate_limit=1)
+        other_logger.handlers = [handler]
+
+        with mock.patch('time.time', return_value=100.0):
+            for i in range(4):
+                logger.info('info %d', i)
+            logger.error('error')
+            other_logger.info('other')
+        with mock.patch('time.time', return_value=101.0):
+            logger.info('later')
+
+        assert TestPlatformHandlerDropping._messages(mock_log) == [
+            ('info 0', LogRequest.INFO),
+            ('info 1', LogRequest.INFO),
+            ('error', LogRequest.ERROR),
+            ('other', LogRequest.INFO),
+            ('later', LogRequest.INFO)]
+        assert handler.dropped == {'rate_limit': 2}
+
+
+class TestBufferedPlatformHandler:
+
+    @staticmethod
+    @pytest.fixture()
+    def mock_log(successful_response):
+        with mock.patch("dlpx.virtualization._engine.libs.log",
+                        return_value=successful_response,
+                        create=True) as mock_log:
+            yield mock_log
+
+    @staticmethod
+    @pytest.fixture()
+    def successful_response():
+        response = LogResponse()
+        response.return_value.CopyFrom(LogResult())
+        return response
+
+    @staticmethod
+    @pytest.fixture()
+    def buffered_logger():
+        handlers = []
+
+        def make_logger(**kwargs):
+            kwargs.setdefault('flush_interval', None)
+            handler = BufferedPlatformHandler(**kwargs)
+            handlers.append(handler)
+            logger = logging.getLogger('buffered_{}'.format(len(handlers)))
+            logger.propagate = False
+            logger.setLevel(logging.NOTSET)
+            logger.handlers = [handler]
+            return logger, handler
+
+        yield make_logger
+        for handler in handlers:
+            handler.close()
+
+    @staticmethod
+    def _log_request(message, level):
+        log_request = LogRequest()
+        log_request.message = message
+        log_request.level = level
+        return mock.call(log_request)
+
+    @staticmethod
+    def test_flush_batches_records(mock_log, buffered_logger):
+        logger, handler = buffered_logger()
+
+        logger.debug('first')
+        logger.debug('second: %s', 'parameter')
+        assert not mock_log.called
+
+        handler.flush()
+
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request(
+                'first\nsecond: parameter', LogRequest.DEBUG)]
+
+    @staticmethod
+    def test_flush_splits_levels(mock_log, buffered_logger):
+        logger, handler = buffered_logger()
+
+        logger.debug('one')
+        logger.info('two')
+        logger.info('three')
+        logger.debug('four')
+        handler.flush()
+
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request('one', LogRequest.DEBUG),
+            TestBufferedPlatformHandler._log_request('two\nthree',
+                                                     LogRequest.INFO),
+            TestBufferedPlatformHandler._log_request('four',
+                                                     LogRequest.DEBUG)]
+
+    @staticmethod
+    def test_full_batch_flushes_immediately(mock_log, buffered_logger):
+        logger, handler = buffered_logger(batch_size=2)
+
+        logger.info('one')
+        assert not mock_log.called
+        logger.info('two')
+
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request('one\ntwo',
+                                                     LogRequest.INFO)]
+
+    @staticmethod
+    def test_error_flushes_immediately(mock_log, buffered_logger):
+        logger, handler = buffered_logger()
+
+        logger.info('info')
+        logger.warning('warning')
+        logger.error('error')
+
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request('info', LogRequest.INFO),
+            TestBufferedPlatformHandler._log_request('warning\nerror',
+                                                     LogRequest.ERROR)]
+
+    @staticmethod
+    @pytest.mark.parametrize('policy,expected', [
+        (BufferedPlatformHandler.DROP_OLDEST, 'two\nthree'),
+        (BufferedPlatformHandler.DROP_NEWEST, 'one\ntwo')])
+    def test_overflow_drop(mock_log, buffered_logger, policy, expected):
+        logger, handler = buffered_logger(capacity=2, overflow_policy=policy)
+
+        logger.info('one')
+        logger.info('two')
+        logger.info('three')
+        assert handler.dropped['overflow'] == 1
+        handler.flush()
+
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request(
+                '1 log records were dropped because the log buffer was'
+                ' full.', LogRequest.ERROR),
+            TestBufferedPlatformHandler._log_request(expected,
+                                                     LogRequest.INFO)]
+
+    @staticmethod
+    def test_overflow_flush(mock_log, buffered_logger):
+        logger, handler = buffered_logger(
+            capacity=2, overflow_policy=BufferedPlatformHandler.FLUSH)
+
+        logger.info('one')
+        logger.info('two')
+        logger.info('three')
+
+        assert not handler.dropped
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request('one\ntwo\nthree',
+                                                     LogRequest.INFO)]
+
+    @staticmethod
+    def test_unknown_overflow_policy():
+        with pytest.raises(ValueError):
+            BufferedPlatformHandler(overflow_policy='block')
+
+    @staticmethod
+    def test_background_flush(mock_log, buffered_logger):
+        logger, handler = buffered_logger(flush_interval=0.01)
+
+        logger.info('background')
+
+        deadline = time.time() + 5
+        while not mock_log.called and time.time() < deadline:
+            time.sleep(0.01)
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request('background',
+                                                     LogRequest.INFO)]
+
+    @staticmethod
+    def test_background_flush_error(mock_log, buffered_logger,
+                                    successful_response):
+        mock_log.side_effect = [RuntimeError('engine unavailable'),
+                                successful_response]
+        logger, handler = buffered_logger(flush_interval=0.01)
+
+        with mock.patch('sys.stderr') as stderr:
+            logger.info('lost')
+            deadline = time.time() + 5
+            while mock_log.call_count < 1 and time.time() < deadline:
+                time.sleep(0.01)
+            logger.info('sent')
+            while mock_log.call_count < 2 and time.time() < deadline:
+                time.sleep(0.01)
+
+        assert stderr.write.called
+        assert mock_log.call_args_list[1] == (
+            TestBufferedPlatformHandler._log_request('sent', LogRequest.INFO))
+        assert handler._flusher.is_alive()
+
+    @staticmethod
+    def test_flush_at_operation_end(mock_log, buffered_logger):
+        logger, handler = buffered_logger()
+
+        @operation_wrapper('operation')
+        def operation():
+            logger.info('in operation')
+            assert not mock_log.called
+
+        operation()
+
+        assert mock_log.call_args_list == [
+            TestBufferedPlatformHandler._log_request('in operation',
+                                                     LogRequest.INFO)]
+
+    @staticmethod
+    def test_flush_error_at_operation_end(mock_log, buffered_logger):
+        mock_log.side_effect = RuntimeError('engine unavailable')
+        logger, handler = buffered_logger()
+
+        @operation_wrapper('operation')
+        def operation():
+            logger.info('in operation')
+            return 'result'
+
+        with mock.patch('sys.stderr') as stderr:
+            assert operation() == 'result'
+
+        assert mock_log.called
+        assert stderr.write.called
+
+    @staticmethod
+    def test_close_flushes_and_unregisters(mock_log, buffered_logger):
+        logger, handler = buffered_logger()
+
+        logger.info('before close')
+        handler.close()
+        assert mock_log.call_count == 1
+
+        operation_wrapper('operation')(lambda: None)()
+        assert mock_log.call_count == 1
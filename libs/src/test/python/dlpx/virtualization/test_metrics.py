@@ -0,0 +1,201 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import json
+import logging
+import StringIO
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._operation_context import operation_wrapper
+from dlpx.virtualization.libs.exceptions import LibraryError
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    libs.reset_metrics()
+    yield
+    libs.reset_metrics()
+
+
+@pytest.fixture
+def sink():
+    sinks = []
+
+    def add(sink):
+        libs.add_metrics_sink(sink)
+        sinks.append(sink)
+        return sink
+
+    yield add
+    for sink in sinks:
+        libs.remove_metrics_sink(sink)
+
+
+def bash_response(exit_code=0, stdout='', stderr=''):
+    response = libs_pb2.RunBashResponse()
+    response.return_value.exit_code = exit_code
+    response.return_value.stdout = stdout
+    response.return_value.stderr = stderr
+    return response
+
+
+class TestMetrics:
+    @staticmethod
+    def test_run_bash_recorded(remote_connection, sink):
+        sink(libs.MetricsSink())
+        response = bash_response(2, u'caf\xe9', 'error')
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True):
+            with mock.patch('dlpx.virtualization.libs._metrics.time') as clock:
+                clock.time.side_effect = [10.0, 10.3]
+                libs.run_bash(remote_connection, 'command')
+
+        histograms = libs.call_histograms()
+        assert list(histograms) == [('run_bash', 'environment-reference')]
+        histogram = histograms[('run_bash', 'environment-reference')]
+        assert histogram.count == 1
+        assert histogram.total_seconds == pytest.approx(0.3)
+        assert histogram.buckets[histogram.bounds.index(0.5)] == 1
+        assert histogram.stdout_bytes == 5
+        assert histogram.stderr_bytes == 5
+        assert histogram.response_bytes == response.ByteSize()
+        assert histogram.request_bytes > len('command')
+        assert histogram.non_zero_exit_codes == 1
+        assert histogram.failures == 0
+
+    @staticmethod
+    def test_sizes_not_measured_without_sink(remote_connection):
+        response = bash_response(0, 'output' * 1000)
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True):
+            with mock.patch('dlpx.virtualization.libs._metrics._text_bytes',
+                            side_effect=AssertionError) as text_bytes:
+                libs.run_bash(remote_connection, 'command')
+
+        assert not text_bytes.called
+        histogram = libs.call_histograms()[
+            ('run_bash', 'environment-reference')]
+        assert histogram.count == 1
+        assert (histogram.request_bytes, histogram.response_bytes,
+                histogram.stdout_bytes) == (0, 0, 0)
+
+    @staticmethod
+    def test_library_error_recorded(remote_connection):
+        response = libs_pb2.RunSyncResponse()
+        response.error.actionable_error.id = 1
+        response.error.actionable_error.message = 'error'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_sync',
+                        return_value=response, create=True):
+            with pytest.raises(LibraryError):
+                libs.run_sync(remote_connection, 'source')
+
+        histogram = libs.call_histograms()[
+            ('run_sync', 'environment-reference')]
+        assert histogram.failures == 1
+        assert histogram.stdout_bytes == 0
+
+    @staticmethod
+    def test_engine_exception_recorded(remote_connection):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=IOError('connection lost'), create=True):
+            with pytest.raises(IOError):
+                libs.run_bash(remote_connection, 'command')
+
+        histogram = libs.call_histograms()[
+            ('run_bash', 'environment-reference')]
+        assert histogram.failures == 1
+        assert histogram.response_bytes == 0
+
+    @staticmethod
+    def test_log_recorded():
+        response = libs_pb2.LogResponse()
+        response.return_value.CopyFrom(libs_pb2.LogResult())
+
+        with mock.patch('dlpx.virtualization._engine.libs.log',
+                        return_value=response, create=True):
+            libs.libs._log_request('message', logging.INFO)
+
+        assert libs.call_histograms()[('log', None)].count == 1
+
+    @staticmethod
+    def test_dump_metrics_json(remote_connection):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=bash_response(), create=True):
+            libs.run_bash(remote_connection, 'command')
+            libs.run_bash(remote_connection, 'command')
+
+        dump = json.loads(libs.dump_metrics_json())
+        assert len(dump) == 1
+        assert dump[0]['kind'] == 'run_bash'
+        assert dump[0]['environment'] == 'environment-reference'
+        assert dump[0]['count'] == 2
+        assert sum(dump[0]['buckets']) == 2
+
+    @staticmethod
+    def test_json_dump_sink(remote_connection, sink):
+        stream = StringIO.StringIO()
+        sink(libs.JsonDumpSink(stream))
+
+        @operation_wrapper('operation')
+        def operation():
+            libs.run_bash(remote_connection, 'command')
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=bash_response(stdout='out'),
+                        create=True):
+            operation()
+            operation()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert len(lines) == 2
+        for line in lines:
+            assert line['operation'] == 'operation'
+            [call] = line['calls']
+            assert call['kind'] == 'run_bash'
+            assert call['operation'] == 'operation'
+            assert call['stdout_bytes'] == 3
+
+    @staticmethod
+    def test_log_summary_sink(remote_connection, sink):
+        logger = mock.Mock()
+        sink(libs.LogSummarySink(logger))
+
+        @operation_wrapper('operation')
+        def operation():
+            libs.run_bash(remote_connection, 'command')
+            libs.run_bash(remote_connection, 'command')
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=bash_response(), create=True):
+            with mock.patch('dlpx.virtualization.libs._metrics.time') as clock:
+                clock.time.side_effect = [0, 2, 10, 11]
+                operation()
+
+        [(level, summary), _] = logger.log.call_args
+        assert level == logging.INFO
+        assert summary == (
+            'operation made 2 library calls in 3.000 seconds:\n'
+            '  run_bash on environment-reference: 2 calls, 3.000s total,'
+            ' 2.000s max, p90 <= 2.000s, {} bytes sent, {} bytes received,'
+            ' 0 failed, 0 non-zero exit codes'.format(
+                libs.call_histograms()[
+                    ('run_bash', 'environment-reference')].request_bytes,
+                2 * bash_response().ByteSize()))
+
+    @staticmethod
+    def test_remove_metrics_sink(remote_connection, sink):
+        stream = StringIO.StringIO()
+        json_sink = sink(libs.JsonDumpSink(stream))
+        libs.remove_metrics_sink(json_sink)
+
+        operation_wrapper('operation')(lambda: None)()
+
+        assert stream.getvalue() == ''
@@ -0,0 +1,184 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteEnvironment,
+                                                        RemoteHost)
+from dlpx.virtualization.libs.exceptions import PluginScriptError
+
+
+@pytest.fixture(autouse=True)
+def reset_output_budget():
+    yield
+    libs.set_output_budget()
+
+
+def bash_response(exit_code, stdout, stderr):
+    response = libs_pb2.RunBashResponse()
+    response.return_value.exit_code = exit_code
+    response.return_value.stdout = stdout
+    response.return_value.stderr = stderr
+    return response
+
+
+class TestOutputBudget:
+    @staticmethod
+    def test_output_spilled(remote_connection, tmpdir):
+        libs.set_output_budget(max_size=100, excerpt_size=10,
+                               spill_directory=str(tmpdir))
+        stdout = 'head' + 'x' * 200 + u'tail\xe9'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=bash_response(0, stdout, 'short'),
+                        create=True):
+            result = libs.run_bash(remote_connection, 'command')
+
+        [spill_file] = tmpdir.listdir()
+        assert spill_file.read_binary().decode('utf-8') == stdout
+        assert result.stdout == (
+            u'headxxxxxx\n... 189 characters omitted, full output in {} ...\n'
+            u'xxxxxtail\xe9'.format(spill_file))
+        assert result.stderr == 'short'
+
+    @staticmethod
+    def test_output_kept_without_budget(remote_connection):
+        stdout = 'x' * 100000
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=bash_response(0, stdout, ''),
+                        create=True):
+            result = libs.run_bash(remote_connection, 'command')
+
+        assert result.stdout == stdout
+
+    @staticmethod
+    def test_error_message_excerpt(remote_connection, tmpdir):
+        libs.set_output_budget(max_size=2000, excerpt_size=10,
+                               spill_directory=str(tmpdir))
+        stderr = 'a' * 10 + 'b' * 1000 + 'c' * 10
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=bash_response(1, 'out', stderr),
+                        create=True):
+            with pytest.raises(PluginScriptError) as err_info:
+                libs.run_bash(remote_connection, 'command', check=True)
+
+        [spill_file] = tmpdir.listdir()
+        assert spill_file.read() == stderr
+        assert err_info.value.message == (
+            'The script failed with exit code 1. stdout : out and '
+            ' stderr : aaaaaaaaaa\n... 1000 characters omitted, full output'
+            ' in {} ...\ncccccccccc'.format(spill_file))
+
+    @staticmethod
+    def test_error_message_full_without_budget(remote_connection):
+        stderr = 'e' * 100000
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=bash_response(1, 'out', stderr),
+                        create=True):
+            with pytest.raises(PluginScriptError) as err_info:
+                libs.run_bash(remote_connection, 'command', check=True)
+
+        assert err_info.value.message.endswith(' stderr : ' + stderr)
+
+    @staticmethod
+    def test_error_message_keeps_spill_pointer(remote_connection, tmpdir):
+        libs.set_output_budget(max_size=20, excerpt_size=10,
+                               spill_directory=str(tmpdir))
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_expect',
+                        return_value=libs_pb2.RunExpectResponse(
+                            return_value=libs_pb2.RunExpectResult(
+                                exit_code=1, stdout='y' * 50)),
+                        create=True):
+            with pytest.raises(PluginScriptError) as err_info:
+                libs.run_expect(remote_connection, 'command', check=True)
+
+        [spill_file] = tmpdir.listdir()
+        assert 'full output in {}'.format(spill_file) in (
+            err_info.value.message)
+
+    @staticmethod
+    def test_run_bash_batch_spilled(remote_connection, run_bash_locally,
+                                    tmpdir):
+        libs.set_output_budget(max_size=100, excerpt_size=10,
+                               spill_directory=str(tmpdir))
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            results = libs.run_bash_batch(remote_connection, [
+                ('printf "%0200d" 0', None), ('echo short', None)])
+
+        assert len(tmpdir.listdir()) == 1
+        assert len(results[0].stdout) < 200
+        assert results[1].stdout == 'short\n'
+
+    @staticmethod
+    def _scratch_connection(remote_user, scratch_path):
+        host = RemoteHost('host', 'host-reference', 'binary_path',
+                          scratch_path)
+        return RemoteConnection(
+            RemoteEnvironment('environment', 'environment-reference', host),
+            remote_user)
+
+    @staticmethod
+    def test_read_file_keeps_full_output(remote_connection, run_bash_locally,
+                                         tmpdir):
+        libs.set_output_budget(max_size=100, excerpt_size=10,
+                               spill_directory=str(tmpdir.mkdir('spill')))
+        content = ''.join(chr(i) for i in range(256)) * 8
+        path = tmpdir.join('file')
+        path.write(content, mode='wb')
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            assert libs.read_file(remote_connection, str(path),
+                                  chunk_size=1024) == content
+
+        assert tmpdir.join('spill').listdir() == []
+
+    @staticmethod
+    def test_run_bash_stream_keeps_full_output(remote_user, run_bash_locally,
+                                               tmpdir):
+        libs.set_output_budget(max_size=100, excerpt_size=10,
+                               spill_directory=str(tmpdir.mkdir('spill')))
+        connection = TestOutputBudget._scratch_connection(
+            remote_user, str(tmpdir.mkdir('scratch')))
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            output = list(libs.run_bash_stream(
+                connection, 'for i in $(seq 100); do echo "line $i"; done',
+                poll_interval=0.01))
+
+        assert output == [('stdout', 'line {}\n'.format(i))
+                          for i in range(1, 101)]
+        assert tmpdir.join('spill').listdir() == []
+
+    @staticmethod
+    def test_run_bash_script_output_limited(remote_user, run_bash_locally,
+                                            tmpdir):
+        libs.set_output_budget(max_size=100, excerpt_size=10,
+                               spill_directory=str(tmpdir.mkdir('spill')))
+        connection = TestOutputBudget._scratch_connection(
+            remote_user, str(tmpdir.mkdir('scratch')))
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            result = libs.run_bash_script(connection, 'printf "%0200d" 0')
+
+        assert result.exit_code == 0
+        assert len(result.stdout) < 200
+        assert len(tmpdir.join('spill').listdir()) == 1
+
+    @staticmethod
+    def test_set_output_budget_too_small():
+        with pytest.raises(ValueError):
+            libs.set_output_budget(max_size=10, excerpt_size=10)
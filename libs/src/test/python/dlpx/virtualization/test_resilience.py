@@ -0,0 +1,235 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import threading
+import time
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.libs.exceptions import (CircuitOpenError,
+                                                 DeadlineExceededError,
+                                                 IncorrectArgumentTypeError,
+                                                 LibraryError)
+
+
+@pytest.fixture(autouse=True)
+def resilience():
+    yield
+    libs.set_circuit_breaker()
+    libs.set_library_retries()
+    libs.reset_circuits()
+
+
+def failure():
+    response = libs_pb2.RunBashResponse()
+    response.error.actionable_error.id = 1
+    response.error.actionable_error.message = 'host unreachable'
+    return response
+
+
+def success():
+    response = libs_pb2.RunBashResponse()
+    response.return_value.stdout = 'output'
+    return response
+
+
+def patch_run_bash(*responses):
+    return mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                      side_effect=list(responses), create=True)
+
+
+class TestCircuitBreaker:
+    @staticmethod
+    def test_circuit_opens(remote_connection):
+        libs.set_circuit_breaker(failure_threshold=2, cooldown=60)
+
+        with patch_run_bash(failure(), failure()) as run_bash:
+            for _ in range(2):
+                with pytest.raises(LibraryError):
+                    libs.run_bash(remote_connection, 'command')
+            with pytest.raises(CircuitOpenError) as err_info:
+                libs.run_bash(remote_connection, 'command')
+
+        assert run_bash.call_count == 2
+        assert isinstance(err_info.value, LibraryError)
+        assert err_info.value.environment == 'environment-reference'
+        assert 59 < err_info.value.retry_after <= 60
+        assert libs.circuit_states() == {'environment-reference': 'OPEN'}
+
+    @staticmethod
+    def test_success_resets_failures(remote_connection):
+        libs.set_circuit_breaker(failure_threshold=2)
+
+        with patch_run_bash(failure(), success(), failure()):
+            with pytest.raises(LibraryError):
+                libs.run_bash(remote_connection, 'command')
+            libs.run_bash(remote_connection, 'command')
+            with pytest.raises(LibraryError):
+                libs.run_bash(remote_connection, 'command')
+
+        assert libs.circuit_states() == {'environment-reference': 'CLOSED'}
+
+    @staticmethod
+    def test_probe_closes_circuit(remote_connection):
+        libs.set_circuit_breaker(failure_threshold=1, cooldown=0.05)
+
+        with patch_run_bash(failure(), success()):
+            with pytest.raises(LibraryError):
+                libs.run_bash(remote_connection, 'command')
+            time.sleep(0.05)
+            result = libs.run_bash(remote_connection, 'command')
+
+        assert result.stdout == 'output'
+        assert libs.circuit_states() == {}
+
+    @staticmethod
+    def test_failed_probe_opens_circuit(remote_connection):
+        libs.set_circuit_breaker(failure_threshold=3, cooldown=0.05)
+        for _ in range(3):
+            with patch_run_bash(failure()):
+                with pytest.raises(LibraryError):
+                    libs.run_bash(remote_connection, 'command')
+        time.sleep(0.05)
+
+        with patch_run_bash(failure()):
+            with pytest.raises(LibraryError):
+                libs.run_bash(remote_connection, 'command')
+            with pytest.raises(CircuitOpenError):
+                libs.run_bash(remote_connection, 'command')
+
+    @staticmethod
+    def test_single_probe(remote_connection):
+        libs.set_circuit_breaker(failure_threshold=1, cooldown=0)
+        with patch_run_bash(failure()):
+            with pytest.raises(LibraryError):
+                libs.run_bash(remote_connection, 'command')
+
+        probing = threading.Event()
+        release = threading.Event()
+
+        def run_bash(request):
+            probing.set()
+            release.wait(5)
+            return success()
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash, create=True):
+            probe = libs.run_bash_async(remote_connection, 'probe')
+            assert probing.wait(5)
+            assert libs.circuit_states() == {
+                'environment-reference': 'HALF_OPEN'}
+            with pytest.raises(CircuitOpenError) as err_info:
+                libs.run_bash(remote_connection, 'command')
+            release.set()
+            probe.result(timeout=5)
+
+        assert err_info.value.retry_after == 0
+        assert libs.circuit_states() == {}
+
+    @staticmethod
+    def test_timeouts_open_circuit(remote_connection):
+        libs.set_circuit_breaker(failure_threshold=2, cooldown=60)
+        release = threading.Event()
+
+        def run_bash(request):
+            release.wait(5)
+            return success()
+
+        try:
+            with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                            side_effect=run_bash, create=True) as mock_bash:
+                for _ in range(2):
+                    with pytest.raises(DeadlineExceededError):
+                        libs.run_bash(remote_connection, 'command',
+                                      timeout=0.05)
+                with pytest.raises(CircuitOpenError):
+                    libs.run_bash(remote_connection, 'command', timeout=0.05)
+        finally:
+            release.set()
+
+        assert mock_bash.call_count == 2
+        assert libs.circuit_states() == {'environment-reference': 'OPEN'}
+
+    @staticmethod
+    def test_expired_before_call_not_counted(remote_connection):
+        libs.set_circuit_breaker(failure_threshold=1)
+
+        with patch_run_bash() as run_bash:
+            with libs.deadline(0):
+                with pytest.raises(DeadlineExceededError):
+                    libs.run_bash(remote_connection, 'command')
+
+        assert not run_bash.called
+        assert libs.circuit_states() == {}
+
+    @staticmethod
+    def test_bad_threshold():
+        with pytest.raises(IncorrectArgumentTypeError):
+            libs.set_circuit_breaker(failure_threshold='3')
+        with pytest.raises(ValueError):
+            libs.set_circuit_breaker(failure_threshold=0)
+
+
+class TestLibraryRetries:
+    @staticmethod
+    def test_retried_until_success(remote_connection):
+        libs.set_library_retries(attempts=3, base_delay=0.001)
+
+        with patch_run_bash(failure(), failure(), success()) as run_bash:
+            result = libs.run_bash(remote_connection, 'command')
+
+        assert result.stdout == 'output'
+        assert run_bash.call_count == 3
+
+    @staticmethod
+    def test_attempts_exhausted(remote_connection):
+        libs.set_library_retries(attempts=2, base_delay=0.001)
+
+        with patch_run_bash(failure(), failure()) as run_bash:
+            with pytest.raises(LibraryError) as err_info:
+                libs.run_bash(remote_connection, 'command')
+
+        assert run_bash.call_count == 2
+        assert err_info.value.message == 'host unreachable'
+
+    @staticmethod
+    def test_delay_is_jittered(remote_connection):
+        libs.set_library_retries(attempts=3, base_delay=1, max_delay=1.5)
+
+        with patch_run_bash(failure(), failure(), success()):
+            with mock.patch('random.uniform', return_value=0) as uniform:
+                libs.run_bash(remote_connection, 'command')
+
+        assert uniform.call_args_list == [mock.call(0, 1), mock.call(0, 1.5)]
+
+    @staticmethod
+    def test_no_retry_past_deadline(remote_connection):
+        libs.set_library_retries(attempts=3, base_delay=10)
+
+        with patch_run_bash(failure(), success()) as run_bash:
+            with mock.patch('random.uniform', return_value=5):
+                with pytest.raises(LibraryError):
+                    libs.run_bash(remote_connection, 'command', timeout=1)
+
+        assert run_bash.call_count == 1
+
+    @staticmethod
+    def test_no_retry_after_circuit_opened(remote_connection):
+        libs.set_library_retries(attempts=5, base_delay=0.001)
+        libs.set_circuit_breaker(failure_threshold=2)
+
+        with patch_run_bash(failure(), failure(), success()) as run_bash:
+            with pytest.raises(LibraryError) as err_info:
+                libs.run_bash(remote_connection, 'command')
+
+        assert run_bash.call_count == 2
+        assert not isinstance(err_info.value, CircuitOpenError)
+
+    @staticmethod
+    def test_bad_attempts():
+        with pytest.raises(ValueError):
+            libs.set_library_retries(attempts=0)
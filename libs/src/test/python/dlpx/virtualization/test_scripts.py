@@ -0,0 +1,263 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import hashlib
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteEnvironment,
+                                                        RemoteHost)
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+SCRIPT = '''\
+echo "$# arguments"
+for arg in "$@"; do echo "[$arg]"; done
+echo "$GREETING"
+exit "${EXIT_CODE:-0}"
+'''
+
+
+class TestLibsRunBashScript:
+    @staticmethod
+    @pytest.fixture
+    def scratch_connection(tmpdir, remote_user):
+        host = RemoteHost('host', 'host-reference', 'binary_path',
+                          str(tmpdir))
+        environment = RemoteEnvironment('environment',
+                                        'environment-reference', host)
+        return RemoteConnection(environment, remote_user)
+
+    @staticmethod
+    @pytest.fixture
+    def local_run_bash(run_bash_locally):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally,
+                        create=True) as run_bash:
+            yield run_bash
+
+    @staticmethod
+    def test_run_bash_script(scratch_connection, local_run_bash, tmpdir):
+        args = ['one', 'two words', '"quoted" $HOME']
+
+        first = libs.run_bash_script(scratch_connection, SCRIPT, args,
+                                     {'GREETING': 'hello'})
+        second = libs.run_bash_script(scratch_connection, SCRIPT, ['last'],
+                                      {'GREETING': 'bye'})
+
+        assert first.stdout == (
+            '3 arguments\n[one]\n[two words]\n["quoted" $HOME]\nhello\n')
+        assert second.stdout == '1 arguments\n[last]\nbye\n'
+        staged = tmpdir.join('dlpx-scripts',
+                             hashlib.sha256(SCRIPT).hexdigest() + '.sh')
+        assert staged.read() == SCRIPT
+        assert tmpdir.join('dlpx-scripts').listdir() == [staged]
+
+        # The first call stages the script, the second one only runs it.
+        requests = [call[0][0] for call in local_run_bash.call_args_list]
+        assert len(requests) == 3
+        assert 'DLPX_SCRIPT_CONTENT' not in requests[0].variables
+        assert requests[1].variables['DLPX_SCRIPT_CONTENT'] == SCRIPT
+        assert 'DLPX_SCRIPT_CONTENT' not in requests[2].variables
+
+    @staticmethod
+    def test_run_bash_script_restaged(scratch_connection, local_run_bash,
+                                      tmpdir):
+        libs.run_bash_script(scratch_connection, SCRIPT)
+        tmpdir.join('dlpx-scripts').remove()
+
+        result = libs.run_bash_script(scratch_connection, SCRIPT)
+
+        assert result.stdout == '0 arguments\n\n'
+        assert local_run_bash.call_count == 4
+
+    @staticmethod
+    def test_run_bash_script_corrupt_copy_restaged(scratch_connection,
+                                                   local_run_bash, tmpdir):
+        libs.run_bash_script(scratch_connection, SCRIPT)
+        staged = tmpdir.join('dlpx-scripts',
+                             hashlib.sha256(SCRIPT).hexdigest() + '.sh')
+        staged.write('echo wrong script')
+
+        result = libs.run_bash_script(scratch_connection, SCRIPT, ['a'])
+
+        assert result.stdout == '1 arguments\n[a]\n\n'
+        assert staged.read() == SCRIPT
+        assert local_run_bash.call_count == 4
+
+    @staticmethod
+    def test_run_bash_script_stage_failed(scratch_connection,
+                                          local_run_bash, tmpdir):
+        tmpdir.join('dlpx-scripts').write('not a directory')
+
+        with pytest.raises(PluginScriptError) as err_info:
+            libs.run_bash_script(scratch_connection, SCRIPT)
+
+        assert err_info.value.message.startswith(
+            'Failed to stage the script {} with exit code 214.'.format(
+                tmpdir.join('dlpx-scripts',
+                            hashlib.sha256(SCRIPT).hexdigest() + '.sh')))
+
+    @staticmethod
+    def test_run_bash_script_login_shell_output(scratch_connection,
+                                                run_bash_locally):
+        def run_bash(request):
+            response = run_bash_locally(request)
+            response.return_value.stderr = (
+                'profile warning\n' + response.return_value.stderr + '\r\n')
+            return response
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash, create=True):
+            result = libs.run_bash_script(scratch_connection, SCRIPT,
+                                          use_login_shell=True)
+
+        assert result.exit_code == 0
+        assert result.stdout == '0 arguments\n\n'
+
+    @staticmethod
+    def test_run_bash_script_large(scratch_connection, local_run_bash,
+                                   tmpdir):
+        script = SCRIPT + '# {}\n'.format('x' * 76) * 2000
+
+        result = libs.run_bash_script(scratch_connection, script, ['a'])
+
+        assert result.stdout == '1 arguments\n[a]\n\n'
+        staged = tmpdir.join('dlpx-scripts',
+                             hashlib.sha256(script).hexdigest() + '.sh')
+        assert staged.read() == script
+        assert tmpdir.join('dlpx-scripts').listdir() == [staged]
+        requests = [call[0][0] for call in local_run_bash.call_args_list]
+        assert all(len(value) < 128 * 1024
+                   for request in requests
+                   for value in request.variables.values())
+
+    @staticmethod
+    def test_run_bash_script_exit_code(scratch_connection, local_run_bash):
+        result = libs.run_bash_script(scratch_connection, SCRIPT,
+                                      variables={'EXIT_CODE': '4'})
+        assert result.exit_code == 4
+
+        with pytest.raises(PluginScriptError) as err_info:
+            libs.run_bash_script(scratch_connection, SCRIPT,
+                                 variables={'EXIT_CODE': '4'}, check=True)
+        assert err_info.value.message.startswith(
+            'The script failed with exit code 4.')
+
+    @staticmethod
+    def test_run_bash_script_bad_args(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_bash_script(remote_connection, SCRIPT, [1])
+
+        assert err_info.value.message == (
+            "The function run_bash_script's argument 'args' was a list of"
+            " [type 'int'] but should be of type 'list of basestring' if"
+            " defined.")
+
+
+class TestLibsRunPowerShellScript:
+    @staticmethod
+    def test_run_powershell_script(remote_connection):
+        not_staged = libs_pb2.RunPowerShellResponse()
+        not_staged.return_value.exit_code = 213
+        not_staged.return_value.stderr = '__DLPX_SCRIPT_NOT_STAGED__'
+        success = libs_pb2.RunPowerShellResponse()
+        success.return_value.stdout = 'output'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        side_effect=[not_staged, success, success],
+                        create=True) as run_powershell:
+            libs.run_powershell_script(remote_connection, 'Write-Output $args',
+                                       ['a', 'b'])
+            result = libs.run_powershell_script(remote_connection,
+                                                'Write-Output $args')
+
+        assert result.stdout == 'output'
+        requests = [call[0][0] for call in run_powershell.call_args_list]
+        path = 'scratch_path\\dlpx-scripts\\{}.ps1'.format(
+            hashlib.sha256('Write-Output $args').hexdigest())
+        assert all(request.variables['DLPX_SCRIPT_PATH'] == path
+                   for request in requests)
+        assert requests[0].variables['DLPX_SCRIPT_SHA256'] == (
+            hashlib.sha256('Write-Output $args').hexdigest())
+        assert 'SHA256' in requests[0].command
+        assert requests[0].variables['DLPX_SCRIPT_ARGC'] == '2'
+        assert requests[0].variables['DLPX_SCRIPT_ARG_1'] == 'b'
+        assert 'DLPX_SCRIPT_CONTENT' not in requests[0].variables
+        assert requests[1].variables['DLPX_SCRIPT_CONTENT'] == (
+            'Write-Output $args')
+        assert requests[2].variables['DLPX_SCRIPT_ARGC'] == '0'
+        assert len(requests[2].command) < len(requests[1].command)
+
+    @staticmethod
+    def test_run_powershell_script_large(remote_connection):
+        script = u'Write-Output $args # \xe9{}\n'.format(u'x' * 40000)
+        not_staged = libs_pb2.RunPowerShellResponse()
+        not_staged.return_value.exit_code = 213
+        not_staged.return_value.stderr = '__DLPX_SCRIPT_NOT_STAGED__'
+        success = libs_pb2.RunPowerShellResponse()
+        success.return_value.stdout = 'output'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        side_effect=[not_staged] + [success] * 4,
+                        create=True) as run_powershell:
+            result = libs.run_powershell_script(remote_connection, script)
+
+        assert result.stdout == 'output'
+        requests = [call[0][0] for call in run_powershell.call_args_list]
+        path = 'scratch_path\\dlpx-scripts\\{}.ps1'.format(
+            hashlib.sha256(script.encode('utf-8')).hexdigest())
+        chunks = requests[1:4]
+        tmp = chunks[0].variables['DLPX_SCRIPT_TMP']
+        assert tmp.startswith(path + '.')
+        assert all(request.variables['DLPX_SCRIPT_TMP'] == tmp
+                   for request in chunks)
+        assert u''.join(request.variables['DLPX_SCRIPT_CONTENT']
+                        for request in chunks) == script
+        assert requests[4].variables['DLPX_SCRIPT_PATH'] == path
+        assert requests[4].variables['DLPX_SCRIPT_TMP'] == tmp
+        assert 'DLPX_SCRIPT_CONTENT' not in requests[4].variables
+
+    @staticmethod
+    def test_run_powershell_script_stage_failed(remote_connection):
+        not_staged = libs_pb2.RunPowerShellResponse()
+        not_staged.return_value.exit_code = 213
+        not_staged.return_value.stderr = '__DLPX_SCRIPT_NOT_STAGED__'
+        failed = libs_pb2.RunPowerShellResponse()
+        failed.return_value.exit_code = 214
+        failed.return_value.stderr = (
+            'Access denied\n__DLPX_SCRIPT_STAGE_FAILED__')
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        side_effect=[not_staged, failed], create=True):
+            with pytest.raises(PluginScriptError) as err_info:
+                libs.run_powershell_script(remote_connection, 'Write-Output')
+
+        assert 'Access denied' in err_info.value.message
+
+    @staticmethod
+    def test_run_powershell_script_staging_failed(remote_connection):
+        not_staged = libs_pb2.RunPowerShellResponse()
+        not_staged.return_value.exit_code = 213
+        not_staged.return_value.stderr = '__DLPX_SCRIPT_NOT_STAGED__'
+        failed = libs_pb2.RunPowerShellResponse()
+        failed.return_value.exit_code = 1
+        failed.return_value.stderr = 'Access denied'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_powershell',
+                        side_effect=[not_staged, failed, failed],
+                        create=True) as run_powershell:
+            with pytest.raises(PluginScriptError) as err_info:
+                libs.run_powershell_script(remote_connection, 'x' * 40000)
+
+        assert 'Access denied' in err_info.value.message
+        requests = [call[0][0] for call in run_powershell.call_args_list]
+        assert len(requests) == 3
+        assert requests[2].variables['DLPX_SCRIPT_TMP'] == (
+            requests[1].variables['DLPX_SCRIPT_TMP'])
+        assert 'Remove-Item' in requests[2].command
@@ -0,0 +1,126 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import os
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteEnvironment,
+                                                        RemoteHost)
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+
+class TestLibsBashSession:
+    @staticmethod
+    @pytest.fixture
+    def scratch_connection(tmpdir, remote_user):
+        host = RemoteHost('host', 'host-reference', 'binary_path',
+                          str(tmpdir.mkdir('scratch')))
+        environment = RemoteEnvironment('environment',
+                                        'environment-reference', host)
+        return RemoteConnection(environment, remote_user)
+
+    @staticmethod
+    @pytest.fixture
+    def local_run_bash(run_bash_locally):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally,
+                        create=True) as run_bash:
+            yield run_bash
+
+    @staticmethod
+    def test_bash_session(scratch_connection, local_run_bash, tmpdir):
+        work = tmpdir.mkdir('work')
+
+        with libs.bash_session(scratch_connection) as session:
+            session.run('cd "$WORK"; export GREETING=hello;'
+                        ' greet() { echo "$GREETING $1"; }',
+                        {'WORK': str(work)})
+            result = session.run('greet "$NAME from $(basename $PWD)"',
+                                 {'NAME': 'world'})
+            assert result.stdout == 'hello world from work\n'
+
+            result = session.run('export GREETING=bye; exit 3')
+            assert result.exit_code == 3
+            assert session.run('greet "$NAME"').stdout == 'bye world\n'
+
+        assert session.exit_codes == [0, 0, 3, 0]
+        assert session.closed
+        assert os.listdir(str(tmpdir.join('scratch'))) == []
+
+    @staticmethod
+    def test_bash_session_variables_override_state(scratch_connection,
+                                                   local_run_bash):
+        with libs.bash_session(scratch_connection) as session:
+            session.run('export VALUE=old')
+            result = session.run('echo "$VALUE"', {'VALUE': 'new value'})
+            assert result.stdout == 'new value\n'
+            assert session.run('echo "$VALUE"').stdout == 'new value\n'
+
+    @staticmethod
+    def test_bash_session_check(scratch_connection, local_run_bash):
+        with libs.bash_session(scratch_connection) as session:
+            with pytest.raises(PluginScriptError):
+                session.run('false', check=True)
+
+        assert session.exit_codes == [1]
+
+    @staticmethod
+    def test_bash_session_login_shell_once(scratch_connection,
+                                           local_run_bash):
+        with libs.bash_session(scratch_connection,
+                               use_login_shell=True) as session:
+            session.run('true')
+            session.run('true')
+
+        assert [call[0][0].use_login_shell
+                for call in local_run_bash.call_args_list] == [
+            True, False, False, False]
+
+    @staticmethod
+    def test_bash_session_closed(scratch_connection, local_run_bash):
+        session = libs.bash_session(scratch_connection)
+        session.close()
+        session.close()
+
+        with pytest.raises(RuntimeError):
+            session.run('true')
+        assert local_run_bash.call_count == 2
+
+    @staticmethod
+    def test_bash_session_start_failed(remote_connection):
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = 1
+        response.return_value.stderr = 'mktemp: No such file or directory'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True):
+            with pytest.raises(PluginScriptError) as err_info:
+                libs.bash_session(remote_connection)
+
+        assert err_info.value.message == (
+            'Failed to start the shell session with exit code 1.'
+            ' stdout :  and  stderr : mktemp: No such file or directory')
+
+    @staticmethod
+    def test_bash_session_bad_variable_name(scratch_connection,
+                                            local_run_bash):
+        with libs.bash_session(scratch_connection) as session:
+            with pytest.raises(ValueError):
+                session.run('true', {'NOT-VALID': 'value'})
+
+    @staticmethod
+    def test_bash_session_bad_command(scratch_connection, local_run_bash):
+        with libs.bash_session(scratch_connection) as session:
+            with pytest.raises(IncorrectArgumentTypeError) as err_info:
+                session.run(10)
+
+        assert err_info.value.message == (
+            "The function run's argument 'command' was type 'int' but should"
+            " be of type 'basestring'.")
@@ -0,0 +1,171 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import os
+import time
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._common_classes import (RemoteConnection,
+                                                        RemoteEnvironment,
+                                                        RemoteHost)
+from dlpx.virtualization.libs.exceptions import (IncorrectArgumentTypeError,
+                                                 PluginScriptError)
+
+
+class TestLibsRunBashStream:
+    @staticmethod
+    @pytest.fixture
+    def scratch_connection(tmpdir, remote_user):
+        host = RemoteHost('host', 'host-reference', 'binary_path',
+                          str(tmpdir))
+        environment = RemoteEnvironment('environment',
+                                        'environment-reference', host)
+        return RemoteConnection(environment, remote_user)
+
+    @staticmethod
+    def test_run_bash_stream(scratch_connection, run_bash_locally, tmpdir):
+        command = ('for i in 1 2 3 4 5; do echo "line $i $VALUE"; done;'
+                   ' echo error >&2; printf last')
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            stream = libs.run_bash_stream(scratch_connection, command,
+                                          {'VALUE': 'value'},
+                                          poll_interval=0.01, max_lines=2)
+            assert stream.exit_code is None
+            output = list(stream)
+
+        assert [line for name, line in output if name == 'stdout'] == [
+            'line 1 value\n', 'line 2 value\n', 'line 3 value\n',
+            'line 4 value\n', 'line 5 value\n', 'last']
+        assert [line for name, line in output if name == 'stderr'] == [
+            'error\n']
+        assert stream.exit_code == 0
+        assert os.listdir(str(tmpdir)) == []
+
+    @staticmethod
+    def test_run_bash_stream_check_true_failed_exitcode(scratch_connection,
+                                                        run_bash_locally):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            stream = libs.run_bash_stream(scratch_connection,
+                                          'echo out; echo err >&2; exit 3',
+                                          check=True, poll_interval=0.01)
+            with pytest.raises(PluginScriptError) as info:
+                list(stream)
+
+        assert stream.exit_code == 3
+        assert info.value.message == (
+            'The script failed with exit code 3.'
+            ' stdout : out\n and  stderr : err\n')
+
+    @staticmethod
+    def test_run_bash_stream_stop_early(scratch_connection, run_bash_locally,
+                                        tmpdir):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            stream = iter(libs.run_bash_stream(
+                scratch_connection, 'echo first; sleep 30',
+                poll_interval=0.01))
+            assert next(stream) == ('stdout', 'first\n')
+            stream.close()
+
+        assert os.listdir(str(tmpdir)) == []
+
+    @staticmethod
+    def test_run_bash_stream_read_once(scratch_connection, run_bash_locally):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            stream = libs.run_bash_stream(scratch_connection, 'true',
+                                          poll_interval=0.01)
+            list(stream)
+            with pytest.raises(RuntimeError):
+                list(stream)
+
+    @staticmethod
+    def test_run_bash_stream_start_failed(remote_connection):
+        response = libs_pb2.RunBashResponse()
+        response.return_value.exit_code = 1
+        response.return_value.stderr = 'mktemp: No such file or directory'
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        return_value=response, create=True):
+            with pytest.raises(PluginScriptError) as info:
+                libs.run_bash_stream(remote_connection, 'command')
+
+        assert info.value.message == (
+            'Failed to start the script with exit code 1.'
+            ' stdout :  and  stderr : mktemp: No such file or directory')
+
+    @staticmethod
+    def test_run_bash_stream_bad_command(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_bash_stream(remote_connection, 10)
+
+        assert err_info.value.message == (
+            "The function run_bash_stream's argument 'command' was"
+            " type 'int' but should be of type 'basestring'.")
+
+    @staticmethod
+    def test_run_bash_stream_partial_line(scratch_connection,
+                                          run_bash_locally):
+        offsets = []
+
+        def run_bash(request):
+            if 'DLPX_STREAM_STDOUT_OFFSET' in request.variables:
+                offsets.append(
+                    int(request.variables['DLPX_STREAM_STDOUT_OFFSET']))
+            return run_bash_locally(request)
+
+        command = ('echo first; printf "par"; sleep 0.3; echo "tial";'
+                   ' echo last')
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash, create=True):
+            output = list(libs.run_bash_stream(scratch_connection, command,
+                                               poll_interval=0.05))
+
+        assert output == [('stdout', 'first\n'), ('stdout', 'partial\n'),
+                          ('stdout', 'last\n')]
+        assert offsets == sorted(offsets)
+        assert set(offsets) <= {0, len('first\n'), len('first\npartial\n'),
+                                len('first\npartial\nlast\n')}
+
+    @staticmethod
+    def test_run_bash_stream_partial_line_after_exit(scratch_connection,
+                                                     run_bash_locally):
+        polls = []
+
+        def run_bash(request):
+            if 'DLPX_STREAM_STDOUT_OFFSET' in request.variables:
+                if not polls:
+                    # Let the command finish before the first poll.
+                    time.sleep(0.3)
+                polls.append(request)
+            return run_bash_locally(request)
+
+        command = 'for i in 1 2 3 4 5; do echo $i; done; printf err >&2'
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash, create=True):
+            output = list(libs.run_bash_stream(scratch_connection, command,
+                                               poll_interval=0.01,
+                                               max_lines=2))
+
+        assert [line for name, line in output if name == 'stdout'] == [
+            '1\n', '2\n', '3\n', '4\n', '5\n']
+        assert [line for name, line in output if name == 'stderr'] == ['err']
+        assert len(polls) == 3
+
+    @staticmethod
+    @pytest.mark.parametrize('poll_interval,max_lines', [
+        (0, 10), (-1.0, 10), (1.0, 0)])
+    def test_run_bash_stream_bad_values(remote_connection, poll_interval,
+                                        max_lines):
+        with pytest.raises(ValueError):
+            libs.run_bash_stream(remote_connection, 'command',
+                                 poll_interval=poll_interval,
+                                 max_lines=max_lines)
@@ -0,0 +1,415 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import logging
+import threading
+import time
+
+import mock
+import pytest
+
+from dlpx.virtualization import libs
+from dlpx.virtualization.api import libs_pb2
+from dlpx.virtualization.common._operation_context import operation_wrapper
+from dlpx.virtualization.libs import _futures, _sync_progress
+from dlpx.virtualization.libs.exceptions import (DeadlineExceededError,
+                                                 FutureCancelledError,
+                                                 IncorrectArgumentTypeError,
+                                                 LibraryError,
+                                                 PartitionedSyncError)
+
+
+class TestLibsRunSyncPartitioned:
+    @staticmethod
+    @pytest.fixture
+    def source_directory(tmpdir):
+        for name in ('a', 'b', 'c', '.hidden', 'wild*card'):
+            tmpdir.join(name).write('')
+        tmpdir.mkdir('dir').join('file').write('')
+        return str(tmpdir)
+
+    @staticmethod
+    @pytest.fixture
+    def sync_requests():
+        requests = []
+        lock = threading.Lock()
+
+        def run_sync(request):
+            with lock:
+                requests.append(request)
+            response = libs_pb2.RunSyncResponse()
+            if 'fail' in request.exclude_paths:
+                response.error.actionable_error.id = 1
+                response.error.actionable_error.message = 'rsync failed'
+            else:
+                response.return_value.CopyFrom(libs_pb2.RunSyncResult())
+            return response
+
+        with mock.patch('dlpx.virtualization._engine.libs.run_sync',
+                        side_effect=run_sync, create=True):
+            yield requests
+
+    @staticmethod
+    def _excludes(requests):
+        return sorted(sorted(request.exclude_paths) for request in requests)
+
+    @staticmethod
+    def test_run_sync_partitioned(remote_connection, run_bash_locally,
+                                  source_directory, sync_requests):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            results = libs.run_sync_partitioned(
+                remote_connection, source_directory, 'rsync_user',
+                ['*.bak'], ['/link'], max_partitions=2)
+
+        assert sorted(result.entries for result in results) == [
+            ['.hidden', 'b', 'dir'], ['a', 'c', 'wild*card']]
+        assert all(result.error is None and result.elapsed >= 0
+                   for result in results)
+        assert TestLibsRunSyncPartitioned._excludes(sync_requests) == [
+            ['*.bak', '/.hidden', '/b', '/dir'],
+            ['*.bak', '/a', '/c', '/wild\\*card']]
+        for request in sync_requests:
+            assert request.source_directory == source_directory
+            assert request.rsync_user == 'rsync_user'
+            assert request.sym_links_to_follow == ['/link']
+
+    @staticmethod
+    def test_run_sync_partitioned_given_partitions(remote_connection,
+                                                   run_bash_locally,
+                                                   source_directory,
+                                                   sync_requests):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            results = libs.run_sync_partitioned(
+                remote_connection, source_directory,
+                partitions=[['dir'], ['a', 'b']])
+
+        assert [result.entries for result in results] == [
+            ['dir'], ['a', 'b'], ['.hidden', 'c', 'wild*card']]
+        assert len(sync_requests) == 3
+
+    @staticmethod
+    def test_run_sync_partitioned_single_partition(remote_connection,
+                                                   run_bash_locally,
+                                                   source_directory,
+                                                   sync_requests):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            results = libs.run_sync_partitioned(
+                remote_connection, source_directory, max_partitions=1)
+
+        assert len(results) == 1
+        assert TestLibsRunSyncPartitioned._excludes(sync_requests) == [[]]
+
+    @staticmethod
+    def test_run_sync_partitioned_on_async_worker(remote_connection,
+                                                  run_bash_locally,
+                                                  source_directory,
+                                                  sync_requests):
+        libs.set_max_async_workers(1)
+        try:
+            with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                            side_effect=run_bash_locally, create=True):
+                future = _futures._submit(libs.run_sync_partitioned,
+                                          remote_connection,
+                                          source_directory)
+                results = future.result(timeout=5)
+        finally:
+            libs.set_max_async_workers(_futures._DEFAULT_MAX_WORKERS)
+
+        assert len(results) == 4
+        assert len(sync_requests) == 4
+
+    @staticmethod
+    def test_run_sync_partitioned_operation_timeout(remote_connection,
+                                                    run_bash_locally,
+                                                    source_directory):
+        release = threading.Event()
+
+        def run_sync(request):
+            release.wait(5)
+            return libs_pb2.RunSyncResponse()
+
+        @operation_wrapper('operation')
+        def operation():
+            libs.run_sync_partitioned(remote_connection, source_directory)
+
+        libs.set_operation_timeout(0.5, 'operation')
+        start = time.time()
+        try:
+            with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                            side_effect=run_bash_locally, create=True), \
+                    mock.patch('dlpx.virtualization._engine.libs.run_sync',
+                               side_effect=run_sync, create=True):
+                with pytest.raises(PartitionedSyncError) as err_info:
+                    operation()
+        finally:
+            release.set()
+            libs.set_operation_timeout(None, 'operation')
+
+        assert time.time() - start < 2
+        results = err_info.value.results
+        assert len(results) == 4
+        # Partitions that had not started yet were cancelled.
+        assert all(isinstance(result.error, (DeadlineExceededError,
+                                             FutureCancelledError))
+                   for result in results)
+
+    @staticmethod
+    def test_run_sync_partitioned_failure(remote_connection,
+                                          run_bash_locally, source_directory,
+                                          sync_requests):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            with pytest.raises(PartitionedSyncError) as err_info:
+                libs.run_sync_partitioned(
+                    remote_connection, source_directory,
+                    exclude_paths=['fail'], partitions=[['a']])
+
+        results = err_info.value.results
+        assert len(results) == 2
+        assert all(isinstance(result.error, LibraryError)
+                   for result in results)
+        assert err_info.value.message.startswith(
+            'Failed to sync 2 of 2 partitions of {}: a : '.format(
+                source_directory))
+
+    @staticmethod
+    def test_run_sync_partitioned_bad_partitions(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_sync_partitioned(remote_connection, 'source',
+                                      partitions=['a'])
+
+        assert err_info.value.message == (
+            "The function run_sync_partitioned's argument 'partitions' was a"
+            " list of [type 'str'] but should be of"
+            " type 'list of list' if defined.")
+
+    @staticmethod
+    def test_run_sync_partitioned_nested_partition(remote_connection):
+        with pytest.raises(ValueError):
+            libs.run_sync_partitioned(remote_connection, 'source',
+                                      partitions=[['a/b']])
+
+    @staticmethod
+    @pytest.mark.parametrize('partitions', [[['a', 'a']], [['a'], ['b', 'a']]])
+    def test_run_sync_partitioned_duplicate_entry(remote_connection,
+                                                  partitions):
+        with mock.patch('dlpx.virtualization._engine.libs.run_sync',
+                        create=True) as mock_run_sync:
+            with pytest.raises(ValueError):
+                libs.run_sync_partitioned(remote_connection, 'source',
+                                          partitions=partitions)
+
+        assert not mock_run_sync.called
+
+
+class TestSyncProgress:
+    @staticmethod
+    @pytest.fixture
+    def source_directory(tmpdir):
+        tmpdir.join('a').write('x' * 100)
+        tmpdir.join('.hidden').write('x' * 10)
+        directory = tmpdir.mkdir('dir')
+        directory.join('one').write('x' * 1000)
+        directory.join('two').write('x' * 24)
+        return str(tmpdir)
+
+    @staticmethod
+    @pytest.fixture
+    def run_bash(run_bash_locally):
+        with mock.patch('dlpx.virtualization._engine.libs.run_bash',
+                        side_effect=run_bash_locally, create=True):
+            yield
+
+    @staticmethod
+    @pytest.fixture
+    def run_sync():
+        response = libs_pb2.RunSyncResponse()
+        response.return_value.CopyFrom(libs_pb2.RunSyncResult())
+        with mock.patch('dlpx.virtualization._engine.libs.run_sync',
+                        return_value=response, create=True) as run_sync:
+            yield run_sync
+
+    @staticmethod
+    def test_run_sync_progress(remote_connection, source_directory,
+                               run_bash, run_sync):
+        reports = []
+        libs.run_sync(remote_connection, source_directory,
+                      progress=reports.append)
+
+        assert len(reports) == 1
+        report = reports[0]
+        assert report.done and report.error is None
+        assert report.source_directory == source_directory
+        assert (report.total_bytes, report.total_files) == (1134, 4)
+        # A single call does not learn what it transferred.
+        assert (report.transferred_bytes, report.transferred_files) == (
+            None, None)
+        assert report.rate is None
+        assert report.fraction is None
+        assert report.elapsed >= 0
+        assert run_sync.call_count == 1
+
+    @staticmethod
+    def test_run_sync_progress_periodic(remote_connection, source_directory,
+                                        run_bash, run_sync):
+        reports = []
+        reported = threading.Event()
+
+        def progress(report):
+            reports.append(report)
+            reported.set()
+
+        def sync(request):
+            assert reported.wait(5)
+            return run_sync.return_value
+
+        run_sync.side_effect = sync
+        libs.run_sync(remote_connection, source_directory, progress=progress,
+                      progress_interval=0.01)
+
+        assert not reports[0].done
+        assert reports[0].total_bytes == 1134
+        assert reports[0].transferred_bytes is None
+        assert reports[0].rate is None
+        assert reports[-1].done
+        assert all(not report.done for report in reports[:-1])
+
+    @staticmethod
+    def test_run_sync_progress_failure(remote_connection, source_directory,
+                                       run_bash, run_sync):
+        response = libs_pb2.RunSyncResponse()
+        response.error.actionable_error.id = 1
+        response.error.actionable_error.message = 'rsync failed'
+        run_sync.return_value = response
+        reports = []
+
+        with pytest.raises(LibraryError) as err_info:
+            libs.run_sync(remote_connection, source_directory,
+                          progress=reports.append)
+
+        assert len(reports) == 1
+        assert reports[0].done
+        assert reports[0].error is err_info.value
+        assert reports[0].transferred_bytes is None
+
+    @staticmethod
+    def test_run_sync_progress_unmeasurable(remote_connection, tmpdir,
+                                            run_bash, run_sync):
+        reports = []
+        libs.run_sync(remote_connection, str(tmpdir.join('missing')),
+                      progress=reports.append)
+
+        assert reports[0].done
+        assert reports[0].total_bytes is None
+        assert reports[0].transferred_bytes is None
+        assert reports[0].fraction is None
+
+    @staticmethod
+    def test_run_sync_partitioned_progress(remote_connection,
+                                           source_directory, run_bash,
+                                           run_sync):
+        reports = []
+        libs.run_sync_partitioned(remote_connection, source_directory,
+                                  progress=reports.append,
+                                  progress_interval=None)
+
+        assert len(reports) == 1
+        report = reports[0]
+        assert report.done and report.error is None
+        assert (report.transferred_bytes, report.transferred_files) == (
+            1134, 4)
+        assert report.rate > 0
+
+    @staticmethod
+    def test_tracker_counts_completed_entries():
+        reports = []
+        tracker = _sync_progress._Tracker(
+            '/src', reports.append, None, {'a': (100, 1), 'dir': (1024, 2)},
+            counted=True, start=time.time() - 1)
+
+        tracker.completed(['a'])
+        tracker._report(False)
+        tracker.completed(['dir'])
+        tracker.finish()
+
+        assert [(report.transferred_bytes, report.transferred_files,
+                 report.done) for report in reports] == [
+            (100, 1, False), (1124, 3, True)]
+        assert reports[0].fraction == 100.0 / 1124
+        assert reports[0].rate > 0
+
+    @staticmethod
+    def test_run_sync_partitioned_progress_failure(remote_connection,
+                                                   source_directory,
+                                                   run_bash, run_sync):
+        response = libs_pb2.RunSyncResponse()
+        response.error.actionable_error.id = 1
+        response.error.actionable_error.message = 'rsync failed'
+
+        def sync(request):
+            if '/a' in request.exclude_paths:
+                return response
+            return run_sync.return_value
+
+        run_sync.side_effect = sync
+        reports = []
+        with pytest.raises(PartitionedSyncError) as err_info:
+            libs.run_sync_partitioned(remote_connection, source_directory,
+                                      partitions=[['a']],
+                                      progress=reports.append)
+
+        assert reports[-1].error is err_info.value
+        assert reports[-1].transferred_bytes == 100
+
+    @staticmethod
+    def test_run_sync_bad_progress(remote_connection):
+        with pytest.raises(IncorrectArgumentTypeError) as err_info:
+            libs.run_sync(remote_connection, 'source', progress='log')
+
+        assert err_info.value.message == (
+            "The function run_sync's argument 'progress' was type 'str' but"
+            " should be of type 'function' if defined.")
+
+    @staticmethod
+    def test_run_sync_bad_progress_interval(remote_connection):
+        with pytest.raises(ValueError):
+            libs.run_sync(remote_connection, 'source', progress=len,
+                          progress_interval=0)
+
+    @staticmethod
+    def test_progress_logger():
+        logger = mock.Mock()
+        progress_logger = libs.SyncProgressLogger(logger)
+
+        progress_logger(libs.SyncProgress('/src', 60, 3 * 1024 ** 3, 10,
+                                          1024 ** 3, 4, 2.5 * 1024 ** 2,
+                                          False))
+        progress_logger(libs.SyncProgress('/src', 30, 2048, 2, None, None,
+                                          None, False))
+        progress_logger(libs.SyncProgress('/src', 120.5, 3 * 1024 ** 3, 10,
+                                          3 * 1024 ** 3, 10,
+                                          25 * 1024 ** 2, True))
+        progress_logger(libs.SyncProgress('/src', 2.5, 2048, 2, None, None,
+                                          None, True))
+        progress_logger(libs.SyncProgress('/src', 1, None, None, None, None,
+                                          None, True, Exception('failed')))
+
+        assert logger.log.call_args_list == [
+            mock.call(logging.INFO,
+                      'Syncing /src for 60 seconds: 1.0 GB of 3.0 GB (33%),'
+                      ' 4 of 10 files, 2.5 MB/s.'),
+            mock.call(logging.INFO,
+                      'Syncing /src for 30 seconds: 2.0 KB in 2 files to'
+                      ' sync.'),
+            mock.call(logging.INFO,
+                      'Synced 3.0 GB in 10 files in 120.5 seconds,'
+                      ' 25.0 MB/s on average from /src.'),
+            mock.call(logging.INFO,
+                      'Synced /src in 2.5 seconds, which held 2.0 KB in 2'
+                      ' files.'),
+            mock.call(logging.WARNING,
+                      'Failed to sync /src after 1.0 seconds: failed')]
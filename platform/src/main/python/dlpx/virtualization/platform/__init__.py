@@ -7,6 +7,8 @@ __path__ = __import__('pkgutil').extend_path(__path__, __name__)
 from dlpx.virtualization.platform.validation_util import *
 from dlpx.virtualization.platform.migration_helper import *
 from dlpx.virtualization.platform._plugin_classes import *
+from dlpx.virtualization.platform._json_codec import *
+from dlpx.virtualization.platform._parameters import *
 from dlpx.virtualization.platform._discovery import *
 from dlpx.virtualization.platform._linked import *
 from dlpx.virtualization.platform._upgrade import *
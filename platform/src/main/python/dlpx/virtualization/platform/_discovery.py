@@ -6,10 +6,11 @@
 """DiscoveryOperations for the Virtualization Platform
 
 """
-import json
 
 from dlpx.virtualization.api import common_pb2, platform_pb2
 from dlpx.virtualization.common import RemoteConnection
+from dlpx.virtualization.common._operation_context import operation_wrapper
+from dlpx.virtualization.platform import _json_codec, _parameters
 from dlpx.virtualization.platform import validation_util as v
 from dlpx.virtualization.platform.exceptions import (
     IncorrectReturnTypeError, OperationAlreadyDefinedError,
@@ -45,6 +46,7 @@ class DiscoveryOperations(object):
 
         return source_config_decorator
 
+    @operation_wrapper(Op.DISCOVERY_REPOSITORY)
     def _internal_repository(self, request):
         """Repository discovery wrapper.
 
@@ -66,7 +68,7 @@ class DiscoveryOperations(object):
 
         def to_protobuf(repository):
             parameters = common_pb2.PluginDefinedObject()
-            parameters.json = json.dumps(repository.to_dict())
+            parameters.json = _json_codec._dumps(repository.to_dict())
             repository_protobuf = common_pb2.Repository()
             repository_protobuf.parameters.CopyFrom(parameters)
             return repository_protobuf
@@ -98,6 +100,7 @@ class DiscoveryOperations(object):
             repository_protobuf_list)
         return repository_discovery_response
 
+    @operation_wrapper(Op.DISCOVERY_SOURCE_CONFIG)
     def _internal_source_config(self, request):
         """Source config discovery wrapper.
 
@@ -124,7 +127,7 @@ class DiscoveryOperations(object):
 
         def to_protobuf(source_config):
             parameters = common_pb2.PluginDefinedObject()
-            parameters.json = json.dumps(source_config.to_dict())
+            parameters.json = _json_codec._dumps(source_config.to_dict())
             source_config_protobuf = common_pb2.SourceConfig()
             source_config_protobuf.parameters.CopyFrom(parameters)
             return source_config_protobuf
@@ -132,8 +135,8 @@ class DiscoveryOperations(object):
         if not self.source_config_impl:
             raise OperationNotDefinedError(Op.DISCOVERY_SOURCE_CONFIG)
 
-        repository_definition = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
+        repository_definition = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
 
         source_configs = self.source_config_impl(
             source_connection=RemoteConnection.from_proto(
@@ -0,0 +1,226 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+# -*- coding: utf-8 -*-
+"""The JSON codec of the parameters exchanged with the Delphix Engine.
+
+The operation wrappers decode the plugin-defined parameters of every request
+from JSON, and encode the parameters they return and the objects they
+upgrade to JSON, with the codec returned by json_codec. By default it is the
+first of these that is installed and gives the same results as the json
+module of the standard library:
+
+- ujson
+- simplejson with its C extension
+- json
+
+The codecs are checked against the json module on sample parameters before
+one is picked: a codec must decode them to the same values and types, and
+encode them to the same bytes. A codec that, for example, rounds floats or
+rejects large integers is never used. Every codec writes JSON without
+whitespace between items, which the engine reads like any other JSON.
+
+register_json_codec adds another codec to try before these, and
+set_json_codec picks a codec by name.
+"""
+import json
+import threading
+
+__all__ = [
+    "JsonCodec",
+    "register_json_codec",
+    "set_json_codec",
+    "json_codec"
+]
+
+_SEPARATORS = (',', ':')
+
+#
+# Parameters that a codec must decode and encode exactly like the json
+# module to be picked.
+#
+_SAMPLES = [
+    u'{"name": "db", "port": 5432, "enabled": true, "owner": null}',
+    u'{"path": "/mnt/provision/db", "tags": ["a", "b"], "limits": {}}',
+    u'{"ratio": 0.1, "tiny": 1e-300, "huge": 1.7976931348623157e308,'
+    u' "negative": -0.0, "exponent": 12345678901234567890.5}',
+    u'{"big": 123456789012345678901234567890,'
+    u' "minimum": -9223372036854775808}',
+    u'{"text": "caf\\u00e9 \\u65e5\\u672c \\"quoted\\" \\\\ \\n\\t\\u0001",'
+    u' "emoji": "\\ud83d\\ude00"}',
+    u'[[], [{}], [[[1, 2.5, "three"]]], "", false]',
+]
+
+
+class JsonCodec(object):
+    """A pair of functions that decode and encode JSON.
+
+    Args:
+        name (str): The name of the codec.
+        loads (function): Decodes a JSON string like json.loads.
+        dumps (function): Encodes an object to a JSON string like json.dumps
+        with separators=(',', ':').
+    """
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _decoding(loads):
+    """Returns loads for unicode strings. Some codecs decode the strings in
+    a byte string to byte strings, but the json module returns unicode."""
+    def decode(parameters_json):
+        if isinstance(parameters_json, str):
+            parameters_json = parameters_json.decode('utf-8')
+        return loads(parameters_json)
+
+    return decode
+
+
+def _stdlib_codec():
+    return JsonCodec(
+        'json', json.loads,
+        lambda obj: json.dumps(obj, separators=_SEPARATORS))
+
+
+def _ujson_codec():
+    import ujson
+    return JsonCodec(
+        'ujson', _decoding(ujson.loads),
+        lambda obj: ujson.dumps(obj, ensure_ascii=True,
+                                escape_forward_slashes=False))
+
+
+def _simplejson_codec():
+    import simplejson
+    if simplejson._import_c_make_encoder() is None:
+        raise ImportError('simplejson has no C extension.')
+    return JsonCodec(
+        'simplejson', _decoding(simplejson.loads),
+        lambda obj: simplejson.dumps(obj, separators=_SEPARATORS))
+
+
+_lock = threading.Lock()
+_factories = [('ujson', _ujson_codec), ('simplejson', _simplejson_codec),
+              ('json', _stdlib_codec)]
+_name = None
+_codec = None
+
+
+def _same(decoded, expected):
+    """Whether decoded is equal to expected and has the same types, which
+    equality alone does not tell apart, e.g. for 1 and 1.0 or str and
+    unicode."""
+    if type(decoded) is not type(expected):
+        return False
+    if isinstance(expected, dict):
+        decoded_keys = {key: key for key in decoded}
+        return (len(decoded) == len(expected) and
+                all(key in decoded and _same(decoded_keys[key], key) and
+                    _same(decoded[key], value)
+                    for key, value in expected.items()))
+    if isinstance(expected, list):
+        return (len(decoded) == len(expected) and
+                all(_same(item, other)
+                    for item, other in zip(decoded, expected)))
+    if isinstance(expected, float):
+        return repr(decoded) == repr(expected)
+    return decoded == expected
+
+
+def _compatible(codec):
+    """Whether codec decodes and encodes the samples like the json
+    module."""
+    reference = _stdlib_codec()
+    try:
+        for sample in _SAMPLES:
+            expected = reference.loads(sample)
+            if not _same(codec.loads(sample), expected):
+                return False
+            if not _same(codec.loads(sample.encode('utf-8')), expected):
+                return False
+            if codec.dumps(expected) != reference.dumps(expected):
+                return False
+    except Exception:
+        return False
+    return True
+
+
+def _select(name):
+    for factory_name, factory in _factories:
+        if name is not None and factory_name != name:
+            continue
+        try:
+            codec = factory()
+        except ImportError:
+            if name is not None:
+                raise ValueError('The JSON codec {} is not installed.'.format(
+                    name))
+            continue
+        if name is not None or _compatible(codec):
+            return codec
+    if name is not None:
+        raise ValueError('There is no JSON codec named {}.'.format(name))
+    return _stdlib_codec()
+
+
+def register_json_codec(name, loads, dumps):
+    """Adds a JSON codec that is picked before the built-in ones if it is
+    compatible with the json module, or when set_json_codec picks it by
+    name.
+
+    Args:
+        name (str): The name of the codec.
+        loads (function): Decodes a JSON string like json.loads.
+        dumps (function): Encodes an object to a JSON string like json.dumps.
+    """
+    global _codec
+    with _lock:
+        _factories[:] = [factory for factory in _factories
+                         if factory[0] != name]
+        _factories.insert(0, (name, lambda: JsonCodec(name, loads, dumps)))
+        _codec = None
+
+
+def set_json_codec(name=None):
+    """Picks the JSON codec of the operation wrappers.
+
+    Args:
+        name (str): The name of the codec, e.g. 'json'. It is used even if
+        it is not compatible with the json module. If None, the first
+        compatible codec is picked.
+
+    Raises:
+        ValueError: There is no such codec or it is not installed.
+    """
+    global _name, _codec
+    with _lock:
+        codec = _select(name)
+        _name = name
+        _codec = codec
+
+
+def json_codec():
+    """Returns the JSON codec of the operation wrappers.
+
+    Returns:
+        JsonCodec: The codec.
+    """
+    global _codec
+    codec = _codec
+    if codec is None:
+        with _lock:
+            if _codec is None:
+                _codec = _select(_name)
+            codec = _codec
+    return codec
+
+
+def _loads(parameters_json):
+    return json_codec().loads(parameters_json)
+
+
+def _dumps(obj):
+    return json_codec().dumps(obj)
@@ -6,14 +6,16 @@
 """LinkedOperations for the Virtualization Platform
 
 """
-import json
 
 from dlpx.virtualization.api import common_pb2, platform_pb2
 from dlpx.virtualization.common import RemoteConnection, RemoteEnvironment
+from dlpx.virtualization.common._operation_context import operation_wrapper
 from dlpx.virtualization.common.exceptions import PluginRuntimeError
 from dlpx.virtualization.platform import (DirectSource, Mount,
                                           MountSpecification, StagedSource,
                                           Status)
+from dlpx.virtualization.platform import (_json_codec, _parameters,
+                                          _status_cache)
 from dlpx.virtualization.platform import validation_util as v
 from dlpx.virtualization.platform.exceptions import (
     IncorrectReturnTypeError, OperationAlreadyDefinedError,
@@ -30,6 +32,7 @@ class LinkedOperations(object):
         self.start_staging_impl = None
         self.stop_staging_impl = None
         self.status_impl = None
+        self.status_cache = None
         self.worker_impl = None
         self.mount_specification_impl = None
 
@@ -73,15 +76,29 @@ class LinkedOperations(object):
 
         return stop_staging_decorator
 
-    def status(self):
+    def status(self, cache_ttl=None):
+        _status_cache._check_ttl(cache_ttl)
+
         def status_decorator(status_impl):
             if self.status_impl:
                 raise OperationAlreadyDefinedError(Op.LINKED_STATUS)
             self.status_impl = v.check_function(status_impl, Op.LINKED_STATUS)
+            if cache_ttl is not None:
+                self.status_cache = _status_cache._StatusCache(cache_ttl)
             return status_impl
 
         return status_decorator
 
+    def invalidate_status_cache(self, guid=None):
+        """Drops the statuses cached for status(cache_ttl=...).
+
+        Args:
+          guid (str): The GUID of the staged source whose status is
+          dropped. If None, the statuses of all staged sources are dropped.
+        """
+        if self.status_cache is not None:
+            self.status_cache.invalidate(guid)
+
     def worker(self):
         def worker_decorator(worker_impl):
             if self.worker_impl:
@@ -101,6 +118,7 @@ class LinkedOperations(object):
 
         return mount_specification_decorator
 
+    @operation_wrapper(Op.LINKED_PRE_SNAPSHOT)
     def _internal_direct_pre_snapshot(self, request):
         """Pre Snapshot Wrapper for direct plugins.
 
@@ -129,18 +147,19 @@ class LinkedOperations(object):
         if not self.pre_snapshot_impl:
             raise OperationNotDefinedError(Op.LINKED_PRE_SNAPSHOT)
 
-        direct_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.direct_source.linked_source.parameters.json))
+        direct_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.direct_source.linked_source.parameters.json)
         direct_source = DirectSource(
             guid=request.direct_source.linked_source.guid,
             connection=RemoteConnection.from_proto(
                 request.direct_source.connection),
             parameters=direct_source_definition)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         self.pre_snapshot_impl(direct_source=direct_source,
                                repository=repository,
@@ -152,6 +171,7 @@ class LinkedOperations(object):
 
         return direct_pre_snapshot_response
 
+    @operation_wrapper(Op.LINKED_POST_SNAPSHOT)
     def _internal_direct_post_snapshot(self, request):
         """Post Snapshot Wrapper for direct plugins.
 
@@ -176,7 +196,7 @@ class LinkedOperations(object):
 
         def to_protobuf(snapshot):
             parameters = common_pb2.PluginDefinedObject()
-            parameters.json = json.dumps(snapshot.to_dict())
+            parameters.json = _json_codec._dumps(snapshot.to_dict())
             snapshot_protobuf = common_pb2.Snapshot()
             snapshot_protobuf.parameters.CopyFrom(parameters)
             return snapshot_protobuf
@@ -184,18 +204,19 @@ class LinkedOperations(object):
         if not self.post_snapshot_impl:
             raise OperationNotDefinedError(Op.LINKED_POST_SNAPSHOT)
 
-        direct_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.direct_source.linked_source.parameters.json))
+        direct_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.direct_source.linked_source.parameters.json)
         direct_source = DirectSource(
             guid=request.direct_source.linked_source.guid,
             connection=RemoteConnection.from_proto(
                 request.direct_source.connection),
             parameters=direct_source_definition)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         snapshot = self.post_snapshot_impl(direct_source=direct_source,
                                            repository=repository,
@@ -213,6 +234,7 @@ class LinkedOperations(object):
 
         return direct_post_snapshot_response
 
+    @operation_wrapper(Op.LINKED_PRE_SNAPSHOT)
     def _internal_staged_pre_snapshot(self, request):
         """Pre Snapshot Wrapper for staged plugins.
 
@@ -243,8 +265,8 @@ class LinkedOperations(object):
             raise OperationNotDefinedError(Op.LINKED_PRE_SNAPSHOT)
 
         linked_source = request.staged_source.linked_source
-        staged_source_definition = (LinkedSourceDefinition.from_dict(
-            json.loads(linked_source.parameters.json)))
+        staged_source_definition = (_parameters._lazy(
+            LinkedSourceDefinition, linked_source.parameters.json))
         staged_mount = request.staged_source.staged_mount
         mount = Mount(remote_environment=RemoteEnvironment.from_proto(
             staged_mount.remote_environment),
@@ -259,12 +281,13 @@ class LinkedOperations(object):
             staged_connection=RemoteConnection.from_proto(
                 request.staged_source.staged_connection))
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
-        snapshot_parameters = SnapshotParametersDefinition.from_dict(
-            json.loads(request.snapshot_parameters.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
+        snapshot_parameters = _parameters._lazy(
+            SnapshotParametersDefinition,
+            request.snapshot_parameters.parameters.json)
 
         self.pre_snapshot_impl(staged_source=staged_source,
                                repository=repository,
@@ -276,6 +299,7 @@ class LinkedOperations(object):
 
         return response
 
+    @operation_wrapper(Op.LINKED_POST_SNAPSHOT)
     def _internal_staged_post_snapshot(self, request):
         """Post Snapshot Wrapper for staged plugins.
 
@@ -302,7 +326,7 @@ class LinkedOperations(object):
 
         def to_protobuf(snapshot):
             parameters = common_pb2.PluginDefinedObject()
-            parameters.json = json.dumps(snapshot.to_dict())
+            parameters.json = _json_codec._dumps(snapshot.to_dict())
             snapshot_protobuf = common_pb2.Snapshot()
             snapshot_protobuf.parameters.CopyFrom(parameters)
             return snapshot_protobuf
@@ -310,8 +334,9 @@ class LinkedOperations(object):
         if not self.post_snapshot_impl:
             raise OperationNotDefinedError(Op.LINKED_POST_SNAPSHOT)
 
-        staged_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.staged_source.linked_source.parameters.json))
+        staged_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.staged_source.linked_source.parameters.json)
         mount = Mount(
             remote_environment=RemoteEnvironment.from_proto(
                 request.staged_source.staged_mount.remote_environment),
@@ -326,12 +351,13 @@ class LinkedOperations(object):
             staged_connection=RemoteConnection.from_proto(
                 request.staged_source.staged_connection))
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
-        snapshot_parameters = SnapshotParametersDefinition.from_dict(
-            json.loads(request.snapshot_parameters.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
+        snapshot_parameters = _parameters._lazy(
+            SnapshotParametersDefinition,
+            request.snapshot_parameters.parameters.json)
 
         snapshot = self.post_snapshot_impl(
             staged_source=staged_source,
@@ -349,6 +375,7 @@ class LinkedOperations(object):
 
         return response
 
+    @operation_wrapper(Op.LINKED_START_STAGING)
     def _internal_start_staging(self, request):
         """Start staging Wrapper for staged plugins.
 
@@ -377,8 +404,9 @@ class LinkedOperations(object):
         if not self.start_staging_impl:
             raise OperationNotDefinedError(Op.LINKED_START_STAGING)
 
-        staged_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.staged_source.linked_source.parameters.json))
+        staged_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.staged_source.linked_source.parameters.json)
         mount = Mount(
             remote_environment=(RemoteEnvironment.from_proto(
                 request.staged_source.staged_mount.remote_environment)),
@@ -393,14 +421,18 @@ class LinkedOperations(object):
             staged_connection=RemoteConnection.from_proto(
                 request.staged_source.staged_connection))
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
-        self.start_staging_impl(staged_source=staged_source,
-                                repository=repository,
-                                source_config=source_config)
+        try:
+            self.start_staging_impl(staged_source=staged_source,
+                                    repository=repository,
+                                    source_config=source_config)
+        finally:
+            self.invalidate_status_cache(
+                request.staged_source.linked_source.guid)
 
         start_staging_response = platform_pb2.StartStagingResponse()
         start_staging_response.return_value.CopyFrom(
@@ -408,6 +440,7 @@ class LinkedOperations(object):
 
         return start_staging_response
 
+    @operation_wrapper(Op.LINKED_STOP_STAGING)
     def _internal_stop_staging(self, request):
         """Stop staging Wrapper for staged plugins.
 
@@ -436,8 +469,9 @@ class LinkedOperations(object):
         if not self.stop_staging_impl:
             raise OperationNotDefinedError(Op.LINKED_STOP_STAGING)
 
-        staged_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.staged_source.linked_source.parameters.json))
+        staged_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.staged_source.linked_source.parameters.json)
         mount = Mount(
             remote_environment=(RemoteEnvironment.from_proto(
                 request.staged_source.staged_mount.remote_environment)),
@@ -452,14 +486,18 @@ class LinkedOperations(object):
             staged_connection=RemoteConnection.from_proto(
                 request.staged_source.staged_connection))
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
-        self.stop_staging_impl(staged_source=staged_source,
-                               repository=repository,
-                               source_config=source_config)
+        try:
+            self.stop_staging_impl(staged_source=staged_source,
+                                   repository=repository,
+                                   source_config=source_config)
+        finally:
+            self.invalidate_status_cache(
+                request.staged_source.linked_source.guid)
 
         stop_staging_response = platform_pb2.StopStagingResponse()
         stop_staging_response.return_value.CopyFrom(
@@ -467,6 +505,7 @@ class LinkedOperations(object):
 
         return stop_staging_response
 
+    @operation_wrapper(Op.LINKED_STATUS)
     def _internal_status(self, request):
         """Staged Status Wrapper for staged plugins.
 
@@ -495,8 +534,22 @@ class LinkedOperations(object):
         if not self.status_impl:
             raise OperationNotDefinedError(Op.LINKED_STATUS)
 
-        staged_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.staged_source.linked_source.parameters.json))
+        status_cache = self.status_cache
+        if status_cache is not None:
+            guid = request.staged_source.linked_source.guid
+            key = status_cache.key(
+                request.staged_source.linked_source.parameters.json,
+                request.repository.parameters.json,
+                request.source_config.parameters.json)
+            cached_status, generation = status_cache.lookup(guid, key)
+            if cached_status is not None:
+                response = platform_pb2.StagedStatusResponse()
+                response.return_value.status = cached_status.value
+                return response
+
+        staged_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.staged_source.linked_source.parameters.json)
         mount = Mount(
             remote_environment=(RemoteEnvironment.from_proto(
                 request.staged_source.staged_mount.remote_environment)),
@@ -511,10 +564,10 @@ class LinkedOperations(object):
             staged_connection=RemoteConnection.from_proto(
                 request.staged_source.staged_connection))
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         status = self.status_impl(staged_source=staged_source,
                                   repository=repository,
@@ -525,11 +578,15 @@ class LinkedOperations(object):
             raise IncorrectReturnTypeError(Op.LINKED_STATUS, type(status),
                                            Status)
 
+        if status_cache is not None:
+            status_cache.store(guid, key, generation, status)
+
         staged_status_response = platform_pb2.StagedStatusResponse()
         staged_status_response.return_value.status = status.value
 
         return staged_status_response
 
+    @operation_wrapper(Op.LINKED_WORKER)
     def _internal_worker(self, request):
         """Staged Worker Wrapper for staged plugins.
 
@@ -558,8 +615,9 @@ class LinkedOperations(object):
         if not self.worker_impl:
             raise OperationNotDefinedError(Op.LINKED_WORKER)
 
-        staged_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.staged_source.linked_source.parameters.json))
+        staged_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.staged_source.linked_source.parameters.json)
         mount = Mount(
             remote_environment=(RemoteEnvironment.from_proto(
                 request.staged_source.staged_mount.remote_environment)),
@@ -574,10 +632,10 @@ class LinkedOperations(object):
             staged_connection=RemoteConnection.from_proto(
                 request.staged_source.staged_connection))
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         self.worker_impl(staged_source=staged_source,
                          repository=repository,
@@ -589,6 +647,7 @@ class LinkedOperations(object):
 
         return staged_worker_response
 
+    @operation_wrapper(Op.LINKED_MOUNT_SPEC)
     def _internal_mount_specification(self, request):
         """Staged Mount/Ownership Spec Wrapper for staged plugins.
 
@@ -631,8 +690,9 @@ class LinkedOperations(object):
         if not self.mount_specification_impl:
             raise OperationNotDefinedError(Op.LINKED_MOUNT_SPEC)
 
-        staged_source_definition = LinkedSourceDefinition.from_dict(
-            json.loads(request.staged_source.linked_source.parameters.json))
+        staged_source_definition = _parameters._lazy(
+            LinkedSourceDefinition,
+            request.staged_source.linked_source.parameters.json)
         mount = Mount(
             remote_environment=(RemoteEnvironment.from_proto(
                 request.staged_source.staged_mount.remote_environment)),
@@ -647,8 +707,8 @@ class LinkedOperations(object):
             staged_connection=RemoteConnection.from_proto(
                 request.staged_source.staged_connection))
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
 
         mount_spec = self.mount_specification_impl(staged_source=staged_source,
                                                    repository=repository)
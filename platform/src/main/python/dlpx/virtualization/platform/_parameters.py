@@ -0,0 +1,267 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+# -*- coding: utf-8 -*-
+"""Decoding of the plugin-defined parameters of operation requests.
+
+The operation wrappers turn the JSON parameters of the repository, source
+config, linked source, virtual source and snapshot in every request into
+objects of the classes generated from the plugin's schemas. The engine
+calls operations like status over and over with the same parameters, so the
+decoded objects are kept in a bounded LRU cache keyed on the generated class
+and the JSON string.
+
+Plugin code may change the objects it is handed, so the cache keeps its own
+copy of every decoded object and every request gets a deep copy of it.
+copy.deepcopy would make a hit slower than decoding again, so the copies are
+made by _copy, which only knows the JSON types and the generated classes.
+decode_cache_stats reports how often the cache was hit.
+
+Many operations never look at most of their arguments, so the wrappers do
+not copy cached parameters up front. They hand out objects of a subclass of
+the generated class that hold the JSON string, and copy the cached object
+the first time any of their attributes is read or set. The object then
+turns into an object of the generated class itself. Parameters that are not
+in the cache are decoded right away instead: an error in them would
+otherwise only be raised when they are first used, and in Python 2 hasattr
+turns any error into False.
+"""
+import collections
+import copy
+import datetime
+import threading
+
+from dlpx.virtualization.platform import _json_codec
+
+__all__ = [
+    "DecodeCacheStats",
+    "set_decode_cache_size",
+    "decode_cache_stats",
+    "clear_decode_cache"
+]
+
+_DEFAULT_SIZE = 128
+
+#
+# Types of values that are never changed, so copies can share them.
+#
+_IMMUTABLE_TYPES = frozenset([type(None), bool, int, long, float, str,
+                              unicode, datetime.date, datetime.datetime])
+
+#
+# Attributes that every object of a generated class has and that are never
+# changed.
+#
+_SHARED_ATTRIBUTES = frozenset(['swagger_types', 'attribute_map'])
+
+
+class DecodeCacheStats(object):
+    """How the cache of decoded parameters was used.
+
+    Attributes:
+        hits (int): Number of parameters taken from the cache.
+        misses (int): Number of parameters that had to be decoded.
+        evictions (int): Number of decoded parameters dropped from the cache
+        to make room for others.
+        size (int): Number of decoded parameters in the cache now.
+        max_size (int): Number of decoded parameters the cache holds at most.
+    """
+    def __init__(self, hits=0, misses=0, evictions=0, size=0,
+                 max_size=_DEFAULT_SIZE):
+        self.hits = hits
+        self.misses = misses
+        self.evictions = evictions
+        self.size = size
+        self.max_size = max_size
+
+    @property
+    def hit_rate(self):
+        """The part of the lookups that hit the cache, or None if there were
+        none."""
+        lookups = self.hits + self.misses
+        if not lookups:
+            return None
+        return float(self.hits) / lookups
+
+
+def _copy(value):
+    """Returns a deep copy of a decoded value."""
+    value_type = type(value)
+    if value_type in _IMMUTABLE_TYPES:
+        return value
+    if value_type is list:
+        return [_copy(item) for item in value]
+    if value_type is dict:
+        return {key: _copy(item) for key, item in value.iteritems()}
+    if not hasattr(value_type, 'swagger_types'):
+        return copy.deepcopy(value)
+    copied = value_type.__new__(value_type)
+    copied.__dict__.update(
+        (name, item if name in _SHARED_ATTRIBUTES else _copy(item))
+        for name, item in value.__dict__.iteritems())
+    return copied
+
+
+class _DecodeCache(object):
+    def __init__(self, max_size):
+        self._lock = threading.Lock()
+        self._max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def set_max_size(self, max_size):
+        with self._lock:
+            self._max_size = max_size
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            return DecodeCacheStats(self._hits, self._misses,
+                                    self._evictions, len(self._entries),
+                                    self._max_size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+    def contains(self, definition_class, parameters_json):
+        with self._lock:
+            return (definition_class, parameters_json) in self._entries
+
+    def _evict(self):
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def decode(self, definition_class, parameters_json):
+        key = (definition_class, parameters_json)
+        with self._lock:
+            cached = self._entries.pop(key, None)
+            if cached is not None:
+                self._entries[key] = cached
+                self._hits += 1
+            else:
+                self._misses += 1
+        if cached is not None:
+            return _copy(cached)
+
+        decoded = definition_class.from_dict(
+            _json_codec._loads(parameters_json))
+        if not self._max_size:
+            return decoded
+        kept = _copy(decoded)
+        with self._lock:
+            if self._max_size:
+                #
+                # Another thread may have decoded the same parameters in the
+                # meantime.
+                #
+                self._entries.pop(key, None)
+                self._entries[key] = kept
+                self._evict()
+        return decoded
+
+
+_cache = _DecodeCache(_DEFAULT_SIZE)
+
+
+def set_decode_cache_size(max_size):
+    """Sets how many decoded parameters are cached.
+
+    Args:
+        max_size (int): Number of decoded parameters the cache holds at
+        most. 0 disables the cache.
+    """
+    if (not isinstance(max_size, (int, long)) or isinstance(max_size, bool) or
+            max_size < 0):
+        raise ValueError('max_size must be an int that is not negative.')
+    _cache.set_max_size(max_size)
+
+
+def decode_cache_stats():
+    """Returns how the cache of decoded parameters was used since the
+    plugin's Python runtime started or clear_decode_cache was called.
+
+    Returns:
+        DecodeCacheStats: The statistics.
+    """
+    return _cache.stats()
+
+
+def clear_decode_cache():
+    """Drops all decoded parameters from the cache and resets its
+    statistics."""
+    _cache.clear()
+
+
+def _decode(definition_class, parameters_json):
+    """Returns the parameters_json of a request decoded into an object of
+    the generated definition_class."""
+    return _cache.decode(definition_class, parameters_json)
+
+
+_lazy_lock = threading.Lock()
+_lazy_classes = {}
+
+
+def _materialize(lazy):
+    """Decodes the parameters of an object returned by _lazy into it and
+    turns it into an object of the generated class."""
+    with _lazy_lock:
+        state = object.__getattribute__(lazy, '__dict__')
+        if '_dlpx_parameters' not in state:
+            return
+        definition_class, parameters_json = state['_dlpx_parameters']
+        decoded = _decode(definition_class, parameters_json)
+        state.clear()
+        state.update(vars(decoded))
+        object.__setattr__(lazy, '__class__', definition_class)
+
+
+def _lazy_getattribute(self, name):
+    _materialize(self)
+    return object.__getattribute__(self, name)
+
+
+def _lazy_setattr(self, name, value):
+    _materialize(self)
+    setattr(self, name, value)
+
+
+def _lazy_delattr(self, name):
+    _materialize(self)
+    delattr(self, name)
+
+
+def _lazy_class(definition_class):
+    with _lazy_lock:
+        lazy_class = _lazy_classes.get(definition_class)
+        if lazy_class is None:
+            lazy_class = type(definition_class.__name__, (definition_class,), {
+                '__module__': definition_class.__module__,
+                '__getattribute__': _lazy_getattribute,
+                '__setattr__': _lazy_setattr,
+                '__delattr__': _lazy_delattr
+            })
+            _lazy_classes[definition_class] = lazy_class
+        return lazy_class
+
+
+def _lazy(definition_class, parameters_json):
+    """Returns an object of the generated definition_class that is decoded
+    from parameters_json when it is first used if the cache holds the
+    decoded parameters, and the decoded object otherwise. Parameters that
+    were decoded before decode again without error."""
+    if not _cache.contains(definition_class, parameters_json):
+        return _decode(definition_class, parameters_json)
+    lazy_class = _lazy_class(definition_class)
+    lazy = object.__new__(lazy_class)
+    object.__getattribute__(lazy, '__dict__')['_dlpx_parameters'] = (
+        definition_class, parameters_json)
+    return lazy
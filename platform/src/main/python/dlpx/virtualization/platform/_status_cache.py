@@ -0,0 +1,80 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+# -*- coding: utf-8 -*-
+"""Caching of the results of the status operations.
+
+The Delphix Engine polls the status of virtual and staged sources often,
+and a status implementation usually probes the environment to find it. With
+a cache_ttl passed to the status decorator, e.g.
+
+    @plugin.virtual.status(cache_ttl=30)
+
+the status of a source is kept for cache_ttl seconds and returned again for
+requests with the same source GUID and parameters, without calling the
+implementation. Operations that change the status of a source, like start
+and stop, drop its cached status, as does invalidate_status_cache.
+"""
+import hashlib
+import threading
+import time
+
+
+class _StatusCache(object):
+    """The latest status of every source, by GUID, with a hash of the
+    parameters it was found for."""
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._epoch = 0
+        self._generations = {}
+
+    @staticmethod
+    def key(*parameters_json):
+        digest = hashlib.sha256()
+        for parameters in parameters_json:
+            digest.update(parameters.encode('utf-8'))
+            digest.update('\0')
+        return digest.hexdigest()
+
+    def _generation(self, guid):
+        return self._epoch, self._generations.get(guid, 0)
+
+    def lookup(self, guid, key):
+        """Returns the cached status of the source with the given GUID and
+        parameters or None, and the generation to pass to store."""
+        with self._lock:
+            generation = self._generation(guid)
+            entry = self._entries.get(guid)
+            if (entry is None or entry[0] != key or
+                    entry[2] <= time.time()):
+                return None, generation
+            return entry[1], generation
+
+    def store(self, guid, key, generation, status):
+        """Caches the status of a source, unless it was invalidated since
+        its lookup."""
+        with self._lock:
+            if self._generation(guid) != generation:
+                return
+            self._entries[guid] = (key, status, time.time() + self.ttl)
+
+    def invalidate(self, guid=None):
+        """Drops the cached status of the source with the given GUID, or of
+        all sources if guid is None."""
+        with self._lock:
+            if guid is None:
+                self._entries.clear()
+                self._epoch += 1
+                return
+            self._entries.pop(guid, None)
+            self._generations[guid] = self._generations.get(guid, 0) + 1
+
+
+def _check_ttl(cache_ttl):
+    if cache_ttl is not None and (
+            not isinstance(cache_ttl, (int, long, float)) or
+            isinstance(cache_ttl, bool) or cache_ttl <= 0):
+        raise ValueError('cache_ttl must be a positive number of seconds.')
@@ -12,14 +12,17 @@ the upgrade functions in a dict for the specific schema. For each new upgrade
 operation of the same schema, the key will be the migration id, and the value
 will be the function that was implemented.
 """
-import json
+import collections
 import logging
 
 from dlpx.virtualization.api import platform_pb2
+from dlpx.virtualization.common._operation_context import operation_wrapper
 from dlpx.virtualization.platform import (LuaUpgradeMigrations, MigrationType,
-                                          PlatformUpgradeMigrations)
+                                          PlatformUpgradeMigrations,
+                                          _json_codec)
 from dlpx.virtualization.platform.exceptions import (
     IncorrectUpgradeObjectTypeError, UnknownMigrationTypeError)
+from dlpx.virtualization.platform.operation import Operation as Op
 
 logger = logging.getLogger(__name__)
 
@@ -119,14 +122,21 @@ class UpgradeOperations(object):
         return upgrade_response
 
     @staticmethod
-    def _run_migration_upgrades(request, lua_impls_getter,
+    def _migrate(metadata, impls_list):
+        # Load the object metadata into a dictionary
+        current_metadata = _json_codec._loads(metadata)
+        for migration_function in impls_list:
+            current_metadata = migration_function(current_metadata)
+        return _json_codec._dumps(current_metadata)
+
+    def _run_migration_upgrades(self, request, lua_impls_getter,
                                 platform_impls_getter):
         """
         Given the list of lua and platform migration to run, iterate and
         invoke these migrations on each object and its metadata, and return a
         dict containing the upgraded parameters.
         """
-        post_upgrade_parameters = {}
+        pre_upgrade_parameters = request.pre_upgrade_parameters
         #
         # For the request.migration_ids list, protobuf will preserve the
         # ordering of repeated elements, so we can rely on the backend to
@@ -135,15 +145,40 @@ class UpgradeOperations(object):
         impls_list = lua_impls_getter(
             request.lua_upgrade_version) + platform_impls_getter(
                 request.migration_ids)
-        for (object_ref, metadata) in request.pre_upgrade_parameters.items():
-            # Load the object metadata into a dictionary
-            current_metadata = json.loads(metadata)
-            for migration_function in impls_list:
-                current_metadata = migration_function(current_metadata)
-            post_upgrade_parameters[object_ref] = json.dumps(current_metadata)
-
-        return post_upgrade_parameters
+        if not impls_list:
+            # There is nothing to migrate, so the metadata is returned as it
+            # is rather than decoded and encoded again.
+            return dict(pre_upgrade_parameters)
 
+        #
+        # Many objects, e.g. the snapshots of a source, often have the same
+        # metadata. The migrations only see the metadata, so they are run
+        # once for each distinct metadata, on the object with the first
+        # reference that has it, and all objects that have it share the
+        # result.
+        #
+        object_refs = collections.defaultdict(list)
+        for object_ref in sorted(pre_upgrade_parameters):
+            object_refs[pre_upgrade_parameters[object_ref]].append(object_ref)
+        distinct = {
+            refs[0]: metadata
+            for metadata, refs in object_refs.items()
+        }
+        first_ref = {
+            object_ref: refs[0]
+            for refs in object_refs.values() for object_ref in refs
+        }
+
+        upgraded = {
+            object_ref: self._migrate(distinct[object_ref], impls_list)
+            for object_ref in sorted(distinct)
+        }
+
+        return collections.OrderedDict(
+            (object_ref, upgraded[first_ref[object_ref]])
+            for object_ref in sorted(first_ref))
+
+    @operation_wrapper(Op.UPGRADE_REPOSITORY)
     def _internal_repository(self, request):
         """Upgrade repositories for plugins.
         """
@@ -159,6 +194,7 @@ class UpgradeOperations(object):
             self.platform_migrations.get_repository_impls_to_exec)
         return self._success_upgrade_response(post_upgrade_parameters)
 
+    @operation_wrapper(Op.UPGRADE_SOURCE_CONFIG)
     def _internal_source_config(self, request):
         """Upgrade source configs for plugins.
         """
@@ -174,6 +210,7 @@ class UpgradeOperations(object):
             self.platform_migrations.get_source_config_impls_to_exec)
         return self._success_upgrade_response(post_upgrade_parameters)
 
+    @operation_wrapper(Op.UPGRADE_LINKED_SOURCE)
     def _internal_linked_source(self, request):
         """Upgrade linked source for plugins.
         """
@@ -189,6 +226,7 @@ class UpgradeOperations(object):
             self.platform_migrations.get_linked_source_impls_to_exec)
         return self._success_upgrade_response(post_upgrade_parameters)
 
+    @operation_wrapper(Op.UPGRADE_VIRTUAL_SOURCE)
     def _internal_virtual_source(self, request):
         """Upgrade virtual sources for plugins.
         """
@@ -204,6 +242,7 @@ class UpgradeOperations(object):
             self.platform_migrations.get_virtual_source_impls_to_exec)
         return self._success_upgrade_response(post_upgrade_parameters)
 
+    @operation_wrapper(Op.UPGRADE_SNAPSHOT)
     def _internal_snapshot(self, request):
         """Upgrade snapshots for plugins.
         """
@@ -6,12 +6,14 @@
 """VirtualOperations for the Virtualization Platform
 
 """
-import json
 
 from dlpx.virtualization.api import common_pb2, platform_pb2
 from dlpx.virtualization.common import RemoteConnection, RemoteEnvironment
+from dlpx.virtualization.common._operation_context import operation_wrapper
 from dlpx.virtualization.platform import (Mount, MountSpecification, Status,
                                           VirtualSource)
+from dlpx.virtualization.platform import (_json_codec, _parameters,
+                                          _status_cache)
 from dlpx.virtualization.platform import validation_util as v
 from dlpx.virtualization.platform.exceptions import (
     IncorrectReturnTypeError, OperationAlreadyDefinedError,
@@ -31,6 +33,7 @@ class VirtualOperations(object):
         self.pre_snapshot_impl = None
         self.post_snapshot_impl = None
         self.status_impl = None
+        self.status_cache = None
         self.initialize_impl = None
         self.mount_specification_impl = None
 
@@ -102,15 +105,29 @@ class VirtualOperations(object):
 
         return post_snapshot_decorator
 
-    def status(self):
+    def status(self, cache_ttl=None):
+        _status_cache._check_ttl(cache_ttl)
+
         def status_decorator(status_impl):
             if self.status_impl:
                 raise OperationAlreadyDefinedError(Op.VIRTUAL_STATUS)
             self.status_impl = v.check_function(status_impl, Op.VIRTUAL_STATUS)
+            if cache_ttl is not None:
+                self.status_cache = _status_cache._StatusCache(cache_ttl)
             return status_impl
 
         return status_decorator
 
+    def invalidate_status_cache(self, guid=None):
+        """Drops the statuses cached for status(cache_ttl=...).
+
+        Args:
+          guid (str): The GUID of the virtual source whose status is
+          dropped. If None, the statuses of all virtual sources are dropped.
+        """
+        if self.status_cache is not None:
+            self.status_cache.invalidate(guid)
+
     def initialize(self):
         def initialize_decorator(initialize_impl):
             if self.initialize_impl:
@@ -138,6 +155,7 @@ class VirtualOperations(object):
                      mount_path=single_subset_mount.mount_path,
                      shared_path=single_subset_mount.shared_path)
 
+    @operation_wrapper(Op.VIRTUAL_CONFIGURE)
     def _internal_configure(self, request):
         """Configure operation wrapper.
 
@@ -169,8 +187,8 @@ class VirtualOperations(object):
         if not self.configure_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_CONFIGURE)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -182,14 +200,17 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        snapshot = SnapshotDefinition.from_dict(
-            json.loads(request.snapshot.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        snapshot = _parameters._lazy(
+            SnapshotDefinition, request.snapshot.parameters.json)
 
-        config = self.configure_impl(virtual_source=virtual_source,
-                                     repository=repository,
-                                     snapshot=snapshot)
+        try:
+            config = self.configure_impl(virtual_source=virtual_source,
+                                         repository=repository,
+                                         snapshot=snapshot)
+        finally:
+            self.invalidate_status_cache(request.virtual_source.guid)
 
         # Validate that this is a SourceConfigDefinition object.
         if not isinstance(config, SourceConfigDefinition):
@@ -198,9 +219,10 @@ class VirtualOperations(object):
 
         configure_response = platform_pb2.ConfigureResponse()
         configure_response.return_value.source_config.parameters.json = (
-            json.dumps(config.to_dict()))
+            _json_codec._dumps(config.to_dict()))
         return configure_response
 
+    @operation_wrapper(Op.VIRTUAL_UNCONFIGURE)
     def _internal_unconfigure(self, request):
         """Unconfigure operation wrapper.
 
@@ -228,8 +250,8 @@ class VirtualOperations(object):
         if not self.unconfigure_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_UNCONFIGURE)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -241,20 +263,24 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
-        self.unconfigure_impl(repository=repository,
-                              source_config=source_config,
-                              virtual_source=virtual_source)
+        try:
+            self.unconfigure_impl(repository=repository,
+                                  source_config=source_config,
+                                  virtual_source=virtual_source)
+        finally:
+            self.invalidate_status_cache(request.virtual_source.guid)
 
         unconfigure_response = platform_pb2.UnconfigureResponse()
         unconfigure_response.return_value.CopyFrom(
             platform_pb2.UnconfigureResult())
         return unconfigure_response
 
+    @operation_wrapper(Op.VIRTUAL_RECONFIGURE)
     def _internal_reconfigure(self, request):
         """Reconfigure operation wrapper.
 
@@ -277,8 +303,8 @@ class VirtualOperations(object):
         if not self.reconfigure_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_RECONFIGURE)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -289,17 +315,20 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        snapshot = SnapshotDefinition.from_dict(
-            json.loads(request.snapshot.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
+        snapshot = _parameters._lazy(
+            SnapshotDefinition, request.snapshot.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
 
-        config = self.reconfigure_impl(snapshot=snapshot,
-                                       repository=repository,
-                                       source_config=source_config,
-                                       virtual_source=virtual_source)
+        try:
+            config = self.reconfigure_impl(snapshot=snapshot,
+                                           repository=repository,
+                                           source_config=source_config,
+                                           virtual_source=virtual_source)
+        finally:
+            self.invalidate_status_cache(request.virtual_source.guid)
 
         # Validate that this is a SourceConfigDefinition object.
         if not isinstance(config, SourceConfigDefinition):
@@ -309,9 +338,10 @@ class VirtualOperations(object):
 
         reconfigure_response = platform_pb2.ReconfigureResponse()
         reconfigure_response.return_value.source_config.parameters.json = (
-            json.dumps(config.to_dict()))
+            _json_codec._dumps(config.to_dict()))
         return reconfigure_response
 
+    @operation_wrapper(Op.VIRTUAL_START)
     def _internal_start(self, request):
         """Start operation wrapper.
 
@@ -337,8 +367,8 @@ class VirtualOperations(object):
         if not self.start_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_START)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -349,19 +379,23 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
-        self.start_impl(repository=repository,
-                        source_config=source_config,
-                        virtual_source=virtual_source)
+        try:
+            self.start_impl(repository=repository,
+                            source_config=source_config,
+                            virtual_source=virtual_source)
+        finally:
+            self.invalidate_status_cache(request.virtual_source.guid)
 
         start_response = platform_pb2.StartResponse()
         start_response.return_value.CopyFrom(platform_pb2.StartResult())
         return start_response
 
+    @operation_wrapper(Op.VIRTUAL_STOP)
     def _internal_stop(self, request):
         """Stop operation wrapper.
 
@@ -386,8 +420,8 @@ class VirtualOperations(object):
         if not self.stop_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_STOP)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -398,19 +432,23 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
-        self.stop_impl(repository=repository,
-                       source_config=source_config,
-                       virtual_source=virtual_source)
+        try:
+            self.stop_impl(repository=repository,
+                           source_config=source_config,
+                           virtual_source=virtual_source)
+        finally:
+            self.invalidate_status_cache(request.virtual_source.guid)
 
         stop_response = platform_pb2.StopResponse()
         stop_response.return_value.CopyFrom(platform_pb2.StopResult())
         return stop_response
 
+    @operation_wrapper(Op.VIRTUAL_PRE_SNAPSHOT)
     def _internal_pre_snapshot(self, request):
         """Virtual pre snapshot operation wrapper.
 
@@ -440,8 +478,8 @@ class VirtualOperations(object):
         if not self.pre_snapshot_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_PRE_SNAPSHOT)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -452,10 +490,10 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         self.pre_snapshot_impl(repository=repository,
                                source_config=source_config,
@@ -467,6 +505,7 @@ class VirtualOperations(object):
             platform_pb2.VirtualPreSnapshotResult())
         return virtual_pre_snapshot_response
 
+    @operation_wrapper(Op.VIRTUAL_POST_SNAPSHOT)
     def _internal_post_snapshot(self, request):
         """Virtual post snapshot operation wrapper.
 
@@ -492,7 +531,7 @@ class VirtualOperations(object):
 
         def to_protobuf(snapshot):
             parameters = common_pb2.PluginDefinedObject()
-            parameters.json = json.dumps(snapshot.to_dict())
+            parameters.json = _json_codec._dumps(snapshot.to_dict())
             snapshot_protobuf = common_pb2.Snapshot()
             snapshot_protobuf.parameters.CopyFrom(parameters)
             return snapshot_protobuf
@@ -500,8 +539,8 @@ class VirtualOperations(object):
         if not self.post_snapshot_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_POST_SNAPSHOT)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -512,10 +551,10 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         snapshot = self.post_snapshot_impl(repository=repository,
                                            source_config=source_config,
@@ -532,6 +571,7 @@ class VirtualOperations(object):
             to_protobuf(snapshot))
         return virtual_post_snapshot_response
 
+    @operation_wrapper(Op.VIRTUAL_STATUS)
     def _internal_status(self, request):
         """Virtual status operation wrapper.
 
@@ -559,8 +599,21 @@ class VirtualOperations(object):
         if not self.status_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_STATUS)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        status_cache = self.status_cache
+        if status_cache is not None:
+            guid = request.virtual_source.guid
+            key = status_cache.key(
+                request.virtual_source.parameters.json,
+                request.repository.parameters.json,
+                request.source_config.parameters.json)
+            cached_status, generation = status_cache.lookup(guid, key)
+            if cached_status is not None:
+                response = platform_pb2.VirtualStatusResponse()
+                response.return_value.status = cached_status.value
+                return response
+
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -571,10 +624,10 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         virtual_status = self.status_impl(repository=repository,
                                           source_config=source_config,
@@ -585,10 +638,14 @@ class VirtualOperations(object):
             raise IncorrectReturnTypeError(Op.VIRTUAL_STATUS,
                                            type(virtual_status), Status)
 
+        if status_cache is not None:
+            status_cache.store(guid, key, generation, virtual_status)
+
         virtual_status_response = platform_pb2.VirtualStatusResponse()
         virtual_status_response.return_value.status = virtual_status.value
         return virtual_status_response
 
+    @operation_wrapper(Op.VIRTUAL_INITIALIZE)
     def _internal_initialize(self, request):
         """Initialize operation wrapper.
 
@@ -612,8 +669,8 @@ class VirtualOperations(object):
         if not self.initialize_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_INITIALIZE)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -624,10 +681,10 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
-        source_config = SourceConfigDefinition.from_dict(
-            json.loads(request.source_config.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
+        source_config = _parameters._lazy(
+            SourceConfigDefinition, request.source_config.parameters.json)
 
         self.initialize_impl(repository=repository,
                              source_config=source_config,
@@ -637,6 +694,7 @@ class VirtualOperations(object):
             platform_pb2.InitializeResult())
         return initialize_response
 
+    @operation_wrapper(Op.VIRTUAL_MOUNT_SPEC)
     def _internal_mount_specification(self, request):
         """Virtual mount spec operation wrapper.
 
@@ -680,8 +738,8 @@ class VirtualOperations(object):
         if not self.mount_specification_impl:
             raise OperationNotDefinedError(Op.VIRTUAL_MOUNT_SPEC)
 
-        virtual_source_definition = VirtualSourceDefinition.from_dict(
-            json.loads(request.virtual_source.parameters.json))
+        virtual_source_definition = _parameters._lazy(
+            VirtualSourceDefinition, request.virtual_source.parameters.json)
         mounts = [
             VirtualOperations._from_protobuf_single_subset_mount(m)
             for m in request.virtual_source.mounts
@@ -692,8 +750,8 @@ class VirtualOperations(object):
                                        parameters=virtual_source_definition,
                                        mounts=mounts)
 
-        repository = RepositoryDefinition.from_dict(
-            json.loads(request.repository.parameters.json))
+        repository = _parameters._lazy(
+            RepositoryDefinition, request.repository.parameters.json)
 
         virtual_mount_spec = self.mount_specification_impl(
             repository=repository, virtual_source=virtual_source)
@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Microbenchmark for the cache of decoded parameters.
+
+Decodes parameters shaped like those of real plugins into classes shaped
+like the ones the SDK generates from plugin schemas, which validate every
+attribute they are given. It reports the time per call of a cache miss, of a
+cache hit, and of the ways a hit could otherwise hand out an object the
+plugin may change: a copy.deepcopy of the cached object, and from_dict of
+the cached result of parsing the JSON. A hit must be cheaper than a miss for
+the cache to be worth having. This is not collected by pytest; run it
+directly:
+
+    python benchmark_decode_cache.py [iterations]
+"""
+
+import copy
+import json
+import sys
+import timeit
+
+from dlpx.virtualization.platform import _json_codec, _parameters
+
+
+def _deserialize(data, klass):
+    if data is None:
+        return None
+    if klass in (int, float, bool, basestring, unicode):
+        return data
+    if klass is list:
+        return [_deserialize(item, type(item)) for item in data]
+    if klass is dict:
+        return {key: _deserialize(item, type(item))
+                for key, item in data.items()}
+    return klass.from_dict(data)
+
+
+class _Model(object):
+    """The parts of the generated classes that decoding goes through."""
+    swagger_types = {}
+    attribute_map = {}
+    fields = ()
+
+    def __init__(self, validate=True, **kwargs):
+        self.swagger_types = {name: kind for name, kind, _ in self.fields}
+        self.attribute_map = {name: key for name, _, key in self.fields}
+        for name, kind, _ in self.fields:
+            value = kwargs.get(name)
+            if validate:
+                self._check(name, value, kind)
+            setattr(self, '_' + name, value)
+
+    @staticmethod
+    def _check(name, value, kind):
+        if value is not None and not isinstance(value, kind):
+            raise TypeError('{} must be a {}.'.format(name, kind.__name__))
+
+    def __setattr__(self, name, value):
+        kinds = self.__dict__.get('swagger_types', {})
+        if name in kinds:
+            self._check(name, value, kinds[name])
+            name = '_' + name
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_dict(cls, dikt):
+        instance = cls(validate=False)
+        for name, kind in instance.swagger_types.items():
+            key = instance.attribute_map[name]
+            if key in dikt:
+                setattr(instance, name, _deserialize(dikt[key], kind))
+        return instance
+
+
+class _SourceConfig(_Model):
+    fields = (('name', basestring, 'name'),
+              ('path', basestring, 'path'),
+              ('port', int, 'port'),
+              ('version', basestring, 'version'),
+              ('enabled', bool, 'enabled'),
+              ('init_parameters', dict, 'initParameters'))
+
+
+class _Datafile(_Model):
+    fields = (('name', basestring, 'name'),
+              ('size_bytes', int, 'sizeBytes'),
+              ('checksum', basestring, 'checksum'))
+
+
+class _Snapshot(_Model):
+    fields = (('timestamp', basestring, 'timestamp'),
+              ('scn', int, 'scn'),
+              ('source_config', _SourceConfig, 'sourceConfig'),
+              ('datafiles', list, 'datafiles'),
+              ('tablespaces', list, 'tablespaces'))
+
+
+def _source_config(index):
+    return {
+        'name': u'orders-{}'.format(index),
+        'path': u'/u01/app/oracle/oradata/orders{}'.format(index),
+        'port': 1521 + index,
+        'version': u'19.3.0.0.0',
+        'enabled': True,
+        'initParameters': {u'param{}'.format(i): u'value{}'.format(i)
+                           for i in range(20)},
+    }
+
+
+def _snapshot(index):
+    return {
+        'timestamp': u'2020-06-0{}T12:00:00.000Z'.format(index % 9 + 1),
+        'scn': 123456789012345 + index,
+        'sourceConfig': _source_config(index),
+        'datafiles': [{'name': u'datafile{}.dbf'.format(i),
+                       'sizeBytes': 104857600 * i,
+                       'checksum': u'{:040x}'.format(i * 7919)}
+                      for i in range(50)],
+        'tablespaces': [u'SYSTEM', u'SYSAUX', u'UNDOTBS1', u'USERS'],
+    }
+
+
+_PAYLOADS = [
+    ('source config', _SourceConfig, _source_config(1)),
+    ('snapshot', _Snapshot, _snapshot(1)),
+]
+
+
+def _per_call(function, iterations):
+    return timeit.timeit(function, number=iterations) / iterations
+
+
+def main(iterations):
+    print('{:<15} {:>10} {:>10} {:>15} {:>15}'.format(
+        'payload', 'miss (us)', 'hit (us)', 'deepcopy (us)',
+        'from_dict (us)'))
+    for payload_name, definition_class, payload in _PAYLOADS:
+        parameters_json = json.dumps(payload)
+        cache = _parameters._DecodeCache(0)
+        miss = _per_call(
+            lambda: cache.decode(definition_class, parameters_json),
+            iterations)
+
+        cache = _parameters._DecodeCache(1)
+        cache.decode(definition_class, parameters_json)
+        hit = _per_call(
+            lambda: cache.decode(definition_class, parameters_json),
+            iterations)
+
+        decoded = definition_class.from_dict(
+            _json_codec._loads(parameters_json))
+        deepcopy = _per_call(lambda: copy.deepcopy(decoded), iterations)
+
+        parsed = _json_codec._loads(parameters_json)
+        from_dict = _per_call(lambda: definition_class.from_dict(parsed),
+                              iterations)
+
+        print('{:<15} {:>10.1f} {:>10.1f} {:>15.1f} {:>15.1f}'.format(
+            payload_name, miss * 1e6, hit * 1e6, deepcopy * 1e6,
+            from_dict * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,95 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Microbenchmark for the JSON codecs of the operation wrappers.
+
+Decodes and encodes parameters shaped like those of real plugins with every
+installed codec, and with json.dumps with its default separators (what the
+wrappers used before they had a codec). It reports the time per call, the
+size of the encoded JSON and whether the codec is compatible with the json
+module, i.e. whether it could be picked by default. This is not collected by
+pytest; run it directly:
+
+    python benchmark_json_codec.py [iterations]
+"""
+
+import json
+import sys
+import timeit
+
+from dlpx.virtualization.platform import _json_codec
+
+
+def _source_config(index):
+    return {
+        'name': u'orders-{}'.format(index),
+        'path': u'/u01/app/oracle/oradata/orders{}'.format(index),
+        'port': 1521 + index,
+        'version': u'19.3.0.0.0',
+        'enabled': True,
+        'archiveLogMode': index % 2 == 0,
+        'owner': None,
+        'description': u'Bestellungen f\xfcr Kunden \u65e5\u672c',
+        'initParameters': {u'param{}'.format(i): u'value{}'.format(i)
+                           for i in range(20)},
+    }
+
+
+def _snapshot(index):
+    return {
+        'timestamp': u'2020-06-0{}T12:00:00.000Z'.format(index % 9 + 1),
+        'scn': 123456789012345 + index,
+        'sizeBytes': 1073741824 * (index + 1),
+        'compressionRatio': 2.718281828459045,
+        'datafiles': [{'name': u'datafile{}.dbf'.format(i),
+                       'sizeBytes': 104857600 * i,
+                       'checksum': u'{:040x}'.format(i * 7919)}
+                      for i in range(50)],
+        'tablespaces': [u'SYSTEM', u'SYSAUX', u'UNDOTBS1', u'USERS'],
+    }
+
+
+_PAYLOADS = [
+    ('source config', _source_config(1)),
+    ('snapshot', _snapshot(1)),
+    ('upgrade batch', {u'SOURCE_CONFIG-{}'.format(i): _source_config(i)
+                       for i in range(200)}),
+]
+
+
+def _codecs():
+    codecs = [_json_codec.JsonCodec('json (default separators)', json.loads,
+                                    json.dumps)]
+    for name, factory in _json_codec._factories:
+        try:
+            codecs.append(factory())
+        except ImportError:
+            pass
+    return codecs
+
+
+def _measure(codec, payload, iterations):
+    encoded = codec.dumps(payload)
+    loads = timeit.timeit(lambda: codec.loads(encoded), number=iterations)
+    dumps = timeit.timeit(lambda: codec.dumps(payload), number=iterations)
+    return loads / iterations, dumps / iterations, len(encoded)
+
+
+def main(iterations):
+    print('{:<15} {:<27} {:>11} {:>11} {:>9} {:>10}'.format(
+        'payload', 'codec', 'loads (us)', 'dumps (us)', 'bytes',
+        'compatible'))
+    for payload_name, payload in _PAYLOADS:
+        count = max(1, iterations // (200 if payload_name == 'upgrade batch'
+                                      else 1))
+        for codec in _codecs():
+            loads, dumps, size = _measure(codec, payload, count)
+            print('{:<15} {:<27} {:>11.1f} {:>11.1f} {:>9} {:>10}'.format(
+                payload_name, codec.name, loads * 1e6, dumps * 1e6, size,
+                'yes' if _json_codec._compatible(codec) else 'no'))
+    print('picked by default: {}'.format(_json_codec.json_codec().name))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
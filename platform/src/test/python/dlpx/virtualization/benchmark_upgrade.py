@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+"""Benchmark of the upgrade migrations of many objects.
+
+Upgrades snapshots shaped like those of real plugins with migrations that
+rename, add and rewrite fields the way real migrations do. It reports the
+time of an upgrade request whose snapshots all have distinct metadata, of
+one whose snapshots share a few distinct metadata, as the snapshots of one
+source often do, and of migrating the distinct metadata alone, one at a
+time and on a pool of threads. The migrations are Python code that holds
+the GIL, so the threads do not make the upgrade faster, which is why
+objects are migrated one at a time. This is not collected by pytest; run
+it directly:
+
+    python benchmark_upgrade.py [objects] [distinct] [threads]
+"""
+
+import json
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from dlpx.virtualization.api import platform_pb2
+from dlpx.virtualization.platform import Plugin
+
+
+def _snapshot(index):
+    return {
+        'timestamp': '2020-06-0{}T12:00:00.000Z'.format(index % 9 + 1),
+        'scn': 123456789012345 + index,
+        'datafiles': [{'name': 'datafile{}.dbf'.format(i),
+                       'sizeBytes': 104857600 * i,
+                       'checksum': '{:040x}'.format(i * 7919)}
+                      for i in range(50)],
+        'tablespaces': ['SYSTEM', 'SYSAUX', 'UNDOTBS1', 'USERS'],
+    }
+
+
+def _rename_fields(snapshot):
+    snapshot['snapshotTime'] = snapshot.pop('timestamp')
+    for datafile in snapshot['datafiles']:
+        datafile['size'] = datafile.pop('sizeBytes')
+    return snapshot
+
+
+def _add_defaults(snapshot):
+    snapshot.setdefault('compressed', False)
+    for datafile in snapshot['datafiles']:
+        datafile.setdefault('encrypted', False)
+        datafile['checksum'] = 'sha1:' + datafile['checksum']
+    return snapshot
+
+
+def _plugin():
+    plugin = Plugin()
+    plugin.upgrade.snapshot('2020.1.1')(_rename_fields)
+    plugin.upgrade.snapshot('2020.1.2')(_add_defaults)
+    return plugin
+
+
+def _request(objects, distinct):
+    return platform_pb2.UpgradeRequest(
+        pre_upgrade_parameters={
+            'APPDATA_SNAPSHOT-{}'.format(i): json.dumps(
+                _snapshot(i % distinct))
+            for i in range(objects)
+        },
+        type=platform_pb2.UpgradeRequest.SNAPSHOT,
+        migration_ids=['2020.1.1', '2020.1.2'])
+
+
+def _elapsed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main(objects, distinct, threads):
+    upgrade = _plugin().upgrade
+    all_distinct = _request(objects, objects)
+    shared = _request(objects, distinct)
+    impls_list = upgrade.platform_migrations.get_snapshot_impls_to_exec(
+        all_distinct.migration_ids)
+    metadata = all_distinct.pre_upgrade_parameters.values()
+    pool = ThreadPool(threads)
+
+    def migrate(metadata):
+        return upgrade._migrate(metadata, impls_list)
+
+    results = [
+        ('distinct', _elapsed(
+            lambda: upgrade._internal_snapshot(all_distinct))),
+        ('shared', _elapsed(lambda: upgrade._internal_snapshot(shared))),
+        ('serial', _elapsed(lambda: map(migrate, metadata))),
+        ('threads', _elapsed(lambda: pool.map(migrate, metadata))),
+    ]
+    pool.close()
+
+    print('{} objects, {} distinct metadata when shared, {} threads'.format(
+        objects, distinct, threads))
+    print('{:<10} {:>10} {:>15}'.format(
+        'upgrade', 'total (s)', 'per object (us)'))
+    for name, elapsed in results:
+        print('{:<10} {:>10.3f} {:>15.1f}'.format(
+            name, elapsed, elapsed / objects * 1e6))
+
+
+if __name__ == '__main__':
+    arguments = [int(arg) for arg in sys.argv[1:4]]
+    main(*arguments + [2000, 20, 8][len(arguments):])
@@ -0,0 +1,95 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import json
+
+import pytest
+from dlpx.virtualization import platform
+from dlpx.virtualization.platform import _json_codec
+
+
+class TestJsonCodec:
+    @staticmethod
+    @pytest.fixture(autouse=True)
+    def restore_codecs():
+        factories = list(_json_codec._factories)
+        yield
+        _json_codec._factories[:] = factories
+        platform.set_json_codec()
+
+    @staticmethod
+    def _rounding_loads(parameters_json):
+        def round_floats(value):
+            if isinstance(value, float):
+                return round(value, 6)
+            return value
+        return json.loads(parameters_json, object_hook=lambda obj: {
+            key: round_floats(value) for key, value in obj.items()})
+
+    @staticmethod
+    def test_default_codec_is_compatible():
+        codec = platform.json_codec()
+
+        assert codec.name in ('ujson', 'simplejson', 'json')
+        assert _json_codec._compatible(codec)
+
+    @staticmethod
+    def test_dumps_compact():
+        assert _json_codec._dumps({'name': 'db', 'ports': [1, 2]}) in (
+            '{"name":"db","ports":[1,2]}', '{"ports":[1,2],"name":"db"}')
+
+    @staticmethod
+    def test_loads_unicode():
+        decoded = _json_codec._loads('{"name": "db"}')
+
+        assert decoded == {u'name': u'db'}
+        assert all(isinstance(value, unicode) for value in decoded.values())
+
+    @staticmethod
+    def test_compatible_codec_picked_first():
+        platform.register_json_codec('custom', json.loads,
+                                     lambda obj: json.dumps(
+                                         obj, separators=(',', ':')))
+        platform.set_json_codec()
+
+        assert platform.json_codec().name == 'custom'
+
+    @staticmethod
+    def test_incompatible_codec_skipped():
+        platform.register_json_codec('rounding',
+                                     TestJsonCodec._rounding_loads,
+                                     json.dumps)
+        platform.set_json_codec()
+
+        assert platform.json_codec().name != 'rounding'
+
+    @staticmethod
+    def test_byte_string_codec_skipped():
+        def loads(parameters_json):
+            decoded = json.loads(parameters_json)
+            if isinstance(decoded, dict):
+                return {key.encode('utf-8'): value
+                        for key, value in decoded.items()}
+            return decoded
+
+        codec = platform.JsonCodec(
+            'bytes', loads, lambda obj: json.dumps(obj, separators=(',', ':')))
+
+        assert not _json_codec._compatible(codec)
+
+    @staticmethod
+    def test_codec_picked_by_name():
+        platform.register_json_codec('rounding',
+                                     TestJsonCodec._rounding_loads,
+                                     json.dumps)
+        platform.set_json_codec('rounding')
+
+        assert platform.json_codec().name == 'rounding'
+        assert _json_codec._loads('{"ratio": 0.1234567}') == {
+            'ratio': 0.123457}
+
+    @staticmethod
+    def test_unknown_codec():
+        with pytest.raises(ValueError):
+            platform.set_json_codec('unknown')
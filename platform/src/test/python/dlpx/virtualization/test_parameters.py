@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2020 by Delphix. All rights reserved.
+#
+
+import json
+
+import pytest
+from dlpx.virtualization import platform
+from dlpx.virtualization.platform import _parameters
+from mock import patch
+
+from fake_generated_definitions import (RepositoryDefinition,
+                                        SourceConfigDefinition)
+
+
+class TestParameters:
+    @staticmethod
+    @pytest.fixture(autouse=True)
+    def decode_cache():
+        platform.clear_decode_cache()
+        yield
+        platform.set_decode_cache_size(_parameters._DEFAULT_SIZE)
+        platform.clear_decode_cache()
+
+    @staticmethod
+    def _json(name):
+        return json.dumps({'name': name})
+
+    @staticmethod
+    def test_decode_hit():
+        parameters = TestParameters._json('repository')
+        with patch.object(RepositoryDefinition, 'from_dict',
+                          wraps=RepositoryDefinition.from_dict) as from_dict:
+            first = _parameters._decode(RepositoryDefinition, parameters)
+            second = _parameters._decode(RepositoryDefinition, parameters)
+
+        assert from_dict.call_count == 1
+        assert isinstance(second, RepositoryDefinition)
+        assert second.name == 'repository'
+        assert second is not first
+
+        stats = platform.decode_cache_stats()
+        assert (stats.hits, stats.misses, stats.size) == (1, 1, 1)
+        assert stats.hit_rate == 0.5
+
+    @staticmethod
+    def test_decode_keyed_on_class():
+        parameters = TestParameters._json('name')
+        repository = _parameters._decode(RepositoryDefinition, parameters)
+        source_config = _parameters._decode(SourceConfigDefinition,
+                                            parameters)
+
+        assert isinstance(repository, RepositoryDefinition)
+        assert isinstance(source_config, SourceConfigDefinition)
+        assert platform.decode_cache_stats().misses == 2
+
+    @staticmethod
+    def test_decode_returns_copies():
+        parameters = TestParameters._json('repository')
+        first = _parameters._decode(RepositoryDefinition, parameters)
+        first._name = 'changed'
+
+        assert _parameters._decode(RepositoryDefinition,
+                                   parameters).name == 'repository'
+
+    @staticmethod
+    def test_copy():
+        nested = RepositoryDefinition([u'item'])
+        value = RepositoryDefinition({u'list': [1, {u'key': u'value'}],
+                                      u'nested': nested,
+                                      u'other': set([1])})
+
+        copied = _parameters._copy(value)
+
+        assert type(copied) is RepositoryDefinition
+        assert copied.name[u'list'] == [1, {u'key': u'value'}]
+        assert copied.name is not value.name
+        assert copied.name[u'list'][1] is not value.name[u'list'][1]
+        assert copied.name[u'nested'].name == [u'item']
+        assert copied.name[u'nested'].name is not nested.name
+        assert copied.name[u'other'] is not value.name[u'other']
+        assert copied.swagger_types is value.swagger_types
+
+    @staticmethod
+    def test_decode_evicts_least_recently_used():
+        platform.set_decode_cache_size(2)
+        for name in ('a', 'b', 'a', 'c', 'a'):
+            _parameters._decode(RepositoryDefinition,
+                                TestParameters._json(name))
+
+        stats = platform.decode_cache_stats()
+        assert (stats.hits, stats.misses, stats.evictions, stats.size) == (
+            2, 3, 1, 2)
+        assert stats.max_size == 2
+
+    @staticmethod
+    def test_decode_cache_disabled():
+        platform.set_decode_cache_size(0)
+        parameters = TestParameters._json('repository')
+        _parameters._decode(RepositoryDefinition, parameters)
+        _parameters._decode(RepositoryDefinition, parameters)
+
+        stats = platform.decode_cache_stats()
+        assert (stats.hits, stats.misses, stats.size) == (0, 2, 0)
+
+    @staticmethod
+    def test_decode_error_not_cached():
+        with pytest.raises(KeyError):
+            _parameters._decode(RepositoryDefinition, '{}')
+
+        assert platform.decode_cache_stats().size == 0
+
+    @staticmethod
+    def test_no_lookups_hit_rate():
+        assert platform.decode_cache_stats().hit_rate is None
+
+    @staticmethod
+    @pytest.mark.parametrize('max_size', [-1, 1.5, True])
+    def test_bad_cache_size(max_size):
+        with pytest.raises(ValueError):
+            platform.set_decode_cache_size(max_size)
+
+    @staticmethod
+    def test_lazy_not_copied_until_used():
+        parameters = TestParameters._json('repository')
+        _parameters._decode(RepositoryDefinition, parameters)
+        lazy = _parameters._lazy(RepositoryDefinition, parameters)
+
+        assert isinstance(lazy, RepositoryDefinition)
+        assert type(lazy) is not RepositoryDefinition
+        assert platform.decode_cache_stats().hits == 0
+
+        assert lazy.name == 'repository'
+        assert type(lazy) is RepositoryDefinition
+        assert platform.decode_cache_stats().hits == 1
+
+    @staticmethod
+    def test_lazy_decoded_right_away_if_not_cached():
+        lazy = _parameters._lazy(RepositoryDefinition,
+                                 TestParameters._json('repository'))
+
+        assert type(lazy) is RepositoryDefinition
+        assert lazy.name == 'repository'
+        assert platform.decode_cache_stats().misses == 1
+
+    @staticmethod
+    def test_lazy_set_before_read():
+        parameters = TestParameters._json('repository')
+        _parameters._decode(RepositoryDefinition, parameters)
+        lazy = _parameters._lazy(RepositoryDefinition, parameters)
+        lazy._name = 'changed'
+
+        assert lazy.name == 'changed'
+
+    @staticmethod
+    def test_lazy_serialized():
+        parameters = TestParameters._json('repository')
+        _parameters._decode(RepositoryDefinition, parameters)
+        lazy = _parameters._lazy(RepositoryDefinition, parameters)
+
+        assert lazy.to_dict() == {'name': 'repository'}
+
+    @staticmethod
+    def test_lazy_error_raised_up_front():
+        with pytest.raises(KeyError):
+            _parameters._lazy(RepositoryDefinition, '{}')
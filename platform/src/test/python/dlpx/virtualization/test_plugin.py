@@ -38,8 +38,11 @@ TEST_DIRECT_SOURCE = 'TestDirectSource'
 TEST_STAGED_SOURCE = 'TestStagedSource'
 TEST_VIRTUAL_SOURCE = 'TestVirtualSource'
 
-# This is a simple JSON object that has only "name" property defined.
-SIMPLE_JSON = '{{"name": "{0}"}}'
+#
+# This is a simple JSON object that has only "name" property defined, in the
+# compact form the wrappers write JSON in.
+#
+SIMPLE_JSON = '{{"name":"{0}"}}'
 
 TEST_REPOSITORY_JSON = SIMPLE_JSON.format(TEST_REPOSITORY)
 TEST_SNAPSHOT_JSON = SIMPLE_JSON.format(TEST_SNAPSHOT)
@@ -682,6 +685,136 @@ class TestPlugin:
 
         assert virtual_status_response.return_value.status == expected_status
 
+    @staticmethod
+    def test_virtual_status_unused_parameters_not_copied(
+            my_plugin, virtual_source, repository, source_config):
+
+        from dlpx.virtualization.platform import (Status, clear_decode_cache,
+                                                  decode_cache_stats)
+
+        @my_plugin.virtual.status()
+        def virtual_status_impl(virtual_source, repository, source_config):
+            assert isinstance(repository, RepositoryDefinition)
+            assert isinstance(source_config, SourceConfigDefinition)
+            return Status.ACTIVE
+
+        virtual_status_request = platform_pb2.VirtualStatusRequest()
+        TestPlugin.setup_request(request=virtual_status_request,
+                                 virtual_source=virtual_source,
+                                 repository=repository,
+                                 source_config=source_config)
+
+        clear_decode_cache()
+        my_plugin.virtual._internal_status(virtual_status_request)
+        my_plugin.virtual._internal_status(virtual_status_request)
+
+        # The first call decodes the parameters, the second one only hands
+        # out the cached ones the plugin uses.
+        stats = decode_cache_stats()
+        assert (stats.misses, stats.hits) == (3, 0)
+
+    @staticmethod
+    def test_virtual_status_cached(my_plugin, virtual_source, repository,
+                                   source_config):
+
+        from dlpx.virtualization.platform import Status
+
+        statuses = [Status.ACTIVE, Status.INACTIVE, Status.ACTIVE]
+
+        @my_plugin.virtual.status(cache_ttl=30)
+        def virtual_status_impl(virtual_source, repository, source_config):
+            return statuses.pop(0)
+
+        @my_plugin.virtual.stop()
+        def stop_impl(virtual_source, repository, source_config):
+            return
+
+        request = platform_pb2.VirtualStatusRequest()
+        TestPlugin.setup_request(request=request,
+                                 virtual_source=virtual_source,
+                                 repository=repository,
+                                 source_config=source_config)
+        stop_request = platform_pb2.StopRequest()
+        TestPlugin.setup_request(request=stop_request,
+                                 virtual_source=virtual_source,
+                                 repository=repository,
+                                 source_config=source_config)
+        active = platform_pb2.VirtualStatusResult().ACTIVE
+        inactive = platform_pb2.VirtualStatusResult().INACTIVE
+
+        def status():
+            return my_plugin.virtual._internal_status(
+                request).return_value.status
+
+        assert status() == active
+        assert status() == active
+
+        my_plugin.virtual._internal_stop(stop_request)
+        assert status() == inactive
+
+        request.repository.parameters.json = json.dumps(
+            {'name': 'OtherRepository'})
+        assert status() == active
+        assert statuses == []
+
+    @staticmethod
+    def test_virtual_status_cache_expires(my_plugin, virtual_source,
+                                          repository, source_config):
+
+        from dlpx.virtualization.platform import Status
+
+        calls = []
+
+        @my_plugin.virtual.status(cache_ttl=30)
+        def virtual_status_impl(virtual_source, repository, source_config):
+            calls.append(virtual_source.guid)
+            return Status.ACTIVE
+
+        request = platform_pb2.VirtualStatusRequest()
+        TestPlugin.setup_request(request=request,
+                                 virtual_source=virtual_source,
+                                 repository=repository,
+                                 source_config=source_config)
+
+        with patch('dlpx.virtualization.platform._status_cache.time') as clock:
+            clock.time.return_value = 1000
+            my_plugin.virtual._internal_status(request)
+            clock.time.return_value = 1029
+            my_plugin.virtual._internal_status(request)
+            clock.time.return_value = 1030
+            my_plugin.virtual._internal_status(request)
+
+        assert calls == [TEST_GUID, TEST_GUID]
+
+    @staticmethod
+    def test_virtual_status_not_cached_by_default(my_plugin, virtual_source,
+                                                  repository, source_config):
+
+        from dlpx.virtualization.platform import Status
+
+        calls = []
+
+        @my_plugin.virtual.status()
+        def virtual_status_impl(virtual_source, repository, source_config):
+            calls.append(virtual_source.guid)
+            return Status.ACTIVE
+
+        request = platform_pb2.VirtualStatusRequest()
+        TestPlugin.setup_request(request=request,
+                                 virtual_source=virtual_source,
+                                 repository=repository,
+                                 source_config=source_config)
+
+        my_plugin.virtual._internal_status(request)
+        my_plugin.virtual._internal_status(request)
+
+        assert len(calls) == 2
+
+    @staticmethod
+    def test_virtual_status_bad_cache_ttl(my_plugin):
+        with pytest.raises(ValueError):
+            my_plugin.virtual.status(cache_ttl=0)
+
     @staticmethod
     def test_virtual_initialize(my_plugin, virtual_source, repository,
                                 source_config):
@@ -988,6 +1121,50 @@ class TestPlugin:
 
         assert staged_status_response.return_value.status == expected_status
 
+    @staticmethod
+    def test_staged_status_cached(my_plugin, staged_source, repository,
+                                  source_config):
+
+        from dlpx.virtualization.platform import Status
+
+        statuses = [Status.INACTIVE, Status.ACTIVE]
+
+        @my_plugin.linked.status(cache_ttl=30)
+        def staged_status_impl(staged_source, repository, source_config):
+            return statuses.pop(0)
+
+        @my_plugin.linked.start_staging()
+        def start_staging_impl(staged_source, repository, source_config):
+            return
+
+        request = platform_pb2.StagedStatusRequest()
+        TestPlugin.setup_request(request=request,
+                                 staged_source=staged_source,
+                                 repository=repository,
+                                 source_config=source_config)
+        start_request = platform_pb2.StartStagingRequest()
+        TestPlugin.setup_request(request=start_request,
+                                 staged_source=staged_source,
+                                 repository=repository,
+                                 source_config=source_config)
+        active = platform_pb2.StagedStatusResult().ACTIVE
+        inactive = platform_pb2.StagedStatusResult().INACTIVE
+
+        def status():
+            return my_plugin.linked._internal_status(
+                request).return_value.status
+
+        assert status() == inactive
+        assert status() == inactive
+
+        my_plugin.linked._internal_start_staging(start_request)
+        assert status() == active
+        assert status() == active
+
+        my_plugin.linked.invalidate_status_cache()
+        with pytest.raises(IndexError):
+            status()
+
     @staticmethod
     def test_staged_worker(my_plugin, staged_source, repository,
                            source_config):
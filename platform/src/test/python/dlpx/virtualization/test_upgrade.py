@@ -8,10 +8,11 @@ import logging
 
 import pytest
 from dlpx.virtualization.api import platform_pb2
-from dlpx.virtualization.platform import MigrationType
+from dlpx.virtualization.platform import MigrationType, _json_codec
 from dlpx.virtualization.platform.exceptions import (
     DecoratorNotFunctionError, MigrationIdAlreadyUsedError)
 from dlpx.virtualization.platform.operation import Operation as Op
+from mock import patch
 
 
 class TestUpgrade:
@@ -338,3 +339,52 @@ class TestUpgrade:
         assert (upgrade_response.return_value.post_upgrade_parameters ==
                 fake_map_param)
         assert (caplog.records[0].message == expected_logs)
+
+    @staticmethod
+    def test_upgrade_identical_metadata_migrated_once(my_upgrade):
+        calls = []
+
+        @my_upgrade.snapshot('2020.1.1')
+        def snap_upgrade(input_dict):
+            calls.append(input_dict)
+            return dict(input_dict, migrated=True)
+
+        request = platform_pb2.UpgradeRequest(
+            pre_upgrade_parameters={
+                'APPDATA_SNAPSHOT-1': '{"name": "a"}',
+                'APPDATA_SNAPSHOT-2': '{"name": "b"}',
+                'APPDATA_SNAPSHOT-3': '{"name": "a"}',
+                'APPDATA_SNAPSHOT-4': '{"name": "a"}'
+            },
+            type=platform_pb2.UpgradeRequest.SNAPSHOT,
+            migration_ids=['2020.1.1'])
+
+        response = my_upgrade._internal_snapshot(request)
+
+        upgraded = response.return_value.post_upgrade_parameters
+        assert sorted(calls) == [{'name': 'a'}, {'name': 'b'}]
+        assert {
+            object_ref: json.loads(metadata)
+            for object_ref, metadata in upgraded.items()
+        } == {
+            'APPDATA_SNAPSHOT-1': {'name': 'a', 'migrated': True},
+            'APPDATA_SNAPSHOT-2': {'name': 'b', 'migrated': True},
+            'APPDATA_SNAPSHOT-3': {'name': 'a', 'migrated': True},
+            'APPDATA_SNAPSHOT-4': {'name': 'a', 'migrated': True}
+        }
+
+    @staticmethod
+    def test_upgrade_no_migrations_not_decoded(my_upgrade):
+        request = platform_pb2.UpgradeRequest(
+            pre_upgrade_parameters={
+                'APPDATA_REPOSITORY-1': '{ "name" : "repo" }'
+            },
+            type=platform_pb2.UpgradeRequest.REPOSITORY,
+            migration_ids=['2020.1.1'])
+
+        with patch.object(_json_codec, '_loads') as loads:
+            response = my_upgrade._internal_repository(request)
+
+        assert not loads.called
+        assert (response.return_value.post_upgrade_parameters ==
+                request.pre_upgrade_parameters)